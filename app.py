@@ -3,17 +3,23 @@ GitHub Action Executor - Main application entry point
 Web interface for triggering GitHub Actions workflows with collaborator verification
 """
 import os
+import asyncio
 import logging
-from fastapi import FastAPI, Request, Query
-from fastapi.responses import HTMLResponse, RedirectResponse
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, Query, HTTPException
+from fastapi.responses import HTMLResponse, RedirectResponse, PlainTextResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from starlette.middleware.sessions import SessionMiddleware
-from starlette.middleware.base import BaseHTTPMiddleware
 from dotenv import load_dotenv
 import config
 
-from backend.routes import auth, workflow, api
+from backend.routes import auth, workflow, api, webhooks
+from backend.services.github_client import close_client
+from backend.services import db, dispatch_queue, history, team_rules, session_store, metrics, offload, loop_monitor
+from backend.services.session_store import ServerSessionMiddleware
+from backend.services.request_context import RequestLoggingMiddleware, instrument_templates
+from backend.services.outbound_limits import AdmissionMiddleware, OutboundSaturatedError
 
 # Load environment variables
 load_dotenv()
@@ -26,46 +32,132 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Application startup/shutdown"""
+    if config.LOOP_LAG_THRESHOLD_MS > 0:
+        await loop_monitor.start(config.LOOP_MONITOR_INTERVAL, config.LOOP_LAG_THRESHOLD_MS)
+    if config.ASYNC_DISPATCH:
+        await dispatch_queue.start_workers(config.DISPATCH_WORKERS)
+    if config.HISTORY_ENABLED and config.HISTORY_SYNC_INTERVAL > 0:
+        await history.start_sync(config.HISTORY_SYNC_INTERVAL)
+    if config.TEAM_RULES_FILE:
+        team_rules.load_rules(config.TEAM_RULES_FILE)
+        await team_rules.start_refresh(config.TEAM_ROSTER_REFRESH_INTERVAL)
+    yield
+    await team_rules.stop_refresh()
+    await history.stop_sync()
+    if config.ASYNC_DISPATCH:
+        await dispatch_queue.stop_workers()
+    # Close pooled connections to GitHub
+    await close_client()
+    db.close_all()
+    await loop_monitor.stop()
+    offload.shutdown()
+
+
 app = FastAPI(
     title="GitHub Action Executor",
     description="Web interface for triggering GitHub Actions workflows",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-# Add request logging middleware
-class LoggingMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        logger.info(f"Request: {request.method} {request.url.path} from {request.client.host if request.client else 'unknown'}")
-        try:
-            response = await call_next(request)
-            logger.info(f"Response: {request.method} {request.url.path} - Status: {response.status_code}")
-            return response
-        except Exception as e:
-            logger.error(f"Error processing {request.method} {request.url.path}: {str(e)}", exc_info=True)
-            raise
-
-app.add_middleware(LoggingMiddleware)
-
 # Add session middleware for OAuth
 secret_key = os.getenv("SECRET_KEY", "change-this-secret-key-in-production")
-app.add_middleware(
-    SessionMiddleware,
-    secret_key=secret_key,
-    max_age=86400,  # 24 hours
-    same_site="lax",
-    https_only=False  # nginx handles HTTPS
-)
+if config.SESSION_BACKEND == "cookie":
+    app.add_middleware(
+        SessionMiddleware,
+        secret_key=secret_key,
+        max_age=86400,  # 24 hours
+        same_site="lax",
+        https_only=False  # nginx handles HTTPS
+    )
+else:
+    # Сессия на сервере, в cookie только подписанный ID
+    app.add_middleware(
+        ServerSessionMiddleware,
+        secret_key=secret_key,
+        store=session_store.create_store(config.SESSION_BACKEND, config.SESSION_MAX_ENTRIES),
+        max_age=86400,  # 24 hours
+        same_site="lax",
+        https_only=False  # nginx handles HTTPS
+    )
+
+# Load shedding while the GitHub call queue is full
+app.add_middleware(AdmissionMiddleware)
+
+# Request logging and metrics (outermost: measures session handling and shed requests too)
+app.add_middleware(RequestLoggingMiddleware)
+
+
+@app.exception_handler(OutboundSaturatedError)
+async def outbound_saturated_handler(request: Request, exc: OutboundSaturatedError):
+    """No slot for a GitHub call: 429 or 503 with Retry-After"""
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
 
 # Mount static files
 app.mount("/static", StaticFiles(directory="frontend/static"), name="static")
 
 # Templates
 templates = Jinja2Templates(directory="frontend/templates")
+instrument_templates(templates)
 
 # Include routers
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
 app.include_router(workflow.router, prefix="/workflow", tags=["workflow"])
 app.include_router(api.router, prefix="/api", tags=["api"])
+app.include_router(webhooks.router, prefix="/webhooks", tags=["webhooks"])
+
+
+# Strong references to background cache-warming tasks (asyncio keeps only weak ones)
+_background_tasks = set()
+
+
+def _log_background_failure(task: asyncio.Task) -> None:
+    """Drop finished background task and log its failure, if any"""
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"Background workflows fetch failed: {str(task.exception())}")
+
+
+async def _load_workflows_within_budget(owner: str, repo: str):
+    """
+    Load workflows for the main page without exceeding INDEX_RENDER_BUDGET_MS
+    
+    Cached workflows are returned immediately. Otherwise GitHub is given the
+    render budget; if it doesn't answer in time the fetch keeps running in the
+    background to warm the cache and the page is rendered without workflows.
+    
+    Returns:
+        List of workflows, [] if loading failed, or None if still loading
+    """
+    from backend.services.workflows import get_workflows, get_cached_workflows
+    
+    cached = get_cached_workflows(owner, repo)
+    if cached is not None:
+        return cached
+    
+    task = asyncio.ensure_future(get_workflows(owner, repo))
+    budget = max(config.INDEX_RENDER_BUDGET_MS, 0) / 1000
+    done, _ = await asyncio.wait({task}, timeout=budget)
+    
+    if not done:
+        logger.info(f"Workflows for {owner}/{repo} not loaded within {config.INDEX_RENDER_BUDGET_MS} ms, rendering page without them")
+        _background_tasks.add(task)
+        task.add_done_callback(_log_background_failure)
+        return None
+    
+    try:
+        return task.result()
+    except Exception as e:
+        logger.warning(f"Failed to load workflows for main page: {str(e)}")
+        return []
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -95,20 +187,20 @@ async def root(
         if key not in excluded_params and value:
             workflow_inputs[key] = value
     
-    # Try to load workflows if owner and repo are provided
-    # Branches will be loaded lazily on the frontend after page load
+    # Try to load workflows if owner and repo are provided, within the render budget
+    # Everything else (branches, inputs, permissions) is loaded by the frontend via /api/bootstrap
     workflows_list = []
+    workflows_pending = False
     
     if default_owner and default_repo:
-        try:
-            from backend.services.workflows import get_workflows
-            workflows_list = await get_workflows(default_owner, default_repo)
-        except Exception as e:
-            logger.warning(f"Failed to load workflows for main page: {str(e)}")
-            workflows_list = []
+        workflows_list = await _load_workflows_within_budget(default_owner, default_repo)
+        workflows_pending = workflows_list is None
+        workflows_list = workflows_list or []
     
-    return templates.TemplateResponse(
-        "index.html",
+    # Страница большая: рендерим ее в пуле потоков, не блокируя event loop
+    content = await offload.run(
+        "template",
+        templates.get_template("index.html").render,
         {
             "request": request,
             "user": user,
@@ -119,9 +211,11 @@ async def root(
             "workflow_inputs": workflow_inputs,  # Параметры для предзаполнения workflow inputs
             "return_url": return_url,  # URL для возврата
             "workflows": workflows_list,
+            "workflows_pending": workflows_pending,
             "auto_open_run": config.AUTO_OPEN_RUN
         }
     )
+    return HTMLResponse(content)
 
 
 @app.get("/health")
@@ -130,6 +224,14 @@ async def health():
     return {"status": "ok"}
 
 
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Metrics in Prometheus text format (requests, GitHub calls, cache, rate limits)"""
+    if not config.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 if __name__ == "__main__":
     import uvicorn
     
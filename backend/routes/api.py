@@ -1,22 +1,45 @@
 """
 API routes for programmatic access
 """
+import json
+import asyncio
 import logging
 import httpx
 from fastapi import APIRouter, Request, HTTPException, Depends, Query
+from fastapi.responses import StreamingResponse, JSONResponse
 from pydantic import BaseModel
 from typing import Optional, List
 
-from backend.services.permissions import check_repository_access
-from backend.services.workflow import trigger_workflow, find_workflow_run
+from backend.services.permissions import can_trigger_with, get_permission_level, get_permission_levels, has_read_access
+from backend.services.workflow import find_workflow_run
 from backend.services.branches import get_branches
 from backend.services.workflows import get_workflows
+from backend.services.dispatch_validation import DispatchValidationError, validate_dispatch
+from backend.services.outbound_limits import OutboundSaturatedError
+from backend.services import (
+    run_tracker, run_follower, log_tail, dispatch_queue, dispatch_pacer, dispatcher, idempotency, history, team_rules
+)
 import config
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Maximum time a long-poll /api/find-run request may wait for the run (seconds)
+LONG_POLL_MAX_WAIT = 25
+
+# Interval between SSE keep-alive comments (seconds)
+SSE_KEEPALIVE_INTERVAL = 15
+
+# Maximum number of workflows dispatched by one /api/trigger/batch request
+BATCH_TRIGGER_MAX_ITEMS = 50
+
+# Maximum page size of /api/history
+HISTORY_MAX_PAGE_SIZE = 100
+
+# Maximum number of repositories checked by one /api/check-permissions/bulk request
+BULK_PERMISSIONS_MAX_REPOS = 200
+
 
 def get_user_from_session(request: Request):
     """Dependency to get authenticated user from session"""
@@ -38,57 +61,250 @@ class TriggerWorkflowRequest(BaseModel):
     tests: Optional[List[str]] = None
 
 
+class BatchTriggerItem(BaseModel):
+    workflow_id: str
+    ref: Optional[str] = "main"
+    inputs: Optional[dict] = {}
+    tests: Optional[List[str]] = None
+
+
+class BatchTriggerRequest(BaseModel):
+    owner: str
+    repo: str
+    items: List[BatchTriggerItem]
+
+
+class BulkPermissionsRequest(BaseModel):
+    repositories: List[str]
+
+
+async def _ensure_can_trigger(
+    owner: str,
+    repo: str,
+    username: str,
+    access_token: str,
+    user_id: Optional[int] = None
+) -> None:
+    """Raise 403 if permission check is enabled and the user is not a collaborator"""
+    denial = await dispatcher.check_trigger_access(owner, repo, username, access_token, user_id)
+    if denial is not None:
+        raise HTTPException(status_code=denial["status_code"], detail=denial["message"])
+
+
 @router.post("/trigger")
 async def api_trigger_workflow(
     request_data: TriggerWorkflowRequest,
     request: Request,
     user_data: tuple = Depends(get_user_from_session)
 ):
-    """API endpoint to trigger workflow"""
+    """
+    API endpoint to trigger workflow
+    
+    With ASYNC_DISPATCH enabled the dispatch is queued and 202 with the job ID is
+    returned right away; the job status is available at /api/dispatches/{job_id}.
+    
+    A repeated request with the same Idempotency-Key header (or idempotency_key
+    parameter), or an identical request within DUPLICATE_DISPATCH_WINDOW, returns
+    the original result with the Idempotent-Replayed header instead of dispatching again.
+    """
     user, access_token = user_data
     username = user["login"]
-    
-    # Check permissions if enabled in config
-    if config.CHECK_PERMISSIONS:
-        has_access = await check_repository_access(
-            request_data.owner,
-            request_data.repo,
-            access_token
-        )
-        
-        if not has_access:
-            raise HTTPException(
-                status_code=403,
-                detail=f"User {username} is not a collaborator of {request_data.owner}/{request_data.repo}. Only collaborators can trigger workflows."
-            )
+    idempotency_key = request.headers.get("Idempotency-Key") or request.query_params.get("idempotency_key")
     
     # Prepare inputs
-    inputs = request_data.inputs or {}
+    inputs = dict(request_data.inputs or {})
     if request_data.tests:
         inputs["tests"] = request_data.tests
     
-    # Use user token if config says so
-    user_token = None
-    if config.USE_USER_TOKEN_FOR_WORKFLOWS:
-        user_token = access_token
-    
-    # Trigger workflow
-    result = await trigger_workflow(
-        owner=request_data.owner,
-        repo=request_data.repo,
-        workflow_id=request_data.workflow_id,
-        inputs=inputs,
-        ref=request_data.ref,
-        user_token=user_token
-    )
+    # Ошибки в inputs и ветке отсекаем до проверки прав и обращений к GitHub
+    if config.VALIDATE_DISPATCH:
+        try:
+            inputs = await validate_dispatch(
+                request_data.owner, request_data.repo, request_data.workflow_id, request_data.ref, inputs
+            )
+        except DispatchValidationError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+    
+    # Правила команд проверяются по локальным снимкам составов, без обращений к GitHub
+    if not team_rules.is_allowed(username, request_data.owner, request_data.repo, request_data.workflow_id):
+        raise HTTPException(
+            status_code=403,
+            detail=team_rules.denial_message(username, request_data.owner, request_data.repo, request_data.workflow_id)
+        )
+    
+    async def dispatch() -> dict:
+        if config.ASYNC_DISPATCH:
+            # Права проверит worker перед запуском
+            job_id = await dispatch_queue.enqueue(
+                request_data.owner,
+                request_data.repo,
+                request_data.workflow_id,
+                request_data.ref,
+                inputs,
+                username,
+                access_token,
+                user.get("id")
+            )
+            return {
+                "job_id": job_id,
+                "status": "queued",
+                "status_url": f"/api/dispatches/{job_id}"
+            }
+        
+        # Interactive dispatches wait at most DISPATCH_MAX_WAIT for a pacing slot
+        return await dispatcher.dispatch_workflow(
+            request_data.owner,
+            request_data.repo,
+            request_data.workflow_id,
+            request_data.ref,
+            inputs,
+            username,
+            access_token,
+            user_id=user.get("id"),
+            max_wait=config.DISPATCH_MAX_WAIT
+        )
     
-    if not result["success"]:
+    try:
+        result, replayed = await idempotency.run_once(
+            username,
+            request_data.owner,
+            request_data.repo,
+            request_data.workflow_id,
+            request_data.ref,
+            inputs,
+            dispatch,
+            idempotency_key=idempotency_key
+        )
+    except idempotency.IdempotencyConflictError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    if not result.get("success", True):
         raise HTTPException(
             status_code=result["status_code"],
-            detail=result["message"]
+            detail=result["message"],
+            headers={"Retry-After": str(result["retry_after"])} if "retry_after" in result else None
         )
     
-    return result
+    return JSONResponse(
+        status_code=202 if "job_id" in result else 200,
+        content=result,
+        headers={"Idempotent-Replayed": "true"} if replayed else None
+    )
+
+
+@router.post("/trigger/batch")
+async def api_trigger_workflow_batch(
+    request_data: BatchTriggerRequest,
+    request: Request,
+    user_data: tuple = Depends(get_user_from_session)
+):
+    """
+    API endpoint to trigger several workflows (e.g. one workflow on many branches)
+    
+    Permission is checked once for the repository, workflows are dispatched
+    concurrently (at most BATCH_TRIGGER_CONCURRENCY at a time). Failure of one item
+    doesn't affect the others: each item gets its own result.
+    Items are paced as bulk dispatches: they give way to interactive triggers
+    and wait for a slot instead of failing on GitHub rate limits.
+    """
+    user, access_token = user_data
+    username = user["login"]
+    
+    if not request_data.items:
+        raise HTTPException(status_code=400, detail="items must not be empty")
+    if len(request_data.items) > BATCH_TRIGGER_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Too many items: {len(request_data.items)} (maximum {BATCH_TRIGGER_MAX_ITEMS})")
+    
+    # Check permissions once for the whole batch
+    await _ensure_can_trigger(request_data.owner, request_data.repo, username, access_token, user.get("id"))
+    
+    semaphore = asyncio.Semaphore(max(config.BATCH_TRIGGER_CONCURRENCY, 1))
+    
+    async def dispatch_item(index: int, item: BatchTriggerItem) -> dict:
+        item_result = {"index": index, "workflow_id": item.workflow_id, "ref": item.ref}
+        async with semaphore:
+            try:
+                inputs = dict(item.inputs or {})
+                if item.tests:
+                    inputs["tests"] = item.tests
+                if config.VALIDATE_DISPATCH:
+                    inputs = await validate_dispatch(request_data.owner, request_data.repo, item.workflow_id, item.ref, inputs)
+                # Bulk dispatches give way to interactive ones and wait for a slot as long as needed
+                result = await dispatcher.dispatch_workflow(
+                    request_data.owner, request_data.repo, item.workflow_id, item.ref,
+                    inputs, username, access_token,
+                    user_id=user.get("id"),
+                    priority=dispatch_pacer.BULK,
+                    check_access=False
+                )
+            except DispatchValidationError as e:
+                result = {"success": False, "status_code": 422, "message": str(e), "errors": e.errors}
+            except Exception as e:
+                logger.error(f"Batch item {index} ({item.workflow_id} on {item.ref}) failed: {str(e)}", exc_info=True)
+                result = {"success": False, **_describe_error(e)}
+        item_result.update(result)
+        return item_result
+    
+    results = await asyncio.gather(*[
+        dispatch_item(index, item) for index, item in enumerate(request_data.items)
+    ])
+    succeeded = sum(1 for result in results if result["success"])
+    logger.info(f"Batch trigger in {request_data.owner}/{request_data.repo} by {username}: {succeeded}/{len(results)} succeeded")
+    
+    return {
+        "owner": request_data.owner,
+        "repo": request_data.repo,
+        "total": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "results": results
+    }
+
+
+@router.get("/dispatches/{job_id}")
+async def api_get_dispatch(
+    job_id: str,
+    user_data: tuple = Depends(get_user_from_session)
+):
+    """
+    API endpoint to get status of a queued dispatch
+    
+    Status is one of queued, running, succeeded, failed. Queued jobs also have
+    queue_position and eta_seconds. For succeeded jobs `result` contains
+    trigger_time and trigger_id (for /api/find-run and /api/runs/events).
+    """
+    user, _ = user_data
+    job = await dispatch_queue.get_job(job_id)
+    if job is None or job["username"] != user["login"]:
+        raise HTTPException(status_code=404, detail="Dispatch not found")
+    return job
+
+
+@router.get("/history")
+async def api_get_history(
+    owner: Optional[str] = Query(None),
+    repo: Optional[str] = Query(None),
+    workflow_id: Optional[str] = Query(None),
+    limit: int = Query(20, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+    user_data: tuple = Depends(get_user_from_session)
+):
+    """
+    API endpoint to get workflows triggered by the current user, newest first
+    
+    Answered from the local history without calling GitHub. Pass next_cursor
+    of the response as cursor to get the next page (null on the last page).
+    """
+    if not config.HISTORY_ENABLED:
+        raise HTTPException(status_code=404, detail="History is disabled")
+    user, _ = user_data
+    try:
+        items, next_cursor = history.query(
+            user["login"], owner=owner, repo=repo, workflow_id=workflow_id, limit=limit, cursor=cursor
+        )
+    except history.InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": items, "next_cursor": next_cursor}
 
 
 @router.get("/branches")
@@ -122,6 +338,9 @@ async def api_get_branches(
         
         logger.error(f"GitHub API error getting branches for {owner}/{repo}: {status_code} - {error_message}")
         raise HTTPException(status_code=status_code, detail=error_message)
+    except OutboundSaturatedError:
+        # Ответ 429/503 с Retry-After (обработчик в app.py)
+        raise
     except Exception as e:
         logger.error(f"Unexpected error getting branches for {owner}/{repo}: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Failed to get branches: {str(e)}")
@@ -148,11 +367,27 @@ async def api_get_workflows(
         
         logger.error(f"GitHub API error getting workflows for {owner}/{repo}: {status_code} - {error_message}")
         raise HTTPException(status_code=status_code, detail=error_message)
+    except OutboundSaturatedError:
+        raise
     except Exception as e:
         logger.error(f"Unexpected error getting workflows for {owner}/{repo}: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Failed to get workflows: {str(e)}")
 
 
+def _workflow_info_response(workflow_info: dict) -> dict:
+    """Workflow info for the form; the run correlation input is filled in automatically, so it's hidden"""
+    inputs = {
+        name: input_config
+        for name, input_config in workflow_info.get("inputs", {}).items()
+        if name != config.RUN_CORRELATION_INPUT
+    }
+    return {
+        "found": workflow_info.get("found", False),
+        "inputs": inputs,
+        "has_workflow_dispatch": workflow_info.get("has_workflow_dispatch", False)
+    }
+
+
 @router.get("/workflow-info")
 async def api_get_workflow_info(
     owner: str = Query(...),
@@ -164,11 +399,7 @@ async def api_get_workflow_info(
     try:
         from backend.services.workflow_info import get_workflow_info
         workflow_info = await get_workflow_info(owner, repo, workflow_id)
-        return {
-            "found": workflow_info.get("found", False),
-            "inputs": workflow_info.get("inputs", {}),
-            "has_workflow_dispatch": workflow_info.get("has_workflow_dispatch", False)
-        }
+        return _workflow_info_response(workflow_info)
     except httpx.HTTPStatusError as e:
         # Извлекаем сообщение об ошибке из ответа GitHub
         status_code = e.response.status_code
@@ -180,6 +411,8 @@ async def api_get_workflow_info(
         
         logger.error(f"GitHub API error getting workflow info for {owner}/{repo}/{workflow_id}: {status_code} - {error_message}")
         raise HTTPException(status_code=status_code, detail=error_message)
+    except OutboundSaturatedError:
+        raise
     except Exception as e:
         logger.error(f"Unexpected error getting workflow info for {owner}/{repo}/{workflow_id}: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Failed to get workflow info: {str(e)}")
@@ -190,20 +423,38 @@ async def api_find_run(
     owner: str = Query(...),
     repo: str = Query(...),
     workflow_id: str = Query(...),
-    trigger_time: str = Query(...),  # ISO format timestamp
+    trigger_time: Optional[str] = Query(None),  # ISO format timestamp
     ref: Optional[str] = Query(None),
+    correlation_id: Optional[str] = Query(None),
+    trigger_id: Optional[str] = Query(None),
+    wait: int = Query(0, ge=0, le=LONG_POLL_MAX_WAIT),
     request: Request = None
 ):
     """
     API endpoint to find workflow run by trigger time and actor
     
+    If trigger_id is given, the run is looked up by the server-side watcher and
+    the request waits up to `wait` seconds for it (long-poll). Otherwise GitHub
+    is queried directly using trigger_time.
+    
     Args:
         owner: Repository owner
         repo: Repository name
         workflow_id: Workflow ID
         trigger_time: ISO format timestamp when workflow was triggered
         ref: Optional branch name
+        correlation_id: Optional correlation ID returned by the trigger endpoints
+        trigger_id: Optional ID returned by the trigger endpoints
+        wait: Long-poll timeout in seconds (only with trigger_id)
     """
+    if trigger_id:
+        trigger = _get_own_trigger(request, trigger_id)
+        trigger = await run_tracker.wait_for_run(trigger, wait)
+        return trigger.to_dict()
+    
+    if not trigger_time:
+        raise HTTPException(status_code=400, detail="trigger_time or trigger_id is required")
+    
     try:
         from datetime import datetime
         
@@ -224,7 +475,8 @@ async def api_find_run(
             owner, repo, workflow_id, trigger_dt, 
             ref=ref, 
             user_token=user_token,
-            expected_actor_login=expected_actor_login
+            expected_actor_login=expected_actor_login,
+            correlation_id=correlation_id
         )
         
         if run_data:
@@ -256,11 +508,147 @@ async def api_find_run(
         
         logger.error(f"GitHub API error finding run for {owner}/{repo}/{workflow_id}: {status_code} - {error_message}")
         raise HTTPException(status_code=status_code, detail=error_message)
+    except OutboundSaturatedError:
+        raise
     except Exception as e:
         logger.error(f"Unexpected error finding run for {owner}/{repo}/{workflow_id}: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Failed to find run: {str(e)}")
 
 
+def _get_own_trigger(request: Request, trigger_id: str) -> run_tracker.PendingTrigger:
+    """Get tracked trigger, making sure it belongs to the current user"""
+    trigger = run_tracker.get_trigger(trigger_id)
+    user = request.session.get("user") if request else None
+    if trigger is None or (trigger.username and (not user or user.get("login") != trigger.username)):
+        raise HTTPException(status_code=404, detail="Trigger not found")
+    return trigger
+
+
+def _format_sse(event: str, data: dict) -> str:
+    """Format a Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.get("/runs/events")
+async def api_run_events(
+    trigger_id: str = Query(...),
+    request: Request = None
+):
+    """
+    Server-Sent Events stream with the run found for a trigger and its progress
+    
+    Emits the current state first ("pending", "run" or "timeout"), then pushes
+    updates as the server-side watcher finds the run. Once the run is found, its
+    status and jobs are streamed as "progress" events until "completed".
+    
+    Args:
+        trigger_id: ID returned by the trigger endpoints
+    """
+    trigger = _get_own_trigger(request, trigger_id)
+    
+    async def event_stream():
+        queue = run_tracker.subscribe(trigger)
+        followed = None
+        try:
+            initial_event = {"pending": "pending", "found": "run", "timeout": "timeout"}[trigger.state]
+            yield _format_sse(initial_event, trigger.to_dict())
+            if initial_event == "timeout":
+                return
+            
+            while True:
+                if trigger.state == "found" and followed is None:
+                    # Run found - keep streaming its progress over the same connection
+                    run_tracker.unsubscribe(trigger, queue)
+                    followed, queue = run_follower.follow(trigger.owner, trigger.repo, trigger.run["id"], trigger.user_token)
+                
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                
+                yield _format_sse(message["event"], message["data"])
+                if message["event"] == "timeout" or message["event"] in run_follower.TERMINAL_EVENTS:
+                    break
+        finally:
+            if followed is not None:
+                run_follower.unfollow(followed, queue)
+            else:
+                run_tracker.unsubscribe(trigger, queue)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # Disable nginx buffering
+        }
+    )
+
+
+@router.get("/runs/jobs/{job_id}/log")
+async def api_job_log(
+    job_id: int,
+    owner: str = Query(...),
+    repo: str = Query(...),
+    request: Request = None,
+    user_data: tuple = Depends(get_user_from_session)
+):
+    """
+    Server-Sent Events stream with the tail of a job log
+    
+    Emits "log" events with new output ({"text": ...}) and "end" when the log
+    is complete. GitHub serves job logs only after the job has finished, so the
+    output of a running job arrives when it completes. Any access level to the
+    repository is enough. All viewers of a job share one reader.
+    
+    Args:
+        job_id: Workflow job ID
+        owner: Repository owner
+        repo: Repository name
+    """
+    user, access_token = user_data
+    
+    # Лог читается общим для всех зрителей токеном, поэтому доступ проверяем для каждого
+    if config.CHECK_PERMISSIONS:
+        if not await has_read_access(owner, repo, access_token, user.get("id")):
+            raise HTTPException(
+                status_code=403,
+                detail=f"User {user['login']} has no access to {owner}/{repo}."
+            )
+    
+    user_token = access_token if config.USE_USER_TOKEN_FOR_WORKFLOWS else None
+    
+    async def event_stream():
+        tail, queue = log_tail.follow(owner, repo, job_id, user_token)
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                
+                yield _format_sse(message["event"], message["data"])
+                if message["event"] in log_tail.TERMINAL_EVENTS:
+                    break
+        finally:
+            log_tail.unfollow(tail, queue)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # Disable nginx buffering
+        }
+    )
+
+
 @router.get("/check-permissions")
 async def api_check_permissions(
     owner: str = Query(...),
@@ -276,6 +664,85 @@ async def api_check_permissions(
     if not user or not access_token:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
+    try:
+        return await _resolve_permissions(user, access_token, owner, repo)
+    except OutboundSaturatedError:
+        raise
+    except Exception as e:
+        logger.error(f"Error checking permissions: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Failed to check permissions: {str(e)}")
+
+
+@router.post("/check-permissions/bulk")
+async def api_check_permissions_bulk(
+    request_data: BulkPermissionsRequest,
+    user_data: tuple = Depends(get_user_from_session)
+):
+    """
+    API endpoint to check permissions of current user in many repositories
+    
+    Levels not in the cache are resolved with a few GraphQL queries instead of
+    one request per repository.
+    
+    Request body:
+        repositories: List of "owner/repo"
+    """
+    user, access_token = user_data
+    
+    if not request_data.repositories:
+        raise HTTPException(status_code=400, detail="No repositories to check")
+    if len(request_data.repositories) > BULK_PERMISSIONS_MAX_REPOS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many repositories: {len(request_data.repositories)} (maximum {BULK_PERMISSIONS_MAX_REPOS})"
+        )
+    
+    repositories = []
+    for full_name in request_data.repositories:
+        owner, _, repo = full_name.strip().partition("/")
+        if not owner or not repo or "/" in repo:
+            raise HTTPException(status_code=400, detail=f"Invalid repository name: {full_name}")
+        repositories.append((owner, repo))
+    
+    if not config.CHECK_PERMISSIONS:
+        levels = {}
+    else:
+        try:
+            levels = await get_permission_levels(repositories, access_token, user.get("id"))
+        except OutboundSaturatedError:
+            raise
+        except Exception as e:
+            logger.error(f"Error checking permissions: {str(e)}", exc_info=True)
+            raise HTTPException(status_code=500, detail=f"Failed to check permissions: {str(e)}")
+    
+    results = []
+    for owner, repo in repositories:
+        permission = levels.get((owner, repo))
+        results.append({
+            "owner": owner,
+            "repo": repo,
+            "permission": permission,
+            "has_access": permission is not None or not config.CHECK_PERMISSIONS,
+            "can_trigger": can_trigger_with(permission) or not config.CHECK_PERMISSIONS
+        })
+    
+    return {
+        "username": user["login"],
+        "check_enabled": config.CHECK_PERMISSIONS,
+        "results": results
+    }
+
+
+async def _resolve_permissions(user: dict, access_token: str, owner: str, repo: str) -> dict:
+    """
+    Resolve whether the user may trigger workflows in the repository
+    
+    The permission level (read, triage, write, maintain, admin) is cached per
+    user and repository, so repeated checks from the form don't call GitHub.
+    
+    Returns:
+        Permission check result in the /api/check-permissions response format
+    """
     username = user["login"]
     logger.info(f"Checking permissions for authenticated user {username} in {owner}/{repo}")
     
@@ -291,28 +758,107 @@ async def api_check_permissions(
             "check_enabled": False
         }
     
-    try:
-        has_access = await check_repository_access(owner, repo, access_token)
-        
-        if has_access:
-            user_role = "collaborator"
-            can_trigger = True
-        else:
-            user_role = "no access"
-            can_trigger = False
-        
-        logger.info(f"Permission check result for user {username} in {owner}/{repo}: has_access={has_access}, role={user_role}, can_trigger={can_trigger}")
-        
-        return {
-            "has_access": has_access,
-            "can_trigger": can_trigger,
-            "user_role": user_role,
-            "username": username,
-            "owner": owner,
-            "repo": repo,
-            "check_enabled": True
-        }
-    except Exception as e:
-        logger.error(f"Error checking permissions: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Failed to check permissions: {str(e)}")
+    permission = await get_permission_level(owner, repo, access_token, user.get("id"))
+    has_access = permission is not None
+    can_trigger = can_trigger_with(permission)
+    
+    if can_trigger:
+        user_role = "collaborator"
+    elif has_access:
+        user_role = "read-only"
+    else:
+        user_role = "no access"
+    
+    logger.info(f"Permission check result for user {username} in {owner}/{repo}: permission={permission}, role={user_role}, can_trigger={can_trigger}")
+    
+    return {
+        "has_access": has_access,
+        "can_trigger": can_trigger,
+        "permission": permission,
+        "user_role": user_role,
+        "username": username,
+        "owner": owner,
+        "repo": repo,
+        "check_enabled": True
+    }
+
+
+def _describe_error(e: Exception) -> dict:
+    """Convert a lookup failure into a JSON-friendly error description"""
+    if isinstance(e, HTTPException):
+        return {"status_code": e.status_code, "message": e.detail}
+    if isinstance(e, httpx.HTTPStatusError):
+        try:
+            error_message = e.response.json().get("message", str(e))
+        except:
+            error_message = str(e)
+        return {"status_code": e.response.status_code, "message": error_message}
+    return {"status_code": 500, "message": str(e)}
 
+
+@router.get("/bootstrap")
+async def api_bootstrap(
+    owner: str = Query(...),
+    repo: str = Query(...),
+    workflow_id: Optional[str] = Query(None),
+    ref: Optional[str] = Query(None),
+    request: Request = None
+):
+    """
+    API endpoint returning everything the form needs in one response
+    
+    Workflows, branches, workflow inputs and permissions are looked up concurrently,
+    sharing the cached installation token and the pooled HTTP client. A failing
+    section doesn't fail the whole response: its value is null and the error is
+    reported under "errors".
+    
+    Args:
+        owner: Repository owner
+        repo: Repository name
+        workflow_id: Optional workflow ID to load inputs for
+        ref: Optional branch selected in the form
+    """
+    user = request.session.get("user")
+    access_token = request.session.get("access_token")
+    
+    async def load_permissions():
+        if not user or not access_token:
+            raise HTTPException(status_code=401, detail="Not authenticated")
+        return await _resolve_permissions(user, access_token, owner, repo)
+    
+    async def load_workflow_info():
+        from backend.services.workflow_info import get_workflow_info
+        workflow_info = await get_workflow_info(owner, repo, workflow_id)
+        return _workflow_info_response(workflow_info)
+    
+    env_patterns = config.BRANCH_FILTER_PATTERNS if config.BRANCH_FILTER_PATTERNS else None
+    sections = {
+        "workflows": get_workflows(owner, repo),
+        "branches": get_branches(owner, repo, env_patterns=env_patterns),
+        "permissions": load_permissions()
+    }
+    if workflow_id:
+        sections["workflow_info"] = load_workflow_info()
+    
+    results = await asyncio.gather(*sections.values(), return_exceptions=True)
+    
+    response = {
+        "owner": owner,
+        "repo": repo,
+        "workflow_id": workflow_id,
+        "ref": ref,
+        "workflows": None,
+        "branches": None,
+        "workflow_info": None,
+        "permissions": None,
+        "errors": {}
+    }
+    for name, result in zip(sections.keys(), results):
+        if isinstance(result, Exception):
+            if not isinstance(result, HTTPException):
+                logger.error(f"Bootstrap section '{name}' failed for {owner}/{repo}: {str(result)}")
+            response["errors"][name] = _describe_error(result)
+        else:
+            response[name] = result
+    
+    return response
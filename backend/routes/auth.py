@@ -7,7 +7,9 @@ from urllib.parse import urlparse
 from fastapi import APIRouter, Request, HTTPException
 from fastapi.responses import RedirectResponse
 
-from backend.services.github_oauth import get_oauth_url, get_access_token, get_user_info
+from backend.services.github_oauth import get_oauth_url, get_access_token, get_user_info, forget_token
+from backend.services.prewarm import prewarm_for_redirect
+import config
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -136,6 +138,8 @@ async def github_callback(request: Request, code: str = None, state: str = None)
         # Store in session
         request.session["access_token"] = access_token
         request.session["user"] = {
+            # ID не меняется при переименовании - ключ кэша прав и событий webhook
+            "id": user_info.get("id"),
             "login": user_info["login"],
             "name": user_info.get("name"),
             "avatar_url": user_info.get("avatar_url")
@@ -152,6 +156,10 @@ async def github_callback(request: Request, code: str = None, state: str = None)
             logger.warning(f"Invalid redirect URL in session: {redirect_url}, error: {e}, redirecting to /")
             redirect_url = "/"
         
+        # Пока браузер идет по редиректу, загружаем в кэш данные целевой страницы
+        if config.PREWARM_AFTER_LOGIN:
+            prewarm_for_redirect(redirect_url, access_token, user_info.get("id"))
+        
         logger.info(f"Redirecting after OAuth to: {redirect_url}")
         return RedirectResponse(url=redirect_url, status_code=303)
     except HTTPException:
@@ -164,6 +172,9 @@ async def github_callback(request: Request, code: str = None, state: str = None)
 @router.get("/logout")
 async def logout(request: Request):
     """Logout user"""
+    access_token = request.session.get("access_token")
+    if access_token:
+        forget_token(access_token)
     request.session.clear()
     return RedirectResponse(url="/", status_code=303)
 
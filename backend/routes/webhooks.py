@@ -0,0 +1,54 @@
+"""
+GitHub webhook receiver
+"""
+import hmac
+import json
+import hashlib
+import logging
+from fastapi import APIRouter, Request, HTTPException
+
+from backend.services import permissions, team_rules
+import config
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+
+def verify_signature(body: bytes, signature: str, secret: str) -> bool:
+    """Check X-Hub-Signature-256 of a webhook delivery"""
+    expected = "sha256=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature or "")
+
+
+@router.post("/github")
+async def github_webhook(request: Request):
+    """
+    Receive GitHub webhook events
+    
+    Configure the webhook (repository, organization or GitHub App) with
+    content type application/json and GITHUB_WEBHOOK_SECRET as the secret.
+    Collaborator and team events (member, team, team_add, membership,
+    organization) drop cached permission levels of the affected users and
+    update team roster snapshots used by team trigger rules.
+    """
+    if not config.GITHUB_WEBHOOK_SECRET:
+        raise HTTPException(status_code=404, detail="Webhooks are not enabled")
+    
+    body = await request.body()
+    if not verify_signature(body, request.headers.get("X-Hub-Signature-256"), config.GITHUB_WEBHOOK_SECRET):
+        logger.warning(f"Rejected webhook delivery {request.headers.get('X-GitHub-Delivery')} with invalid signature")
+        raise HTTPException(status_code=401, detail="Invalid signature")
+    
+    event = request.headers.get("X-GitHub-Event", "")
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON payload")
+    
+    if event == "ping":
+        return {"ok": True}
+    
+    payload = payload if isinstance(payload, dict) else {}
+    dropped = permissions.apply_webhook_event(event, payload)
+    rosters_updated = team_rules.apply_webhook_event(event, payload)
+    return {"ok": True, "event": event, "invalidated": dropped, "rosters_updated": rosters_updated}
@@ -8,14 +8,17 @@ from fastapi import APIRouter, Request, HTTPException, Form, Query
 from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 
-from backend.services.permissions import check_repository_access
-from backend.services.workflow import trigger_workflow
+from backend.services.dispatch_validation import DispatchValidationError, validate_dispatch
 from backend.services.github_oauth import get_oauth_url
+from backend.services.outbound_limits import OutboundSaturatedError
+from backend.services import dispatcher, idempotency
+from backend.services.request_context import instrument_templates
 import config
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 templates = Jinja2Templates(directory="frontend/templates")
+instrument_templates(templates)
 # Add urlencode filter to Jinja2
 def urlencode_filter(value):
     """URL encode filter for Jinja2 templates"""
@@ -25,6 +28,43 @@ def urlencode_filter(value):
 templates.env.filters["urlencode"] = urlencode_filter
 
 
+def _no_cache(response):
+    """Prevent caching, so that the workflow is triggered on each request"""
+    response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
+    response.headers["Pragma"] = "no-cache"
+    response.headers["Expires"] = "0"
+    return response
+
+
+def _error_page(
+    request: Request,
+    user: dict,
+    error: str,
+    owner: str,
+    repo: str,
+    workflow_id: str,
+    ref: str,
+    inputs: dict,
+    return_url: str = None
+):
+    """Result page of a workflow that couldn't be triggered"""
+    return _no_cache(templates.TemplateResponse(
+        "result.html",
+        {
+            "request": request,
+            "user": user,
+            "success": False,
+            "error": error,
+            "owner": owner,
+            "repo": repo,
+            "workflow_id": workflow_id,
+            "ref": ref,
+            "inputs": inputs,
+            "return_url": return_url
+        }
+    ))
+
+
 async def _trigger_and_show_result(
     request: Request,
     owner: str,
@@ -33,7 +73,8 @@ async def _trigger_and_show_result(
     ref: str,
     inputs: dict,
     return_json: bool = False,
-    return_url: str = None
+    return_url: str = None,
+    idempotency_key: str = None
 ):
     """Вспомогательная функция для запуска workflow и показа результата"""
     # Check authentication
@@ -59,75 +100,54 @@ async def _trigger_and_show_result(
             )
         return RedirectResponse(url=oauth_url)
     
-    # Check permissions if enabled in config
-    if config.CHECK_PERMISSIONS:
-        username = user["login"]
-        has_access = await check_repository_access(owner, repo, access_token)
-        
-        logger.info(f"Checking permissions for user {username} in {owner}/{repo}: has_access={has_access}")
-        
-        if not has_access:
-            error_msg = f"User {username} is not a collaborator of {owner}/{repo}. Only collaborators can trigger workflows."
-            logger.info(f"User {username} in {owner}/{repo}: no access, cannot trigger")
+    # Ошибки в inputs и ветке показываем сразу, без проверки прав и обращений к GitHub
+    if config.VALIDATE_DISPATCH:
+        try:
+            inputs = await validate_dispatch(owner, repo, workflow_id, ref, inputs)
+        except DispatchValidationError as e:
             if return_json:
-                raise HTTPException(status_code=403, detail=error_msg)
-            response = templates.TemplateResponse(
-                "result.html",
-                {
-                    "request": request,
-                    "user": user,
-                    "success": False,
-                    "error": error_msg,
-                    "owner": owner,
-                    "repo": repo,
-                    "workflow_id": workflow_id,
-                    "ref": ref,
-                    "inputs": inputs,
-                    "return_url": return_url
-                }
-            )
-            # Prevent caching
-            response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-            response.headers["Pragma"] = "no-cache"
-            response.headers["Expires"] = "0"
-            return response
-        else:
-            logger.info(f"User {username} in {owner}/{repo}: has access (collaborator), can trigger")
-    else:
-        logger.info(f"Permission check disabled in config, allowing workflow trigger for user {user.get('login', 'unknown')}")
+                raise HTTPException(status_code=422, detail=str(e))
+            return _error_page(request, user, str(e), owner, repo, workflow_id, ref, inputs, return_url)
     
-    # Trigger workflow
+    # Правила команд, права и сам запуск - общий конвейер dispatcher
     try:
-        logger.info(f"Triggering workflow: {owner}/{repo}/{workflow_id} on {ref} with inputs: {inputs}")
-        # Use user token if config says so
-        user_token = None
-        if config.USE_USER_TOKEN_FOR_WORKFLOWS:
-            user_token = access_token
-        result = await trigger_workflow(
-            owner=owner,
-            repo=repo,
-            workflow_id=workflow_id,
-            inputs=inputs,
-            ref=ref,
-            user_token=user_token
-        )
+        async def dispatch() -> dict:
+            return await dispatcher.dispatch_workflow(
+                owner, repo, workflow_id, ref, inputs, user["login"], access_token,
+                user_id=user.get("id"),
+                max_wait=config.DISPATCH_MAX_WAIT
+            )
+        
+        # Повторное открытие той же ссылки (двойной клик, предпросмотр ботом) не запускает workflow еще раз
+        try:
+            result, replayed = await idempotency.run_once(
+                user["login"], owner, repo, workflow_id, ref, inputs, dispatch,
+                idempotency_key=idempotency_key
+            )
+        except idempotency.IdempotencyConflictError as e:
+            if return_json:
+                raise HTTPException(status_code=422, detail=str(e))
+            result, replayed = {"success": False, "status_code": 422, "message": str(e)}, False
+        
+        if replayed:
+            result = {**result, "message": "Workflow was already triggered by an identical request, showing the original run"}
         
         if return_json:
             if result["success"]:
                 json_response = JSONResponse(content=result)
+                if replayed:
+                    json_response.headers["Idempotent-Replayed"] = "true"
                 # Prevent caching for JSON responses too
-                json_response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-                json_response.headers["Pragma"] = "no-cache"
-                json_response.headers["Expires"] = "0"
-                return json_response
+                return _no_cache(json_response)
             else:
                 raise HTTPException(
                     status_code=result["status_code"],
-                    detail=result["message"]
+                    detail=result["message"],
+                    headers={"Retry-After": str(result["retry_after"])} if "retry_after" in result else None
                 )
         
         # Return HTML result page with no-cache headers
-        response = templates.TemplateResponse(
+        return _no_cache(templates.TemplateResponse(
             "result.html",
             {
                 "request": request,
@@ -143,42 +163,20 @@ async def _trigger_and_show_result(
                 "run_url": result.get("run_url"),
                 "workflow_url": result.get("workflow_url"),
                 "trigger_time": result.get("trigger_time"),
+                "trigger_id": result.get("trigger_id"),
+                "correlation_id": result.get("correlation_id"),
                 "auto_open_run": config.AUTO_OPEN_RUN,
                 "error": result.get("message") if not result["success"] else None,
                 "return_url": return_url
             }
-        )
-        # Prevent caching to ensure workflow is triggered on each request
-        response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-        response.headers["Pragma"] = "no-cache"
-        response.headers["Expires"] = "0"
-        return response
-    except HTTPException:
+        ))
+    except (HTTPException, OutboundSaturatedError):
         raise
     except Exception as e:
         logger.error(f"Failed to trigger workflow: {str(e)}", exc_info=True)
         if return_json:
             raise HTTPException(status_code=500, detail=f"Failed to trigger workflow: {str(e)}")
-        response = templates.TemplateResponse(
-            "result.html",
-            {
-                "request": request,
-                "user": user,
-                "success": False,
-                "error": str(e),
-                "owner": owner,
-                "repo": repo,
-                "workflow_id": workflow_id,
-                "ref": ref,
-                "inputs": inputs,
-                "return_url": return_url
-            }
-        )
-        # Prevent caching
-        response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-        response.headers["Pragma"] = "no-cache"
-        response.headers["Expires"] = "0"
-        return response
+        return _error_page(request, user, str(e), owner, repo, workflow_id, ref, inputs, return_url)
 
 
 @router.get("/trigger")
@@ -220,7 +218,7 @@ async def trigger_workflow_get(
         
         # Добавляем все остальные параметры (workflow inputs)
         query_params = dict(request.query_params)
-        excluded_params = {"owner", "repo", "workflow_id", "ref", "ui", "return_url"}
+        excluded_params = {"owner", "repo", "workflow_id", "ref", "ui", "return_url", "idempotency_key"}
         for key, value in query_params.items():
             if key not in excluded_params and value:
                 params.append(f"{key}={value}")
@@ -237,25 +235,10 @@ async def trigger_workflow_get(
         error_msg = "Repository owner, name, and workflow_id are required"
         if return_json:
             raise HTTPException(status_code=400, detail=error_msg)
-        response = templates.TemplateResponse(
-            "result.html",
-            {
-                "request": request,
-                "user": request.session.get("user"),
-                "success": False,
-                "error": error_msg,
-                "owner": owner or "",
-                "repo": repo or "",
-                "workflow_id": workflow_id or "",
-                "ref": ref or "",
-                "inputs": {}
-            }
+        return _error_page(
+            request, request.session.get("user"), error_msg,
+            owner or "", repo or "", workflow_id or "", ref or "", {}
         )
-        # Prevent caching
-        response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-        response.headers["Pragma"] = "no-cache"
-        response.headers["Expires"] = "0"
-        return response
     
     # Extract return_url before parsing inputs
     return_url = request.query_params.get("return_url")
@@ -264,14 +247,16 @@ async def trigger_workflow_get(
     # Все параметры кроме служебных считаются inputs
     inputs = {}
     query_params = dict(request.query_params)
-    excluded_params = {"owner", "repo", "workflow_id", "ref", "ui", "return_url"}
+    excluded_params = {"owner", "repo", "workflow_id", "ref", "ui", "return_url", "idempotency_key"}
     
     for key, value in query_params.items():
         if key not in excluded_params and value:
             inputs[key] = value
     
+    idempotency_key = request.headers.get("Idempotency-Key") or request.query_params.get("idempotency_key")
+    
     return await _trigger_and_show_result(
-        request, owner, repo, workflow_id, ref, inputs, return_json, return_url
+        request, owner, repo, workflow_id, ref, inputs, return_json, return_url, idempotency_key
     )
 
 
@@ -294,19 +279,9 @@ async def trigger_workflow_post(
     workflow_id = workflow_id or os.getenv("DEFAULT_WORKFLOW_ID")
     
     if not all([owner, repo, workflow_id]):
-        return templates.TemplateResponse(
-            "result.html",
-            {
-                "request": request,
-                "user": request.session.get("user"),
-                "success": False,
-                "error": "Repository owner, name, and workflow_id are required",
-                "owner": owner or "",
-                "repo": repo or "",
-                "workflow_id": workflow_id or "",
-                "ref": ref or "",
-                "inputs": {}
-            }
+        return _error_page(
+            request, request.session.get("user"), "Repository owner, name, and workflow_id are required",
+            owner or "", repo or "", workflow_id or "", ref or "", {}
         )
     
     # Extract return_url from form data
@@ -317,7 +292,7 @@ async def trigger_workflow_post(
     inputs = {}
     
     # Обрабатываем все поля кроме служебных
-    excluded_fields = {"owner", "repo", "workflow_id", "ref", "return_url"}
+    excluded_fields = {"owner", "repo", "workflow_id", "ref", "return_url", "idempotency_key"}
     for key, value in form_data.items():
         if key not in excluded_fields:
             # Обработка boolean полей - если значение есть, используем его
@@ -328,7 +303,10 @@ async def trigger_workflow_post(
                     inputs[key] = value
             # Если значение пустое, но это может быть необязательное поле - пропускаем
     
+    idempotency_key = request.headers.get("Idempotency-Key") or form_data.get("idempotency_key")
+    
     return await _trigger_and_show_result(
-        request, owner, repo, workflow_id, ref, inputs, return_json=False, return_url=return_url
+        request, owner, repo, workflow_id, ref, inputs, return_json=False, return_url=return_url,
+        idempotency_key=idempotency_key
     )
 
@@ -7,8 +7,10 @@ import re
 import httpx
 import asyncio
 from typing import List, Optional
+from urllib.parse import quote
 from backend.services.github_app import get_installation_token, load_private_key
 from backend.services.cache import get as cache_get, set as cache_set
+from backend.services.github_client import get_client
 
 logger = logging.getLogger(__name__)
 
@@ -18,18 +20,12 @@ CACHE_TTL = 1800
 # Maximum number of parallel requests to GitHub API
 MAX_PARALLEL_REQUESTS = 10
 
+# Missing refs are remembered briefly: the branch may be pushed any moment (seconds)
+MISSING_REF_CACHE_TTL = 30
 
-async def _fetch_all_branches_from_api(owner: str, repo: str) -> list:
-    """
-    Fetch all branches from GitHub API using parallel requests (internal function, not cached)
-    
-    Args:
-        owner: Repository owner
-        repo: Repository name
-        
-    Returns:
-        List of all branch names (unsorted)
-    """
+
+async def _get_app_headers() -> dict:
+    """Headers for GitHub API requests authenticated as the GitHub App installation"""
     # Get GitHub App credentials
     app_id = os.getenv("GITHUB_APP_ID")
     installation_id = os.getenv("GITHUB_APP_INSTALLATION_ID")
@@ -42,96 +38,110 @@ async def _fetch_all_branches_from_api(owner: str, repo: str) -> list:
     private_key = load_private_key(private_key_path)
     installation_token = await get_installation_token(app_id, installation_id, private_key)
     
-    headers = {
+    return {
         "Authorization": f"token {installation_token}",
         "Accept": "application/vnd.github.v3+json"
     }
+
+
+async def _fetch_all_branches_from_api(owner: str, repo: str) -> list:
+    """
+    Fetch all branches from GitHub API using parallel requests (internal function, not cached)
     
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        branches_url = f"https://api.github.com/repos/{owner}/{repo}/branches"
-        per_page = 100
-        
-        # Fetch first page to determine if there are more pages
-        first_response = await client.get(
-            branches_url,
-            headers=headers,
-            params={"per_page": per_page, "page": 1}
-        )
-        first_response.raise_for_status()
-        
-        first_page_data = first_response.json()
-        if not first_page_data:
-            return []
-        
-        all_branch_names = [branch["name"] for branch in first_page_data]
-        
-        # If first page is not full, we're done
-        if len(first_page_data) < per_page:
-            return all_branch_names
-        
-        # Parse Link header to find total number of pages
-        link_header = first_response.headers.get("Link", "")
-        total_pages = None
+    Args:
+        owner: Repository owner
+        repo: Repository name
         
-        if link_header:
-            # Extract last page number from Link header
-            # Format: <url?page=2>; rel="next", <url?page=19>; rel="last"
-            import re as regex_module
-            last_match = regex_module.search(r'page=(\d+)>; rel="last"', link_header)
-            if last_match:
-                total_pages = int(last_match.group(1))
+    Returns:
+        List of all branch names (unsorted)
+    """
+    headers = await _get_app_headers()
+    
+    client = get_client()
+    branches_url = f"https://api.github.com/repos/{owner}/{repo}/branches"
+    per_page = 100
+    
+    # Fetch first page to determine if there are more pages
+    first_response = await client.get(
+        branches_url,
+        headers=headers,
+        params={"per_page": per_page, "page": 1}
+    )
+    first_response.raise_for_status()
+    
+    first_page_data = first_response.json()
+    if not first_page_data:
+        return []
+    
+    all_branch_names = [branch["name"] for branch in first_page_data]
+    
+    # If first page is not full, we're done
+    if len(first_page_data) < per_page:
+        return all_branch_names
+    
+    # Parse Link header to find total number of pages
+    link_header = first_response.headers.get("Link", "")
+    total_pages = None
+    
+    if link_header:
+        # Extract last page number from Link header
+        # Format: <url?page=2>; rel="next", <url?page=19>; rel="last"
+        import re as regex_module
+        last_match = regex_module.search(r'page=(\d+)>; rel="last"', link_header)
+        if last_match:
+            total_pages = int(last_match.group(1))
+    
+    # If we know total pages, fetch all remaining pages in parallel
+    if total_pages and total_pages > 1:
+        semaphore = asyncio.Semaphore(MAX_PARALLEL_REQUESTS)
         
-        # If we know total pages, fetch all remaining pages in parallel
-        if total_pages and total_pages > 1:
-            semaphore = asyncio.Semaphore(MAX_PARALLEL_REQUESTS)
-            
-            async def fetch_page(page_num: int) -> List[str]:
-                """Fetch a single page of branches"""
-                async with semaphore:
-                    response = await client.get(
-                        branches_url,
-                        headers=headers,
-                        params={"per_page": per_page, "page": page_num}
-                    )
-                    response.raise_for_status()
-                    branches_data = response.json()
-                    return [branch["name"] for branch in branches_data] if branches_data else []
-            
-            # Fetch all remaining pages (2 to total_pages) in parallel
-            remaining_pages = list(range(2, total_pages + 1))
-            tasks = [fetch_page(page) for page in remaining_pages]
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            # Combine results
-            for result in results:
-                if isinstance(result, Exception):
-                    logger.warning(f"Error fetching page: {str(result)}")
-                elif result:
-                    all_branch_names.extend(result)
-        else:
-            # Fallback: sequential fetching if we can't determine total pages
-            # This should rarely happen, but keep it as fallback
-            page = 2
-            while True:
+        async def fetch_page(page_num: int) -> List[str]:
+            """Fetch a single page of branches"""
+            async with semaphore:
                 response = await client.get(
                     branches_url,
                     headers=headers,
-                    params={"per_page": per_page, "page": page}
+                    params={"per_page": per_page, "page": page_num}
                 )
                 response.raise_for_status()
-                
                 branches_data = response.json()
-                if not branches_data:
-                    break
-                
-                all_branch_names.extend([branch["name"] for branch in branches_data])
-                
-                if len(branches_data) < per_page:
-                    break
-                
-                page += 1
+                return [branch["name"] for branch in branches_data] if branches_data else []
         
-        return all_branch_names
+        # Fetch all remaining pages (2 to total_pages) in parallel
+        remaining_pages = list(range(2, total_pages + 1))
+        tasks = [fetch_page(page) for page in remaining_pages]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        
+        # Combine results
+        for result in results:
+            if isinstance(result, Exception):
+                logger.warning(f"Error fetching page: {str(result)}")
+            elif result:
+                all_branch_names.extend(result)
+    else:
+        # Fallback: sequential fetching if we can't determine total pages
+        # This should rarely happen, but keep it as fallback
+        page = 2
+        while True:
+            response = await client.get(
+                branches_url,
+                headers=headers,
+                params={"per_page": per_page, "page": page}
+            )
+            response.raise_for_status()
+            
+            branches_data = response.json()
+            if not branches_data:
+                break
+            
+            all_branch_names.extend([branch["name"] for branch in branches_data])
+            
+            if len(branches_data) < per_page:
+                break
+            
+            page += 1
+    
+    return all_branch_names
 
 
 async def get_branches(owner: str, repo: str, env_patterns: Optional[List[str]] = None) -> list:
@@ -201,3 +211,45 @@ async def get_branches(owner: str, repo: str, env_patterns: Optional[List[str]]
     logger.info(f"Retrieved {len(all_branch_names)} branches for {owner}/{repo} (env_patterns: {env_patterns})")
     return all_branch_names
 
+
+
+async def ref_exists(owner: str, repo: str, ref: str) -> bool:
+    """
+    Check that a branch or tag exists in the repository
+    
+    Uses the cached branch list when it is available; refs missing from it
+    (new branches, tags) are checked with one request and remembered.
+    
+    Args:
+        owner: Repository owner
+        repo: Repository name
+        ref: Branch or tag name
+        
+    Returns:
+        True if the ref exists
+    """
+    cached_branches = cache_get(f"branches:{owner}:{repo}")
+    if cached_branches is not None and ref in cached_branches:
+        return True
+    
+    cache_key = f"ref:{owner}:{repo}:{ref}"
+    exists = cache_get(cache_key)
+    if exists is not None:
+        return exists
+    
+    headers = await _get_app_headers()
+    # Только SHA коммита - самый дешевый ответ, работает и для веток, и для тегов
+    headers["Accept"] = "application/vnd.github.sha"
+    client = get_client()
+    response = await client.get(
+        f"https://api.github.com/repos/{owner}/{repo}/commits/{quote(ref, safe='')}",
+        headers=headers
+    )
+    if response.status_code in (404, 422):
+        exists = False
+    else:
+        response.raise_for_status()
+        exists = True
+    # Отсутствующий ref запоминаем ненадолго - ветку могут вот-вот создать
+    cache_set(cache_key, exists, CACHE_TTL if exists else MISSING_REF_CACHE_TTL)
+    return exists
@@ -6,6 +6,8 @@ import logging
 from typing import Optional, Any, Dict, Tuple
 from functools import wraps
 
+from backend.services import metrics, request_context
+
 logger = logging.getLogger(__name__)
 
 # Cache storage: {key: (value, expiry_timestamp)}
@@ -23,7 +25,14 @@ def get(key: str) -> Optional[Any]:
     Returns:
         Cached value or None if not found/expired
     """
+    with request_context.timed("cache"):
+        return _lookup(key)
+
+
+def _lookup(key: str) -> Optional[Any]:
+    namespace = _namespace(key)
     if key not in _cache:
+        metrics.inc("cache_requests_total", namespace=namespace, result="miss")
         return None
     
     value, expiry = _cache[key]
@@ -32,9 +41,12 @@ def get(key: str) -> Optional[Any]:
         # Expired, remove from cache
         del _cache[key]
         logger.debug(f"Cache expired for key: {key}")
+        metrics.inc("cache_evictions_total", namespace=namespace, reason="expired")
+        metrics.inc("cache_requests_total", namespace=namespace, result="miss")
         return None
     
     logger.debug(f"Cache hit for key: {key}")
+    metrics.inc("cache_requests_total", namespace=namespace, result="hit")
     return value
 
 
@@ -63,13 +75,33 @@ def clear(key: str = None) -> None:
         key: Cache key to clear, or None to clear all
     """
     if key is None:
+        for cached_key in _cache:
+            metrics.inc("cache_evictions_total", namespace=_namespace(cached_key), reason="cleared")
         _cache.clear()
         logger.debug("Cache cleared")
     elif key in _cache:
         del _cache[key]
+        metrics.inc("cache_evictions_total", namespace=_namespace(key), reason="cleared")
         logger.debug(f"Cache cleared for key: {key}")
 
 
+def _namespace(key: str) -> str:
+    """Metrics label of a key: its prefix before the first ':' (e.g. branches, workflow_info)"""
+    return key.split(":", 1)[0]
+
+
+def _collect_entries():
+    """Number of cache entries per namespace, computed on each /metrics scrape"""
+    counts: Dict[str, int] = {}
+    for key in list(_cache):
+        namespace = _namespace(key)
+        counts[namespace] = counts.get(namespace, 0) + 1
+    return [("cache_entries", {"namespace": namespace}, count) for namespace, count in counts.items()]
+
+
+metrics.register_collector(_collect_entries)
+
+
 def cached(ttl: int = None, key_prefix: str = ""):
     """
     Decorator to cache function results
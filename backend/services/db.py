@@ -0,0 +1,53 @@
+"""
+Local SQLite storage shared by services that need durable state
+"""
+import os
+import sqlite3
+import logging
+from typing import Dict, Optional
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Open connections: {database name: connection}
+_connections: Dict[str, sqlite3.Connection] = {}
+
+
+def connect(name: str, schema: Optional[str] = None) -> sqlite3.Connection:
+    """
+    Get connection to a database in DATA_DIR (created on first use)
+
+    Connections are opened in autocommit mode with WAL journal, so readers
+    don't block the writer. Use `with conn:` for multi-statement transactions.
+
+    Args:
+        name: Database name (file name without extension)
+        schema: Optional SQL script (CREATE ... IF NOT EXISTS) run when the database is opened
+
+    Returns:
+        SQLite connection with rows accessible by column name
+    """
+    conn = _connections.get(name)
+    if conn is not None:
+        return conn
+
+    os.makedirs(config.DATA_DIR, exist_ok=True)
+    path = os.path.join(config.DATA_DIR, f"{name}.db")
+    conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    if schema:
+        conn.executescript(schema)
+    _connections[name] = conn
+    logger.info(f"Opened database {path}")
+    return conn
+
+
+def close_all() -> None:
+    """Close all open databases"""
+    for conn in _connections.values():
+        conn.close()
+    _connections.clear()
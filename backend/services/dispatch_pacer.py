@@ -0,0 +1,209 @@
+"""
+Pacing of workflow dispatches
+
+GitHub limits content-creating requests (secondary rate limits), so bursts of
+POST .../dispatches start failing with 403. Every dispatch takes a slot from two
+token buckets - one per token (user or GitHub App) and one per repository - and
+waits for a free slot instead of hitting the limit. Interactive single triggers go
+ahead of bulk ones (batch fan-outs) waiting for the same buckets.
+
+When GitHub does answer with a rate limit, the buckets are blocked for the
+Retry-After period so that other waiting dispatches don't hit it too.
+"""
+import time
+import asyncio
+import hashlib
+import logging
+import itertools
+from typing import Dict, List, Optional, Tuple
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Priorities (lower goes first)
+INTERACTIVE = 0
+BULK = 1
+
+# Longest sleep between checks of a waiting dispatch (seconds)
+MAX_CHECK_INTERVAL = 1.0
+
+# Full idle buckets are dropped when there are more than this many
+MAX_IDLE_BUCKETS = 1000
+
+
+class DispatchThrottledError(Exception):
+    """Dispatch can't get a slot within the allowed wait"""
+
+    def __init__(self, queue_position: int, retry_after: float):
+        self.queue_position = queue_position
+        self.retry_after = retry_after
+        super().__init__(
+            f"Too many workflow dispatches, try again in {int(retry_after) + 1}s (queue position {queue_position})"
+        )
+
+
+class _Bucket:
+    """Token bucket: `rate` slots per second, at most `burst` at once"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def refill(self, now: float) -> None:
+        # now может быть взят чуть раньше создания корзины
+        self.tokens = min(self.burst, self.tokens + max(now - self.updated, 0) * self.rate)
+        self.updated = max(now, self.updated)
+
+    def wait_time(self, now: float, slots: int = 1) -> float:
+        """Time until `slots` slots are available"""
+        self.refill(now)
+        wait = max(0.0, (slots - self.tokens) / self.rate)
+        if now < self.blocked_until:
+            wait = max(wait, self.blocked_until - now)
+        return wait
+
+
+class _Waiter:
+    def __init__(self, keys: Tuple[str, str], priority: int, seq: int):
+        self.keys = keys
+        self.priority = priority
+        self.seq = seq
+
+    def goes_before(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+# Buckets: {"token:<hash>" or "repo:<owner>/<repo>": bucket}
+_buckets: Dict[str, _Bucket] = {}
+
+# Dispatches waiting for a slot
+_waiters: List[_Waiter] = []
+_seq = itertools.count()
+
+
+def bucket_keys(user_token: Optional[str], owner: str, repo: str) -> Tuple[str, str]:
+    """Keys of the per-token and per-repository buckets of a dispatch"""
+    if user_token:
+        token_key = "token:" + hashlib.sha256(user_token.encode("utf-8")).hexdigest()[:16]
+    else:
+        # Токен GitHub App меняется каждый час, но лимит общий для установки
+        token_key = "token:app"
+    return token_key, f"repo:{owner}/{repo}"
+
+
+async def acquire(
+    user_token: Optional[str],
+    owner: str,
+    repo: str,
+    priority: int = INTERACTIVE,
+    max_wait: Optional[float] = None
+) -> float:
+    """
+    Wait for a dispatch slot
+
+    Args:
+        user_token: User OAuth token the dispatch is made with, None for the GitHub App
+        owner: Repository owner
+        repo: Repository name
+        priority: INTERACTIVE or BULK
+        max_wait: Maximum time to wait in seconds, None to wait as long as needed
+
+    Returns:
+        Time waited in seconds
+
+    Raises:
+        DispatchThrottledError: the slot is not expected within max_wait
+    """
+    keys = bucket_keys(user_token, owner, repo)
+    waiter = _Waiter(keys, priority, next(_seq))
+    _waiters.append(waiter)
+    started = time.monotonic()
+    try:
+        while True:
+            now = time.monotonic()
+            position, wait = _estimate(waiter, now)
+            if position == 0 and wait == 0:
+                for key in keys:
+                    _bucket(key).tokens -= 1
+                waited = now - started
+                if waited > 0.1:
+                    logger.info(f"Dispatch to {owner}/{repo} waited {waited:.1f}s for a slot")
+                return waited
+
+            if max_wait is not None and now - started + wait > max_wait:
+                raise DispatchThrottledError(position + 1, wait)
+            await asyncio.sleep(min(max(wait, 0.01), MAX_CHECK_INTERVAL))
+    finally:
+        _waiters.remove(waiter)
+        _prune()
+
+
+def refund(user_token: Optional[str], owner: str, repo: str) -> None:
+    """Return the slot taken by acquire for a dispatch that never reached GitHub"""
+    now = time.monotonic()
+    for key in bucket_keys(user_token, owner, repo):
+        bucket = _bucket(key)
+        bucket.refill(now)
+        bucket.tokens = min(bucket.burst, bucket.tokens + 1)
+
+
+def defer(user_token: Optional[str], owner: str, repo: str, retry_after: float) -> None:
+    """Block the buckets of a dispatch after GitHub answered with a rate limit"""
+    until = time.monotonic() + retry_after
+    for key in bucket_keys(user_token, owner, repo):
+        bucket = _bucket(key)
+        bucket.blocked_until = max(bucket.blocked_until, until)
+    logger.warning(f"GitHub rate-limited dispatches to {owner}/{repo}, pausing for {retry_after:.0f}s")
+
+
+def estimate_wait(owner: str, repo: str, ahead: int = 0) -> float:
+    """Expected wait for a dispatch to the repository with `ahead` dispatches before it (seconds)"""
+    bucket = _buckets.get(f"repo:{owner}/{repo}")
+    now = time.monotonic()
+    if bucket is None:
+        bucket = _Bucket(*_limits(f"repo:{owner}/{repo}"))
+    return bucket.wait_time(now, ahead + 1)
+
+
+def _estimate(waiter: _Waiter, now: float) -> Tuple[int, float]:
+    """Position of the waiter among dispatches sharing its buckets, and expected wait"""
+    position = sum(
+        1 for other in _waiters
+        if other is not waiter and other.goes_before(waiter) and set(other.keys) & set(waiter.keys)
+    )
+    wait = max(_bucket(key).wait_time(now, position + 1) for key in waiter.keys)
+    return position, wait
+
+
+def _limits(key: str) -> Tuple[float, int]:
+    per_minute = config.DISPATCH_RATE_PER_TOKEN if key.startswith("token:") else config.DISPATCH_RATE_PER_REPO
+    return max(per_minute, 1) / 60, max(config.DISPATCH_BURST, 1)
+
+
+def _bucket(key: str) -> _Bucket:
+    bucket = _buckets.get(key)
+    if bucket is None:
+        bucket = _Bucket(*_limits(key))
+        _buckets[key] = bucket
+    return bucket
+
+
+def _prune() -> None:
+    """Forget full idle buckets - they behave the same as new ones"""
+    if len(_buckets) <= MAX_IDLE_BUCKETS:
+        return
+    now = time.monotonic()
+    busy = {key for waiter in _waiters for key in waiter.keys}
+    for key, bucket in list(_buckets.items()):
+        bucket.refill(now)
+        if key not in busy and bucket.tokens >= bucket.burst and now >= bucket.blocked_until:
+            del _buckets[key]
+
+
+def reset() -> None:
+    """Forget all buckets"""
+    _buckets.clear()
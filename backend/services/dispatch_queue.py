@@ -0,0 +1,345 @@
+"""
+Durable queue of workflow dispatches
+
+With ASYNC_DISPATCH enabled, /api/trigger only stores the dispatch in a local
+SQLite database and answers 202 with the job ID. A pool of background workers
+performs the dispatches (permission check, token, POST /dispatches) with pacing
+and retries on transient GitHub errors. Jobs that hit dispatch rate limits are
+postponed without using up their attempts. Jobs survive restarts: jobs interrupted
+while running are picked up again on startup.
+
+User OAuth tokens are stored encrypted and wiped once the job is finished.
+Database calls run in worker threads so they never block the event loop.
+"""
+import json
+import time
+import uuid
+import asyncio
+import logging
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import List, Optional
+
+import config
+from backend.services import db, dispatch_pacer, dispatcher
+from backend.services.outbound_limits import OutboundSaturatedError
+from backend.services.token_crypto import encrypt_token, decrypt_token
+
+logger = logging.getLogger(__name__)
+
+DB_NAME = "dispatch_queue"
+
+# GitHub responses worth retrying
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Retry delay: RETRY_BASE_DELAY * 2^(attempt - 1), at most RETRY_MAX_DELAY (seconds)
+RETRY_BASE_DELAY = 2.0
+RETRY_MAX_DELAY = 60.0
+
+# How often idle workers look for jobs scheduled for retry (seconds)
+IDLE_POLL_INTERVAL = 1.0
+
+# Finished jobs are kept for status queries this long (seconds)
+JOB_RETENTION = 7 * 24 * 3600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    repo TEXT NOT NULL,
+    workflow_id TEXT NOT NULL,
+    ref TEXT NOT NULL,
+    inputs TEXT NOT NULL,
+    username TEXT,
+    user_id INTEGER,
+    token TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status_next_attempt ON jobs (status, next_attempt_at);
+"""
+
+# Worker pool state
+_workers: List[asyncio.Task] = []
+_wakeup: Optional[asyncio.Event] = None
+
+# Claiming runs in threads: SELECT and UPDATE of one claim must not interleave with another
+_claim_lock = threading.Lock()
+
+# Connection whose schema is known to be up to date
+_migrated: Optional[sqlite3.Connection] = None
+
+
+def _db():
+    global _migrated
+    conn = db.connect(DB_NAME, schema=_SCHEMA)
+    if _migrated is not conn:
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+        if "user_id" not in columns:
+            # База создана до появления user_id
+            conn.execute("ALTER TABLE jobs ADD COLUMN user_id INTEGER")
+        _migrated = conn
+    return conn
+
+
+async def enqueue(
+    owner: str,
+    repo: str,
+    workflow_id: str,
+    ref: str,
+    inputs: dict,
+    username: str,
+    access_token: str,
+    user_id: Optional[int] = None
+) -> str:
+    """
+    Store a dispatch to be performed by the workers
+
+    Args:
+        owner: Repository owner
+        repo: Repository name
+        workflow_id: Workflow ID
+        ref: Branch to run the workflow on
+        inputs: Workflow inputs
+        username: Login of the user who requested the dispatch
+        access_token: User OAuth token (used for the permission check and,
+                      if configured, to dispatch as the user)
+        user_id: GitHub user ID (from the session), the key of cached permissions
+
+    Returns:
+        Job ID
+    """
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    token = encrypt_token(access_token)
+    await asyncio.to_thread(
+        _execute_sql,
+        "INSERT INTO jobs (id, status, owner, repo, workflow_id, ref, inputs, username, user_id, token, "
+        "next_attempt_at, created_at, updated_at) VALUES (?, 'queued', ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (job_id, owner, repo, workflow_id, ref, json.dumps(inputs or {}), username, user_id,
+         token, now, now, now)
+    )
+    logger.info(f"Queued dispatch {job_id}: {owner}/{repo}/{workflow_id} on {ref} by {username}")
+    if _wakeup is not None:
+        _wakeup.set()
+    return job_id
+
+
+async def get_job(job_id: str) -> Optional[dict]:
+    """
+    Get job status
+
+    Returns:
+        Job as a dictionary (without the token), or None if not found.
+        Queued jobs also have queue_position and eta_seconds.
+    """
+    return await asyncio.to_thread(_load_job, job_id)
+
+
+def _execute_sql(sql: str, params: tuple) -> None:
+    _db().execute(sql, params)
+
+
+def _load_job(job_id: str) -> Optional[dict]:
+    conn = _db()
+    row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        return None
+    job = {
+        "job_id": row["id"],
+        "status": row["status"],  # queued | running | succeeded | failed
+        "owner": row["owner"],
+        "repo": row["repo"],
+        "workflow_id": row["workflow_id"],
+        "ref": row["ref"],
+        "inputs": json.loads(row["inputs"]),
+        "username": row["username"],
+        "attempts": row["attempts"],
+        "created_at": _isoformat(row["created_at"]),
+        "updated_at": _isoformat(row["updated_at"]),
+        "result": json.loads(row["result"]) if row["result"] else None,
+        "error": row["error"]
+    }
+    if row["status"] == "queued":
+        # Задачи выполняются в порядке создания; ожидание оцениваем по лимитам запусков в репозиторий
+        ahead = conn.execute(
+            "SELECT COUNT(*) AS total, SUM(owner = ? AND repo = ?) AS same_repo FROM jobs "
+            "WHERE status IN ('queued', 'running') AND created_at < ?",
+            (row["owner"], row["repo"], row["created_at"])
+        ).fetchone()
+        eta = max(
+            row["next_attempt_at"] - time.time(),
+            dispatch_pacer.estimate_wait(row["owner"], row["repo"], ahead=ahead["same_repo"] or 0)
+        )
+        job["queue_position"] = ahead["total"] + 1
+        job["eta_seconds"] = round(max(eta, 0.0), 1)
+    return job
+
+
+async def start_workers(count: int) -> None:
+    """Recover interrupted jobs and start the worker pool"""
+    global _wakeup
+    recovered = await asyncio.to_thread(_recover)
+    if recovered:
+        logger.warning(f"Recovered {recovered} interrupted dispatch jobs")
+
+    _wakeup = asyncio.Event()
+    for _ in range(max(count, 1)):
+        _workers.append(asyncio.create_task(_worker()))
+    logger.info(f"Started {len(_workers)} dispatch workers")
+
+
+def _recover() -> int:
+    """Requeue jobs interrupted by a restart and drop old finished jobs"""
+    conn = _db()
+    now = time.time()
+    # Задачи, прерванные перезапуском, выполняем заново
+    recovered = conn.execute(
+        "UPDATE jobs SET status = 'queued', next_attempt_at = ?, updated_at = ? WHERE status = 'running'",
+        (now, now)
+    ).rowcount
+    conn.execute(
+        "DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND updated_at < ?",
+        (now - JOB_RETENTION,)
+    )
+    return recovered
+
+
+async def stop_workers() -> None:
+    """Stop the worker pool; running jobs are retried after restart"""
+    global _wakeup
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    _wakeup = None
+
+
+async def process_next() -> bool:
+    """
+    Perform the next due job, if any
+
+    Returns:
+        True if a job was processed
+    """
+    job = await asyncio.to_thread(_claim_next)
+    if job is None:
+        return False
+    # Темп задает dispatch_pacer внутри trigger_workflow (по токену и репозиторию)
+    await _run_job(job)
+    return True
+
+
+async def _worker() -> None:
+    while True:
+        try:
+            if await process_next():
+                continue
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Dispatch worker error: {str(e)}", exc_info=True)
+
+        # Очередь пуста - ждем новую задачу или время повтора
+        _wakeup.clear()
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=IDLE_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+def _claim_next() -> Optional[dict]:
+    """Take the oldest due job and mark it as running"""
+    conn = _db()
+    now = time.time()
+    # Под блокировкой между SELECT и UPDATE - другие workers не возьмут ту же задачу
+    with _claim_lock:
+        row = conn.execute(
+            "SELECT * FROM jobs WHERE status = 'queued' AND next_attempt_at <= ? ORDER BY created_at LIMIT 1",
+            (now,)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+            (now, row["id"])
+        )
+    job = dict(row)
+    job["attempts"] += 1
+    return job
+
+
+async def _run_job(job: dict) -> None:
+    """Perform the dispatch and record the outcome"""
+    try:
+        result = await _execute(job)
+    except OutboundSaturatedError as e:
+        # Перегрузка - откладываем, как при лимитах GitHub
+        result = {"success": False, "status_code": e.status_code, "message": str(e), "retry_after": e.retry_after}
+    except Exception as e:
+        logger.warning(f"Dispatch {job['id']} attempt {job['attempts']} failed: {str(e)}")
+        result = {"success": False, "status_code": None, "message": str(e)}
+    await asyncio.to_thread(_finish, job, result)
+
+
+def _finish(job: dict, result: dict) -> None:
+    """Store the outcome of an attempt: postpone, schedule a retry or finish the job"""
+    job_id = job["id"]
+    retryable = not result["success"] and (
+        result.get("status_code") is None or result["status_code"] in RETRYABLE_STATUS_CODES
+    )
+    now = time.time()
+    conn = _db()
+    if "retry_after" in result:
+        # Запуск отложен из-за лимитов - это не неудачная попытка
+        delay = float(result["retry_after"])
+        conn.execute(
+            "UPDATE jobs SET status = 'queued', attempts = attempts - 1, next_attempt_at = ?, updated_at = ?, "
+            "error = ? WHERE id = ?",
+            (now + delay, now, result["message"], job_id)
+        )
+        logger.info(f"Dispatch {job_id} is rate-limited, postponed for {delay:.0f}s")
+        return
+    if retryable and job["attempts"] < config.DISPATCH_MAX_ATTEMPTS:
+        delay = min(RETRY_BASE_DELAY * 2 ** (job["attempts"] - 1), RETRY_MAX_DELAY)
+        conn.execute(
+            "UPDATE jobs SET status = 'queued', next_attempt_at = ?, updated_at = ?, error = ? WHERE id = ?",
+            (now + delay, now, result["message"], job_id)
+        )
+        logger.info(f"Dispatch {job_id} will be retried in {delay:.0f}s")
+        return
+
+    status = "succeeded" if result["success"] else "failed"
+    conn.execute(
+        "UPDATE jobs SET status = ?, token = NULL, updated_at = ?, result = ?, error = ? WHERE id = ?",
+        (status, now, json.dumps(result), None if result["success"] else result["message"], job_id)
+    )
+    logger.info(f"Dispatch {job_id} {status} after {job['attempts']} attempt(s)")
+
+
+async def _execute(job: dict) -> dict:
+    """Check permission and dispatch the workflow of a job"""
+    # Состав команды и права могли измениться, пока задача ждала в очереди
+    return await dispatcher.dispatch_workflow(
+        job["owner"],
+        job["repo"],
+        job["workflow_id"],
+        job["ref"],
+        json.loads(job["inputs"]),
+        job["username"],
+        decrypt_token(job["token"]),
+        user_id=job["user_id"],
+        # Не занимаем worker надолго: при нехватке слотов задача откладывается
+        priority=dispatch_pacer.BULK,
+        max_wait=config.DISPATCH_MAX_WAIT
+    )
+
+
+def _isoformat(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
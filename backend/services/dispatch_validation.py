@@ -0,0 +1,124 @@
+"""
+Validation of workflow dispatches before they are sent to GitHub
+
+GitHub rejects dispatches with unknown inputs, missing required inputs, bad
+choice values or a non-existent ref with 422 - but only after the permission
+check and token mint. Dispatches are checked locally against the cached
+workflow input schema and branch list instead, and input values are coerced
+to the form GitHub expects (booleans as "true"/"false", numbers, choices).
+"""
+import logging
+from typing import List
+
+import config
+from backend.services import branches, workflow_info
+
+logger = logging.getLogger(__name__)
+
+_TRUE_VALUES = {"true", "1", "yes", "on"}
+_FALSE_VALUES = {"false", "0", "no", "off"}
+
+
+class DispatchValidationError(Exception):
+    """Dispatch would be rejected by GitHub"""
+
+    def __init__(self, workflow_id: str, errors: List[str]):
+        self.errors = errors
+        super().__init__(f"Invalid dispatch of {workflow_id}: " + "; ".join(errors))
+
+
+async def validate_dispatch(owner: str, repo: str, workflow_id: str, ref: str, inputs: dict) -> dict:
+    """
+    Check a dispatch against the workflow input schema and the repository refs
+
+    If the schema or the refs can't be loaded, the dispatch is let through
+    unchanged and GitHub validates it.
+
+    Args:
+        owner: Repository owner
+        repo: Repository name
+        workflow_id: Workflow ID
+        ref: Branch or tag to run the workflow on
+        inputs: Workflow inputs
+
+    Returns:
+        Inputs with coerced values
+
+    Raises:
+        DispatchValidationError: with all problems found
+    """
+    inputs = dict(inputs or {})
+    errors = []
+
+    try:
+        info = await workflow_info.get_workflow_info(owner, repo, workflow_id)
+    except Exception as e:
+        logger.warning(f"Skipping input validation of {owner}/{repo}/{workflow_id}: {str(e)}")
+        info = None
+
+    if info is not None:
+        if not info.get("found"):
+            raise DispatchValidationError(workflow_id, [f"workflow not found in {owner}/{repo}"])
+        if not info.get("has_workflow_dispatch"):
+            raise DispatchValidationError(workflow_id, ["workflow has no workflow_dispatch trigger"])
+        inputs = _validate_inputs(info.get("inputs") or {}, inputs, errors)
+
+    try:
+        if not await branches.ref_exists(owner, repo, ref):
+            errors.append(f"ref '{ref}' not found in {owner}/{repo}")
+    except Exception as e:
+        logger.warning(f"Skipping ref validation of {owner}/{repo}@{ref}: {str(e)}")
+
+    if errors:
+        raise DispatchValidationError(workflow_id, errors)
+    return inputs
+
+
+def _validate_inputs(schema: dict, inputs: dict, errors: List[str]) -> dict:
+    # Input с correlation ID заполняет trigger_workflow уже после проверки
+    correlation_input = config.RUN_CORRELATION_INPUT
+    coerced = {}
+    for name, value in inputs.items():
+        if correlation_input and name == correlation_input:
+            coerced[name] = value
+            continue
+        spec = schema.get(name)
+        if spec is None:
+            errors.append(f"unexpected input '{name}'")
+            continue
+        input_type = spec.get("type", "string")
+
+        if input_type == "boolean":
+            text = str(value).strip().lower()
+            if text in _TRUE_VALUES:
+                coerced[name] = "true"
+            elif text in _FALSE_VALUES:
+                coerced[name] = "false"
+            else:
+                errors.append(f"input '{name}' must be a boolean, got '{value}'")
+        elif input_type == "number":
+            text = str(value).strip()
+            try:
+                float(text)
+            except ValueError:
+                errors.append(f"input '{name}' must be a number, got '{value}'")
+            else:
+                coerced[name] = text
+        elif input_type == "choice":
+            options = [str(option) for option in spec.get("options") or []]
+            if str(value) not in options:
+                errors.append(f"input '{name}' must be one of {', '.join(options)}, got '{value}'")
+            else:
+                coerced[name] = str(value)
+        elif isinstance(value, (bool, int, float)):
+            coerced[name] = str(value).lower() if isinstance(value, bool) else str(value)
+        else:
+            coerced[name] = value
+
+    for name, spec in schema.items():
+        if correlation_input and name == correlation_input:
+            continue
+        # Обязательный input без default GitHub не примет
+        if spec.get("required") and name not in inputs and spec.get("default") in (None, ""):
+            errors.append(f"missing required input '{name}'")
+    return coerced
@@ -0,0 +1,127 @@
+"""
+Workflow dispatch pipeline shared by the API, the web form and the dispatch queue
+
+A dispatch goes through the same steps wherever it comes from: team trigger
+rules, the collaborator permission check (while the dispatch token is minted),
+the dispatch itself, mapping GitHub's refusal of optimistic dispatches, and
+registering the trigger so its run is looked up and recorded in the history.
+"""
+import asyncio
+import logging
+from typing import Optional
+
+import config
+from backend.services import dispatch_pacer, run_tracker, team_rules
+from backend.services.permissions import (
+    check_repository_access, is_optimistic_dispatch, map_dispatch_denial, not_collaborator_message
+)
+from backend.services.workflow import trigger_workflow, prefetch_auth_token
+
+logger = logging.getLogger(__name__)
+
+
+async def check_trigger_access(
+    owner: str,
+    repo: str,
+    username: str,
+    access_token: str,
+    user_id: Optional[int] = None
+) -> Optional[dict]:
+    """
+    Check that the user may trigger workflows in the repository
+
+    With OPTIMISTIC_DISPATCH the check is left to GitHub (see map_dispatch_denial).
+    Otherwise the dispatch token is minted while the check runs.
+
+    Returns:
+        None if the dispatch may go ahead, otherwise a failed result
+        (success=False, status_code=403, message)
+    """
+    if not config.CHECK_PERMISSIONS:
+        return None
+    if is_optimistic_dispatch():
+        logger.info(f"Optimistic dispatch: permissions of {username} in {owner}/{repo} are checked by GitHub")
+        return None
+
+    user_token = access_token if config.USE_USER_TOKEN_FOR_WORKFLOWS else None
+    has_access, _ = await asyncio.gather(
+        check_repository_access(owner, repo, access_token, user_id),
+        prefetch_auth_token(user_token)
+    )
+    logger.info(f"Checking permissions for user {username} in {owner}/{repo}: has_access={has_access}")
+    if has_access:
+        return None
+    return {"success": False, "status_code": 403, "message": not_collaborator_message(username, owner, repo)}
+
+
+async def dispatch_workflow(
+    owner: str,
+    repo: str,
+    workflow_id: str,
+    ref: str,
+    inputs: dict,
+    username: str,
+    access_token: str,
+    user_id: Optional[int] = None,
+    priority: int = dispatch_pacer.INTERACTIVE,
+    max_wait: Optional[float] = None,
+    check_access: bool = True
+) -> dict:
+    """
+    Check the user's right to dispatch, trigger the workflow and start looking for its run
+
+    Args:
+        owner: Repository owner
+        repo: Repository name
+        workflow_id: Workflow ID
+        ref: Branch to run the workflow on
+        inputs: Workflow inputs (already validated)
+        username: Login of the user triggering the workflow
+        access_token: User OAuth token (permission check and, if configured, the dispatch itself)
+        user_id: GitHub user ID (from the session), the key of cached permissions
+        priority: Dispatch priority for pacing (dispatch_pacer.INTERACTIVE or BULK)
+        max_wait: Maximum time to wait for a dispatch slot in seconds, None to wait as long as needed
+        check_access: False if the caller has already checked permissions (e.g. once per batch)
+
+    Returns:
+        trigger_workflow result; on success it also contains trigger_id.
+        Team rule and permission denials are failed results with status_code 403.
+    """
+    # Правила команд проверяются по локальным снимкам составов, без обращений к GitHub
+    if not team_rules.is_allowed(username, owner, repo, workflow_id):
+        message = team_rules.denial_message(username, owner, repo, workflow_id)
+        logger.info(message)
+        return {"success": False, "status_code": 403, "message": message}
+
+    if check_access:
+        denial = await check_trigger_access(owner, repo, username, access_token, user_id)
+        if denial is not None:
+            return denial
+
+    user_token = access_token if config.USE_USER_TOKEN_FOR_WORKFLOWS else None
+    logger.info(f"Triggering workflow: {owner}/{repo}/{workflow_id} on {ref} with inputs: {inputs}")
+    result = await trigger_workflow(
+        owner=owner,
+        repo=repo,
+        workflow_id=workflow_id,
+        inputs=inputs,
+        ref=ref,
+        user_token=user_token,
+        correlation_input=config.RUN_CORRELATION_INPUT or None,
+        priority=priority,
+        max_wait=max_wait
+    )
+    if is_optimistic_dispatch():
+        result = map_dispatch_denial(result, username, owner, repo)
+
+    if result["success"]:
+        # Start looking for the run on the server side
+        trigger = run_tracker.register_trigger(
+            owner, repo, workflow_id, ref, result["trigger_time"],
+            username=username,
+            user_token=user_token,
+            correlation_id=result.get("correlation_id"),
+            inputs=inputs
+        )
+        result["trigger_id"] = trigger.trigger_id
+    return result
@@ -4,9 +4,31 @@ Based on: https://stackoverflow.com/questions/74892481/how-to-authenticate-a-git
 """
 import os
 import time
+import asyncio
+import hashlib
 import jwt
 import httpx
+from datetime import datetime
 from pathlib import Path
+from typing import Dict, Tuple
+from backend.services.cache import get as cache_get, set as cache_set
+from backend.services.github_client import get_client
+from backend.services import metrics, offload
+
+# Installation tokens live for 1 hour; refresh them this many seconds before expiry
+TOKEN_REFRESH_MARGIN = 300
+
+# Fallback TTL for cached installation tokens if GitHub doesn't return expires_at
+TOKEN_CACHE_TTL = 3000
+
+# App JWTs are valid for 10 minutes; the same JWT is reused for this long (seconds)
+APP_JWT_REUSE_TTL = 480
+
+# Signed app JWTs: {(app_id, key fingerprint): (jwt, reuse until)}
+_app_jwts: Dict[Tuple[str, str], Tuple[str, float]] = {}
+
+# In-flight token requests, so concurrent callers share one mint
+_pending_mints: Dict[str, asyncio.Task] = {}
 
 
 def load_private_key(key_path: str = None) -> str:
@@ -73,15 +95,79 @@ def generate_jwt(app_id: str, private_key: str) -> str:
         raise
 
 
+async def get_app_jwt(app_id: str, private_key: str) -> str:
+    """
+    Get a JWT for GitHub App authentication, reusing a recently signed one
+    
+    RS256 signing is CPU-bound, so it runs in the offload thread pool.
+    
+    Args:
+        app_id: GitHub App ID
+        private_key: Private key content (PEM format)
+        
+    Returns:
+        JWT token string
+    """
+    key = (str(app_id), hashlib.sha256(private_key.encode("utf-8")).hexdigest()[:16])
+    entry = _app_jwts.get(key)
+    if entry is not None and time.monotonic() < entry[1]:
+        return entry[0]
+    
+    token = await offload.run("jwt", generate_jwt, app_id, private_key)
+    _app_jwts[key] = (token, time.monotonic() + APP_JWT_REUSE_TTL)
+    return token
+
+
+def clear_jwt_cache() -> None:
+    """Forget all reused app JWTs"""
+    _app_jwts.clear()
+
+
 async def get_installation_token(app_id: str, installation_id: str, private_key: str) -> str:
     """
     Get installation access token from GitHub API
     
+    Tokens are cached until shortly before they expire, and concurrent callers
+    on a cold cache share a single request instead of minting one each.
+    
     Args:
         app_id: GitHub App ID
         installation_id: Installation ID
         private_key: Private key content (PEM format)
         
+    Returns:
+        Installation access token
+    """
+    cache_key = f"installation_token:{app_id}:{installation_id}"
+    token = cache_get(cache_key)
+    if token is not None:
+        return token
+    
+    task = _pending_mints.get(cache_key)
+    if task is None or task.get_loop() is not asyncio.get_running_loop():
+        task = asyncio.ensure_future(_mint_installation_token(app_id, installation_id, private_key, cache_key))
+        _pending_mints[cache_key] = task
+        
+        def _forget(done_task, key=cache_key):
+            if _pending_mints.get(key) is done_task:
+                del _pending_mints[key]
+        
+        task.add_done_callback(_forget)
+    
+    # Shield the shared request so one cancelled caller doesn't cancel it for everybody
+    return await asyncio.shield(task)
+
+
+async def _mint_installation_token(app_id: str, installation_id: str, private_key: str, cache_key: str) -> str:
+    """
+    Request a new installation access token from GitHub and cache it
+    
+    Args:
+        app_id: GitHub App ID
+        installation_id: Installation ID
+        private_key: Private key content (PEM format)
+        cache_key: Cache key to store the token under
+        
     Returns:
         Installation access token
     """
@@ -91,7 +177,7 @@ async def get_installation_token(app_id: str, installation_id: str, private_key:
     try:
         # Generate JWT
         logger.info(f"Generating JWT for App ID: {app_id}, Installation ID: {installation_id}")
-        jwt_token = generate_jwt(app_id, private_key)
+        jwt_token = await get_app_jwt(app_id, private_key)
         logger.debug(f"JWT token generated: {jwt_token[:50]}...")
         
         # Request installation token
@@ -101,22 +187,34 @@ async def get_installation_token(app_id: str, installation_id: str, private_key:
             "Accept": "application/vnd.github.v3+json"
         }
         
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, headers=headers)
-            if response.status_code != 201:
-                error_text = response.text
-                logger.error(f"Failed to get installation token: {response.status_code} - {error_text}")
-                try:
-                    error_json = response.json()
-                    error_msg = error_json.get("message", error_text)
-                    logger.error(f"GitHub API error: {error_msg}")
-                except:
-                    pass
-                response.raise_for_status()
-            data = response.json()
-            logger.info("Installation token obtained successfully")
-            return data["token"]
+        client = get_client()
+        response = await client.post(url, headers=headers)
+        if response.status_code != 201:
+            error_text = response.text
+            logger.error(f"Failed to get installation token: {response.status_code} - {error_text}")
+            try:
+                error_json = response.json()
+                error_msg = error_json.get("message", error_text)
+                logger.error(f"GitHub API error: {error_msg}")
+            except:
+                pass
+            response.raise_for_status()
+        data = response.json()
+        
+        ttl = TOKEN_CACHE_TTL
+        expires_at = data.get("expires_at")
+        if expires_at:
+            try:
+                expires_ts = datetime.fromisoformat(expires_at.replace('Z', '+00:00')).timestamp()
+                ttl = max(0, int(expires_ts - time.time()) - TOKEN_REFRESH_MARGIN)
+            except (ValueError, TypeError):
+                pass
+        if ttl > 0:
+            cache_set(cache_key, data["token"], ttl)
+        metrics.inc("github_token_mints_total", kind="installation")
+        
+        logger.info("Installation token obtained successfully")
+        return data["token"]
     except Exception as e:
         logger.error(f"Error getting installation token: {str(e)}", exc_info=True)
         raise
-
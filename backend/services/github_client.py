@@ -0,0 +1,138 @@
+"""
+Shared HTTP client for GitHub API calls
+Keeps one connection pool per event loop instead of opening a new client for every call
+"""
+import re
+import time
+import asyncio
+import logging
+from typing import Optional
+import httpx
+
+from backend.services import metrics, request_context
+from backend.services.outbound_limits import LimitedTransport
+
+logger = logging.getLogger(__name__)
+
+# Default timeout for GitHub API calls (seconds)
+DEFAULT_TIMEOUT = 30.0
+
+# Connection pool limits
+MAX_CONNECTIONS = 100
+MAX_KEEPALIVE_CONNECTIONS = 20
+
+# Endpoint classes of GitHub API paths for metrics (first match wins)
+_ENDPOINT_CLASSES = [
+    (re.compile(r"/dispatches$"), "workflow_dispatch"),
+    (re.compile(r"/actions/runs/[^/]+/jobs$"), "run_jobs"),
+    (re.compile(r"/actions/jobs/[^/]+/logs$"), "job_logs"),
+    (re.compile(r"/actions/(workflows/[^/]+/)?runs(/[^/]+)?$"), "workflow_runs"),
+    (re.compile(r"/actions/workflows(/[^/]+)?$"), "workflows"),
+    (re.compile(r"^/repos/[^/]+/[^/]+/branches"), "branches"),
+    (re.compile(r"^/repos/[^/]+/[^/]+/commits/"), "commits"),
+    (re.compile(r"^/repos/[^/]+/[^/]+/contents/"), "contents"),
+    (re.compile(r"^/repos/[^/]+/[^/]+$"), "repository"),
+    (re.compile(r"^/orgs/[^/]+/teams/[^/]+/members$"), "team_members"),
+    (re.compile(r"^/app/installations/[^/]+/access_tokens$"), "installation_token"),
+    (re.compile(r"^/app$"), "app"),
+    (re.compile(r"^/graphql$"), "graphql"),
+    (re.compile(r"^/user$"), "user"),
+    (re.compile(r"^/login/oauth/"), "oauth"),
+]
+
+_client: Optional[httpx.AsyncClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Get the shared AsyncClient for the running event loop
+
+    A client is bound to the loop it was created in, so a new one is created
+    if the loop changed (e.g. in tests) or the previous client was closed.
+    Requests go through the outbound concurrency limits (see outbound_limits).
+
+    Returns:
+        Shared httpx.AsyncClient instance
+    """
+    global _client, _client_loop
+
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        transport = httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS
+            )
+        )
+        _client = httpx.AsyncClient(
+            timeout=DEFAULT_TIMEOUT,
+            transport=LimitedTransport(transport),
+            event_hooks={"request": [_on_request], "response": [_on_response]}
+        )
+        _client_loop = loop
+        logger.debug("Created shared GitHub HTTP client")
+    return _client
+
+
+async def _on_request(request: httpx.Request) -> None:
+    request.extensions["started_at"] = time.perf_counter()
+
+
+async def _on_response(response: httpx.Response) -> None:
+    request = response.request
+    endpoint = endpoint_class(request.url)
+    metrics.inc("github_requests_total", endpoint=endpoint, method=request.method, status=response.status_code)
+    
+    # Время до получения заголовков ответа
+    started_at = request.extensions.get("started_at")
+    if started_at is not None:
+        duration = time.perf_counter() - started_at
+        metrics.observe("github_request_duration_seconds", duration, endpoint=endpoint)
+        request_context.record_upstream_call(duration, endpoint)
+    
+    remaining = response.headers.get("x-ratelimit-remaining")
+    if remaining is not None and remaining.isdigit():
+        metrics.set_gauge(
+            "github_rate_limit_remaining", int(remaining),
+            token_type=token_type(request.headers.get("Authorization")),
+            resource=response.headers.get("x-ratelimit-resource", "core")
+        )
+
+
+def endpoint_class(url: httpx.URL) -> str:
+    """Endpoint class of a GitHub URL for metrics (e.g. workflow_dispatch, branches)"""
+    if url.host not in ("api.github.com", "github.com"):
+        # Например, редирект на хранилище логов
+        return "external"
+    for pattern, name in _ENDPOINT_CLASSES:
+        if pattern.search(url.path):
+            return name
+    return "other"
+
+
+def token_type(authorization: Optional[str]) -> str:
+    """Kind of token in an Authorization header (for rate limit metrics), never the token itself"""
+    if not authorization:
+        return "anonymous"
+    token = authorization.split(" ", 1)[-1]
+    if token.startswith("ghs_"):
+        return "installation"
+    if token.startswith(("gho_", "ghu_")):
+        return "user"
+    if authorization.lower().startswith("bearer ") and token.count(".") == 2:
+        return "app_jwt"
+    return "other"
+
+
+async def close_client() -> None:
+    """Close the shared client (called on application shutdown)"""
+    global _client, _client_loop
+
+    if _client is not None and not _client.is_closed:
+        try:
+            await _client.aclose()
+        except Exception as e:
+            logger.warning(f"Error closing shared GitHub HTTP client: {str(e)}")
+    _client = None
+    _client_loop = None
@@ -2,10 +2,14 @@
 GitHub OAuth service for user authentication
 """
 import os
+import time
+import hashlib
 import logging
 import httpx
+from typing import Dict, Tuple
 from urllib.parse import urlencode
 import config
+from backend.services.github_client import get_client
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +18,15 @@ GITHUB_AUTH_URL = "https://github.com/login/oauth/authorize"
 GITHUB_TOKEN_URL = "https://github.com/login/oauth/access_token"
 GITHUB_API_URL = "https://api.github.com/user"
 
+# How long user info is reused for the same token (seconds)
+IDENTITY_CACHE_TTL = 600
+
+# Maximum number of cached identities
+MAX_CACHED_IDENTITIES = 1000
+
+# Cached user info: {token hash: (user info, expiry)}
+_identities: Dict[str, Tuple[dict, float]] = {}
+
 
 def get_oauth_url(state: str = None) -> str:
     """
@@ -81,33 +94,33 @@ async def get_access_token(code: str) -> str:
     }
     
     try:
-        async with httpx.AsyncClient() as client:
-            logger.debug(f"POST to {GITHUB_TOKEN_URL} with data: client_id={client_id[:10]}..., code={code[:10]}...")
-            response = await client.post(GITHUB_TOKEN_URL, data=data, headers=headers)
-            
-            logger.info(f"GitHub token response status: {response.status_code}")
-            
-            if response.status_code != 200:
-                error_text = response.text
-                logger.error(f"GitHub API error ({response.status_code}): {error_text}")
-                try:
-                    error_json = response.json()
-                    error_msg = error_json.get("error_description", error_json.get("error", error_text))
-                    raise ValueError(f"GitHub API error: {error_msg}")
-                except:
-                    raise ValueError(f"GitHub API error ({response.status_code}): {error_text}")
-            
-            result = response.json()
-            logger.debug(f"GitHub response keys: {list(result.keys())}")
-            
-            if "access_token" not in result:
-                error_msg = result.get("error_description", result.get("error", "Unknown error"))
-                logger.error(f"GitHub did not return access_token: {error_msg}")
-                logger.error(f"Full response: {result}")
-                raise ValueError(f"GitHub did not return access_token: {error_msg}")
-            
-            logger.info("Access token obtained successfully")
-            return result["access_token"]
+        client = get_client()
+        logger.debug(f"POST to {GITHUB_TOKEN_URL} with data: client_id={client_id[:10]}..., code={code[:10]}...")
+        response = await client.post(GITHUB_TOKEN_URL, data=data, headers=headers)
+        
+        logger.info(f"GitHub token response status: {response.status_code}")
+        
+        if response.status_code != 200:
+            error_text = response.text
+            logger.error(f"GitHub API error ({response.status_code}): {error_text}")
+            try:
+                error_json = response.json()
+                error_msg = error_json.get("error_description", error_json.get("error", error_text))
+                raise ValueError(f"GitHub API error: {error_msg}")
+            except:
+                raise ValueError(f"GitHub API error ({response.status_code}): {error_text}")
+        
+        result = response.json()
+        logger.debug(f"GitHub response keys: {list(result.keys())}")
+        
+        if "access_token" not in result:
+            error_msg = result.get("error_description", result.get("error", "Unknown error"))
+            logger.error(f"GitHub did not return access_token: {error_msg}")
+            logger.error(f"Full response: {result}")
+            raise ValueError(f"GitHub did not return access_token: {error_msg}")
+        
+        logger.info("Access token obtained successfully")
+        return result["access_token"]
     except httpx.HTTPError as e:
         logger.error(f"HTTP error while exchanging code for token: {str(e)}", exc_info=True)
         raise ValueError(f"HTTP error: {str(e)}")
@@ -120,33 +133,63 @@ async def get_user_info(access_token: str) -> dict:
     """
     Get authenticated user information from GitHub
     
+    User info is cached by token for IDENTITY_CACHE_TTL, so a login that
+    returns a token already seen (e.g. repeated login) doesn't fetch it again.
+    
     Args:
         access_token: GitHub OAuth access token
         
     Returns:
         User information dictionary
     """
+    key = _token_key(access_token)
+    entry = _identities.get(key)
+    if entry is not None:
+        user_info, expires_at = entry
+        if time.monotonic() < expires_at:
+            logger.info(f"Using cached user info: login={user_info.get('login')}")
+            return user_info
+        del _identities[key]
+    
     headers = {
         "Authorization": f"token {access_token}",
         "Accept": "application/vnd.github.v3+json"
     }
     
     try:
-        async with httpx.AsyncClient() as client:
-            logger.debug(f"GET {GITHUB_API_URL} with token: {access_token[:10]}...")
-            response = await client.get(GITHUB_API_URL, headers=headers)
-            
-            if response.status_code != 200:
-                logger.error(f"GitHub API error getting user info: {response.status_code} - {response.text}")
-                response.raise_for_status()
-            
-            user_info = response.json()
-            logger.info(f"User info retrieved: login={user_info.get('login')}, id={user_info.get('id')}")
-            return user_info
+        client = get_client()
+        logger.debug(f"GET {GITHUB_API_URL} with token: {access_token[:10]}...")
+        response = await client.get(GITHUB_API_URL, headers=headers)
+        
+        if response.status_code != 200:
+            logger.error(f"GitHub API error getting user info: {response.status_code} - {response.text}")
+            response.raise_for_status()
+        
+        user_info = response.json()
+        logger.info(f"User info retrieved: login={user_info.get('login')}, id={user_info.get('id')}")
     except httpx.HTTPError as e:
         logger.error(f"HTTP error while getting user info: {str(e)}", exc_info=True)
         raise
     except Exception as e:
         logger.error(f"Unexpected error while getting user info: {str(e)}", exc_info=True)
         raise
+    
+    if len(_identities) >= MAX_CACHED_IDENTITIES:
+        _identities.clear()
+    _identities[key] = (user_info, time.monotonic() + IDENTITY_CACHE_TTL)
+    return user_info
+
+
+def forget_token(access_token: str) -> None:
+    """Drop cached user info of a token (on logout)"""
+    _identities.pop(_token_key(access_token), None)
+
+
+def clear_identity_cache() -> None:
+    """Forget all cached user info"""
+    _identities.clear()
+
 
+def _token_key(access_token: str) -> str:
+    # Сами токены в памяти не держим
+    return hashlib.sha256(access_token.encode("utf-8")).hexdigest()
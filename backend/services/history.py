@@ -0,0 +1,267 @@
+"""
+Local history of workflow triggers and their runs
+
+Every successful dispatch is stored in a local SQLite database together with
+the run it was matched with and the run outcome, so /api/history answers
+"what did I trigger and how did it end" without calling GitHub.
+
+Run status is updated by the run tracker (run found), the run follower (while
+someone watches the run) and a background sync that checks unfinished runs.
+Nothing is recorded unless HISTORY_ENABLED is set.
+"""
+import json
+import base64
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import config
+from backend.services import db
+from backend.services.workflow import get_auth_token, get_workflow_run
+
+logger = logging.getLogger(__name__)
+
+DB_NAME = "history"
+
+# Runs not finished within this time after the trigger are no longer synced (seconds)
+SYNC_WINDOW = 24 * 3600
+
+# Runs checked at once by the sync (keeps it from filling the outbound GitHub call queue)
+SYNC_CONCURRENCY = 5
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS triggers (
+    trigger_id TEXT PRIMARY KEY,
+    username TEXT,
+    owner TEXT NOT NULL,
+    repo TEXT NOT NULL,
+    workflow_id TEXT NOT NULL,
+    ref TEXT,
+    inputs TEXT NOT NULL,
+    trigger_time TEXT NOT NULL,
+    trigger_ts REAL NOT NULL,
+    correlation_id TEXT,
+    run_id INTEGER,
+    run_url TEXT,
+    status TEXT,
+    conclusion TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS triggers_user_time ON triggers (username, trigger_ts DESC, trigger_id DESC);
+CREATE INDEX IF NOT EXISTS triggers_repo_time ON triggers (owner, repo, trigger_ts DESC, trigger_id DESC);
+CREATE INDEX IF NOT EXISTS triggers_run ON triggers (owner, repo, run_id);
+"""
+
+_sync_task: Optional[asyncio.Task] = None
+
+
+class InvalidCursorError(ValueError):
+    """Pagination cursor is malformed"""
+
+
+def _db():
+    return db.connect(DB_NAME, schema=_SCHEMA)
+
+
+def record_trigger(
+    trigger_id: str,
+    owner: str,
+    repo: str,
+    workflow_id: str,
+    ref: Optional[str],
+    inputs: Optional[dict],
+    trigger_time: datetime,
+    username: Optional[str] = None,
+    correlation_id: Optional[str] = None
+) -> None:
+    """Store a successful dispatch"""
+    if not config.HISTORY_ENABLED:
+        return
+    now = time.time()
+    _db().execute(
+        "INSERT OR REPLACE INTO triggers (trigger_id, username, owner, repo, workflow_id, ref, inputs, "
+        "trigger_time, trigger_ts, correlation_id, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (trigger_id, username, owner, repo, workflow_id, ref, json.dumps(inputs or {}),
+         trigger_time.isoformat(), trigger_time.timestamp(), correlation_id, now)
+    )
+
+
+def record_run(trigger_id: str, run_id: int, run_url: Optional[str], status: Optional[str], conclusion: Optional[str]) -> None:
+    """Store the run a trigger was matched with"""
+    if not config.HISTORY_ENABLED:
+        return
+    _db().execute(
+        "UPDATE triggers SET run_id = ?, run_url = ?, status = ?, conclusion = ?, updated_at = ? WHERE trigger_id = ?",
+        (run_id, run_url, status, conclusion, time.time(), trigger_id)
+    )
+
+
+def record_run_status(owner: str, repo: str, run_id: int, status: Optional[str], conclusion: Optional[str]) -> int:
+    """Store current status of a run; returns number of triggers updated"""
+    if not config.HISTORY_ENABLED:
+        return 0
+    return _db().execute(
+        "UPDATE triggers SET status = ?, conclusion = ?, updated_at = ? "
+        "WHERE owner = ? AND repo = ? AND run_id = ? AND (status IS NOT ? OR conclusion IS NOT ?)",
+        (status, conclusion, time.time(), owner, repo, run_id, status, conclusion)
+    ).rowcount
+
+
+def query(
+    username: str,
+    owner: Optional[str] = None,
+    repo: Optional[str] = None,
+    workflow_id: Optional[str] = None,
+    limit: int = 20,
+    cursor: Optional[str] = None
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    Get triggers of a user, newest first
+
+    Args:
+        username: Login of the user who triggered the workflows
+        owner: Optional repository owner filter
+        repo: Optional repository name filter
+        workflow_id: Optional workflow filter
+        limit: Page size
+        cursor: Cursor of the next page returned by the previous call
+
+    Returns:
+        Tuple of (triggers, cursor of the next page or None if this is the last page)
+
+    Raises:
+        InvalidCursorError: cursor is malformed
+    """
+    conditions = ["username = ?"]
+    params: list = [username]
+    if owner:
+        conditions.append("owner = ?")
+        params.append(owner)
+    if repo:
+        conditions.append("repo = ?")
+        params.append(repo)
+    if workflow_id:
+        conditions.append("workflow_id = ?")
+        params.append(workflow_id)
+    if cursor:
+        trigger_ts, trigger_id = _decode_cursor(cursor)
+        # Keyset-пагинация: страницы стабильны при появлении новых запусков
+        conditions.append("(trigger_ts < ? OR (trigger_ts = ? AND trigger_id < ?))")
+        params.extend([trigger_ts, trigger_ts, trigger_id])
+
+    rows = _db().execute(
+        f"SELECT * FROM triggers WHERE {' AND '.join(conditions)} "
+        "ORDER BY trigger_ts DESC, trigger_id DESC LIMIT ?",
+        (*params, limit + 1)
+    ).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1]["trigger_ts"], rows[-1]["trigger_id"])
+    return [_to_dict(row) for row in rows], next_cursor
+
+
+async def sync_unfinished() -> int:
+    """
+    Update status of unfinished runs from GitHub
+
+    Every tracked run is fetched by ID (ETag-revalidated, so unchanged runs
+    answer 304): a run listing only shows the newest runs of a busy workflow.
+
+    Returns:
+        Number of triggers updated
+    """
+    rows = _db().execute(
+        "SELECT DISTINCT owner, repo, run_id FROM triggers "
+        "WHERE run_id IS NOT NULL AND (status IS NULL OR status != 'completed') AND trigger_ts > ?",
+        (time.time() - SYNC_WINDOW,)
+    ).fetchall()
+    if not rows:
+        return 0
+
+    auth_token = await get_auth_token(None)
+    semaphore = asyncio.Semaphore(SYNC_CONCURRENCY)
+
+    async def sync_run(owner: str, repo: str, run_id: int) -> int:
+        async with semaphore:
+            try:
+                run = await get_workflow_run(owner, repo, run_id, auth_token)
+            except Exception as e:
+                logger.warning(f"Failed to sync run {owner}/{repo}#{run_id}: {str(e)}")
+                return 0
+        return record_run_status(owner, repo, run_id, run.get("status"), run.get("conclusion"))
+
+    results = await asyncio.gather(*[sync_run(row["owner"], row["repo"], row["run_id"]) for row in rows])
+    return sum(results)
+
+
+async def start_sync(interval: float) -> None:
+    """Drop expired history and start the background sync of unfinished runs"""
+    global _sync_task
+    pruned = prune(config.HISTORY_RETENTION_DAYS)
+    if pruned:
+        logger.info(f"Deleted {pruned} triggers older than {config.HISTORY_RETENTION_DAYS} days from history")
+    _sync_task = asyncio.create_task(_sync_loop(interval))
+
+
+async def stop_sync() -> None:
+    """Stop the background sync"""
+    global _sync_task
+    if _sync_task is not None:
+        _sync_task.cancel()
+        await asyncio.gather(_sync_task, return_exceptions=True)
+        _sync_task = None
+
+
+async def _sync_loop(interval: float) -> None:
+    while True:
+        try:
+            updated = await sync_unfinished()
+            if updated:
+                logger.info(f"Updated status of {updated} runs in history")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"History sync failed: {str(e)}")
+        await asyncio.sleep(interval)
+
+
+def prune(retention_days: int) -> int:
+    """Delete triggers older than retention_days; returns number deleted"""
+    return _db().execute(
+        "DELETE FROM triggers WHERE trigger_ts < ?",
+        (time.time() - retention_days * 86400,)
+    ).rowcount
+
+
+def _to_dict(row) -> dict:
+    return {
+        "trigger_id": row["trigger_id"],
+        "username": row["username"],
+        "owner": row["owner"],
+        "repo": row["repo"],
+        "workflow_id": row["workflow_id"],
+        "ref": row["ref"],
+        "inputs": json.loads(row["inputs"]),
+        "trigger_time": row["trigger_time"],
+        "correlation_id": row["correlation_id"],
+        "run_id": row["run_id"],
+        "run_url": row["run_url"],
+        "status": row["status"],
+        "conclusion": row["conclusion"]
+    }
+
+
+def _encode_cursor(trigger_ts: float, trigger_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([trigger_ts, trigger_id]).encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> Tuple[float, str]:
+    try:
+        trigger_ts, trigger_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return float(trigger_ts), str(trigger_id)
+    except Exception:
+        raise InvalidCursorError("Invalid cursor")
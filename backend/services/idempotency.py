@@ -0,0 +1,157 @@
+"""
+Idempotent workflow dispatches
+
+A dispatch is remembered under a key and a repeated request with the same key
+gets the original result instead of launching another run:
+- explicit Idempotency-Key (header or idempotency_key parameter), kept for IDEMPOTENCY_KEY_TTL;
+- otherwise identical dispatches (user, repo, workflow, ref, inputs) within
+  DUPLICATE_DISPATCH_WINDOW seconds - double clicks, link previews, browser prefetch.
+
+Concurrent duplicates wait for the first dispatch instead of racing it; if
+the first request is cancelled, one of the waiting duplicates dispatches instead.
+The store is in memory and bounded (least recently used entries are evicted).
+"""
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional, Tuple
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# How long explicit idempotency keys are remembered (seconds)
+IDEMPOTENCY_KEY_TTL = 24 * 3600
+
+# Maximum number of remembered dispatches
+MAX_ENTRIES = 10000
+
+
+class IdempotencyConflictError(Exception):
+    """Idempotency key was already used for a different dispatch"""
+
+
+class _Entry:
+    def __init__(self, fingerprint: str, expires_at: float, future: asyncio.Future):
+        self.fingerprint = fingerprint
+        self.expires_at = expires_at
+        self.future = future
+
+
+# Remembered dispatches: {key: _Entry}, least recently used first
+_entries: "OrderedDict[str, _Entry]" = OrderedDict()
+
+
+async def run_once(
+    username: str,
+    owner: str,
+    repo: str,
+    workflow_id: str,
+    ref: str,
+    inputs: dict,
+    dispatch: Callable[[], Awaitable[dict]],
+    idempotency_key: Optional[str] = None
+) -> Tuple[dict, bool]:
+    """
+    Dispatch unless the same dispatch was already made
+
+    Args:
+        username: Login of the user triggering the workflow
+        owner: Repository owner
+        repo: Repository name
+        workflow_id: Workflow ID
+        ref: Branch
+        inputs: Workflow inputs
+        dispatch: Coroutine function performing the dispatch; results with
+                  success=False are not remembered, so failed dispatches can be retried
+        idempotency_key: Optional client-provided key
+
+    Returns:
+        Tuple of (result, whether it is a replay of an earlier dispatch)
+
+    Raises:
+        IdempotencyConflictError: idempotency_key was used for a different dispatch
+    """
+    fingerprint = hashlib.sha256(
+        json.dumps([owner, repo, workflow_id, ref, inputs], sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+    if idempotency_key:
+        key = f"key:{username}:{idempotency_key}"
+        ttl = IDEMPOTENCY_KEY_TTL
+    elif config.DUPLICATE_DISPATCH_WINDOW > 0:
+        key = f"auto:{username}:{fingerprint}"
+        ttl = config.DUPLICATE_DISPATCH_WINDOW
+    else:
+        return await dispatch(), False
+
+    loop = asyncio.get_running_loop()
+    while True:
+        entry = _get(key)
+        if entry is None:
+            break
+        if entry.fingerprint != fingerprint:
+            raise IdempotencyConflictError(f"Idempotency key '{idempotency_key}' was already used for a different dispatch")
+        if not entry.future.done():
+            # Незавершенный запуск из другого event loop дождаться нельзя
+            if entry.future.get_loop() is not loop:
+                break
+            # wait, в отличие от shield, не передает ждущим отмену первого запроса
+            await asyncio.wait([entry.future])
+        if entry.future.cancelled():
+            # Первый запрос отменен - запускаем сами или ждем того, кто успел раньше
+            continue
+        result = entry.future.result()
+        logger.info(f"Suppressed duplicate dispatch of {owner}/{repo}/{workflow_id} on {ref} by {username}")
+        return result, True
+
+    future = loop.create_future()
+    _put(key, _Entry(fingerprint, time.monotonic() + ttl, future))
+    try:
+        result = await dispatch()
+    except asyncio.CancelledError:
+        _forget(key, future)
+        future.cancel()
+        raise
+    except Exception as e:
+        _forget(key, future)
+        future.set_exception(e)
+        future.exception()  # Mark as retrieved: waiters (if any) get it via result()
+        raise
+
+    if result.get("success") is False:
+        _forget(key, future)
+    future.set_result(result)
+    return result, False
+
+
+def clear() -> None:
+    """Forget all remembered dispatches"""
+    _entries.clear()
+
+
+def _get(key: str) -> Optional[_Entry]:
+    entry = _entries.get(key)
+    if entry is None:
+        return None
+    if time.monotonic() > entry.expires_at:
+        del _entries[key]
+        return None
+    _entries.move_to_end(key)
+    return entry
+
+
+def _put(key: str, entry: _Entry) -> None:
+    _entries[key] = entry
+    _entries.move_to_end(key)
+    while len(_entries) > MAX_ENTRIES:
+        _entries.popitem(last=False)
+
+
+def _forget(key: str, future: asyncio.Future) -> None:
+    entry = _entries.get(key)
+    if entry is not None and entry.future is future:
+        del _entries[key]
@@ -0,0 +1,269 @@
+"""
+Tail of workflow job logs
+
+One background follower per job reads only new bytes of the log (HTTP Range
+requests) and pushes them to all viewers. Logs are never held in memory as a
+whole: each viewer gets the chunks as they arrive, plus a small backlog of the
+latest output when it joins.
+
+The log source is pluggable: GitHubLogSource reads the GitHub logs API,
+ReplayLogSource replays a local file (for tests and local development).
+
+GitHub serves a job log only once the job has finished, so for GitHub jobs
+the output arrives when the job completes, not line by line while it runs.
+"""
+import asyncio
+import codecs
+import logging
+import os
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Deque, Dict, Optional, Set, Tuple
+
+from backend.services.github_client import get_client
+from backend.services.workflow import get_auth_token
+
+logger = logging.getLogger(__name__)
+
+# Polling interval (seconds): fast while the log grows, slower while it is idle
+MIN_POLL_INTERVAL = 2.0
+MAX_POLL_INTERVAL = 10.0
+POLL_BACKOFF = 1.5
+
+# Latest output replayed to viewers joining a running tail (characters)
+BACKLOG_SIZE = 64 * 1024
+
+# Chunks queued for a single viewer; slow viewers skip the oldest chunks
+SUBSCRIBER_QUEUE_SIZE = 100
+
+# Events after which nothing more is published for a job
+TERMINAL_EVENTS = {"end"}
+
+JobKey = Tuple[str, str, int]
+
+
+class LogSource(ABC):
+    """Source of log bytes; fetch() returns new bytes after the offset"""
+
+    @abstractmethod
+    async def fetch(self, offset: int) -> Tuple[bytes, bool]:
+        """
+        Read log bytes starting at offset
+
+        Returns:
+            Tuple of (new bytes, whether the log is complete)
+        """
+
+
+class GitHubLogSource(LogSource):
+    """
+    Job log from the GitHub Actions logs API
+
+    The logs endpoint only answers once the job has completed, so while the job
+    runs only its status is polled (one call per poll). After that the log is
+    downloaded once; its size is remembered so the final poll costs no calls.
+    """
+
+    def __init__(self, owner: str, repo: str, job_id: int, user_token: Optional[str] = None):
+        self.owner = owner
+        self.repo = repo
+        self.job_id = job_id
+        self.user_token = user_token
+        self.job_completed = False
+        # Full log size in bytes, once known
+        self.size: Optional[int] = None
+
+    async def fetch(self, offset: int) -> Tuple[bytes, bool]:
+        if self.size is not None and offset >= self.size:
+            return b"", True
+
+        auth_token = await get_auth_token(self.user_token)
+        headers = {
+            "Authorization": f"token {auth_token}",
+            "Accept": "application/vnd.github.v3+json"
+        }
+        job_url = f"https://api.github.com/repos/{self.owner}/{self.repo}/actions/jobs/{self.job_id}"
+        client = get_client()
+
+        if not self.job_completed:
+            # До завершения job лог недоступен - /logs не запрашиваем
+            job_response = await client.get(job_url, headers=headers)
+            job_response.raise_for_status()
+            if job_response.json().get("status") != "completed":
+                return b"", False
+            self.job_completed = True
+
+        # GitHub отвечает редиректом на временную подписанную ссылку на лог
+        logs_response = await client.get(f"{job_url}/logs", headers=headers)
+        if logs_response.status_code == 404:
+            # Лог еще не доступен
+            return b"", False
+        if logs_response.status_code not in (301, 302, 307):
+            logs_response.raise_for_status()
+            self.size = len(logs_response.content)
+            return logs_response.content[offset:], True
+
+        # Подписанная ссылка - без токена, только новые байты
+        download_url = logs_response.headers["Location"]
+        response = await client.get(download_url, headers={"Range": f"bytes={offset}-"})
+        if response.status_code == 416:
+            self.size = offset
+            return b"", True
+        response.raise_for_status()
+        if response.status_code == 206:
+            # Content-Range: bytes <start>-<end>/<size>
+            total = response.headers.get("Content-Range", "").rpartition("/")[2]
+            self.size = int(total) if total.isdigit() else offset + len(response.content)
+            return response.content, True
+        # Range не поддержан - отдан весь лог
+        self.size = len(response.content)
+        return response.content[offset:], True
+
+
+class ReplayLogSource(LogSource):
+    """Replays a local log file in chunks, as if the log were growing"""
+
+    def __init__(self, path: str, chunk_size: int = 4096):
+        self.path = path
+        self.chunk_size = chunk_size
+
+    async def fetch(self, offset: int) -> Tuple[bytes, bool]:
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            data = f.read(self.chunk_size)
+        return data, offset + len(data) >= os.path.getsize(self.path)
+
+
+def create_source(owner: str, repo: str, job_id: int, user_token: Optional[str] = None) -> LogSource:
+    """Create the log source for a job"""
+    return GitHubLogSource(owner, repo, job_id, user_token=user_token)
+
+
+class LogTail:
+    """Log of a job followed for one or more viewers"""
+
+    def __init__(self, owner: str, repo: str, job_id: int, source: LogSource):
+        self.owner = owner
+        self.repo = repo
+        self.job_id = job_id
+        self.source = source
+        self.offset = 0
+        self.complete = False
+        # Last BACKLOG_SIZE characters of output for viewers that join later
+        self.backlog: Deque[str] = deque()
+        self.backlog_size = 0
+        # Chunks may split multi-byte characters
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.subscribers: Set[asyncio.Queue] = set()
+
+    @property
+    def key(self) -> JobKey:
+        return (self.owner, self.repo, self.job_id)
+
+    def append(self, text: str) -> None:
+        """Remember text in the bounded backlog and push it to viewers"""
+        self.backlog.append(text)
+        self.backlog_size += len(text)
+        while self.backlog_size > BACKLOG_SIZE and len(self.backlog) > 1:
+            self.backlog_size -= len(self.backlog.popleft())
+        publish(self, "log", {"text": text})
+
+
+# Followed job logs and their pollers: {(owner, repo, job_id): ...}
+_tails: Dict[JobKey, LogTail] = {}
+_followers: Dict[JobKey, asyncio.Task] = {}
+
+
+def follow(owner: str, repo: str, job_id: int, user_token: Optional[str] = None) -> Tuple[LogTail, asyncio.Queue]:
+    """
+    Subscribe to a job log, starting its follower if needed
+
+    Events are {"event": "log", "data": {"text": ...}} and a final
+    {"event": "end", "data": {}} once the job's log is complete.
+
+    Args:
+        owner: Repository owner
+        repo: Repository name
+        job_id: Workflow job ID
+        user_token: User OAuth token to read the log with, None to use the GitHub App
+
+    Returns:
+        Followed log and the subscriber queue (pass both to unfollow)
+    """
+    key = (owner, repo, job_id)
+    tail = _tails.get(key)
+    if tail is None:
+        tail = LogTail(owner, repo, job_id, create_source(owner, repo, job_id, user_token))
+        _tails[key] = tail
+
+    queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+    if tail.backlog:
+        queue.put_nowait({"event": "log", "data": {"text": "".join(tail.backlog)}})
+    tail.subscribers.add(queue)
+    _ensure_follower(key)
+    return tail, queue
+
+
+def unfollow(tail: LogTail, queue: asyncio.Queue) -> None:
+    """Stop receiving the log; the follower stops when nobody is watching"""
+    tail.subscribers.discard(queue)
+
+
+def publish(tail: LogTail, event: str, data: dict) -> None:
+    """Push an event to all viewers of the log"""
+    message = {"event": event, "data": data}
+    for queue in list(tail.subscribers):
+        if queue.full():
+            # Медленный клиент пропускает самые старые куски
+            queue.get_nowait()
+        queue.put_nowait(message)
+
+
+def _ensure_follower(key: JobKey) -> None:
+    """Start a follower for the job unless one is already running"""
+    loop = asyncio.get_running_loop()
+    task = _followers.get(key)
+    if task is not None and not task.done() and task.get_loop() is loop:
+        return
+    _followers[key] = loop.create_task(_follow(key))
+
+
+async def _follow(key: JobKey) -> None:
+    """Read new log bytes until the log is complete or nobody watches it anymore"""
+    tail = _tails[key]
+    owner, repo, job_id = key
+    interval = MIN_POLL_INTERVAL
+    logger.debug(f"Log tail started for {owner}/{repo} job {job_id}")
+
+    try:
+        while tail.subscribers:
+            try:
+                data, complete = await tail.source.fetch(tail.offset)
+            except Exception as e:
+                logger.warning(f"Failed to read log of {owner}/{repo} job {job_id}: {str(e)}")
+                data, complete = b"", False
+
+            if data:
+                tail.offset += len(data)
+                text = tail.decoder.decode(data)
+                if text:
+                    tail.append(text)
+
+            if complete and not data:
+                # Весь лог прочитан
+                text = tail.decoder.decode(b"", final=True)
+                if text:
+                    tail.append(text)
+                tail.complete = True
+                publish(tail, "end", {})
+                break
+
+            # Пока лог растет - опрашиваем часто, иначе все реже
+            interval = MIN_POLL_INTERVAL if data else min(interval * POLL_BACKOFF, MAX_POLL_INTERVAL)
+            await asyncio.sleep(interval)
+    finally:
+        if _followers.get(key) is asyncio.current_task():
+            del _followers[key]
+            if _tails.get(key) is tail:
+                del _tails[key]
+        logger.debug(f"Log tail stopped for {owner}/{repo} job {job_id}")
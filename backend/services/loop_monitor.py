@@ -0,0 +1,43 @@
+"""
+Event loop lag monitor
+
+A task wakes up every LOOP_MONITOR_INTERVAL; the delay of the wake-up is how
+long some callback held the loop. Lags above LOOP_LAG_THRESHOLD_MS are logged
+and counted, the last lag is exposed as a gauge.
+"""
+import time
+import asyncio
+import logging
+from typing import Optional
+
+from backend.services import metrics
+
+logger = logging.getLogger(__name__)
+
+_task: Optional[asyncio.Task] = None
+
+
+async def start(interval: float, threshold_ms: float) -> None:
+    """Start monitoring the running event loop"""
+    global _task
+    _task = asyncio.create_task(_monitor(interval, threshold_ms / 1000))
+
+
+async def stop() -> None:
+    """Stop the monitor"""
+    global _task
+    if _task is not None:
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
+        _task = None
+
+
+async def _monitor(interval: float, threshold: float) -> None:
+    while True:
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        lag = max(time.perf_counter() - expected, 0)
+        metrics.set_gauge("event_loop_lag_seconds", lag)
+        if lag >= threshold:
+            metrics.inc("event_loop_blocked_total")
+            logger.warning(f"Event loop was blocked for {lag * 1000:.0f}ms")
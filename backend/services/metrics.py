@@ -0,0 +1,160 @@
+"""
+In-process metrics: counters, gauges and histograms with labels
+
+Exposed in Prometheus text format by /metrics (see render).
+"""
+import threading
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# Histogram buckets for durations (seconds)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_Labels = Tuple[Tuple[str, str], ...]
+
+# Counters: {name: {labels: value}}
+_counters: Dict[str, Dict[_Labels, float]] = {}
+
+# Gauges: {name: {labels: value}}
+_gauges: Dict[str, Dict[_Labels, float]] = {}
+
+# Histograms: {name: {labels: [bucket counts..., sum, count]}}
+_histograms: Dict[str, Dict[_Labels, List[float]]] = {}
+
+# Functions returning gauge samples computed at scrape time: [(name, labels, value)]
+_collectors: List[Callable[[], Iterable[Tuple[str, dict, float]]]] = []
+
+# Descriptions of known metrics: {name: help text}
+HELP = {
+    "http_requests_total": "HTTP requests handled, by route template and status",
+    "http_request_duration_seconds": "HTTP request duration, by route template",
+    "http_request_upstream_calls_total": "GitHub calls made while handling requests, by route template",
+    "github_requests_total": "GitHub API calls, by endpoint class and status",
+    "github_request_duration_seconds": "GitHub API call duration until response headers, by endpoint class",
+    "github_rate_limit_remaining": "Last seen X-RateLimit-Remaining, by token type and rate limit resource",
+    "github_token_mints_total": "GitHub tokens minted",
+    "cache_requests_total": "Cache lookups, by key namespace and result (hit, miss)",
+    "cache_evictions_total": "Cache entries dropped, by key namespace and reason (expired, cleared)",
+    "cache_entries": "Cache entries, by key namespace",
+    "offload_tasks_total": "CPU-bound tasks run in the thread pool, by kind",
+    "offload_wait_seconds": "Time CPU-bound tasks waited for a pool thread, by kind",
+    "offload_run_seconds": "Time CPU-bound tasks ran in the pool, by kind",
+    "event_loop_lag_seconds": "Delay of the last event loop monitor wake-up",
+    "event_loop_blocked_total": "Event loop blocks longer than LOOP_LAG_THRESHOLD_MS",
+    "outbound_requests_in_flight": "GitHub calls holding a concurrency slot",
+    "outbound_queue_length": "GitHub calls waiting for a concurrency slot",
+    "outbound_wait_seconds": "Time GitHub calls waited for a concurrency slot",
+    "outbound_rejected_total": "GitHub calls rejected without a slot, by limit (global, token) and reason (queue_full, timeout)",
+    "http_requests_shed_total": "Requests answered with 503 while the GitHub call queue was full",
+}
+
+# Metrics are also updated from executor threads
+_lock = threading.Lock()
+
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    """Increase a counter"""
+    key = _labels(labels)
+    with _lock:
+        series = _counters.setdefault(name, {})
+        series[key] = series.get(key, 0) + value
+
+
+def set_gauge(name: str, value: float, **labels) -> None:
+    """Set a gauge to the current value"""
+    key = _labels(labels)
+    with _lock:
+        _gauges.setdefault(name, {})[key] = value
+
+
+def register_collector(collector: Callable[[], Iterable[Tuple[str, dict, float]]]) -> None:
+    """Register a function returning gauge samples [(name, labels, value)] computed on each scrape"""
+    _collectors.append(collector)
+
+
+def observe(name: str, value: float, **labels) -> None:
+    """Record a value (e.g. a duration in seconds) in a histogram"""
+    key = _labels(labels)
+    with _lock:
+        series = _histograms.setdefault(name, {})
+        values = series.get(key)
+        if values is None:
+            values = series[key] = [0] * (len(DEFAULT_BUCKETS) + 2)
+        for i, bound in enumerate(DEFAULT_BUCKETS):
+            if value <= bound:
+                values[i] += 1
+        values[-2] += value
+        values[-1] += 1
+
+
+def get(name: str, **labels) -> float:
+    """Current value of a counter or gauge, or number of observations of a histogram"""
+    key = _labels(labels)
+    with _lock:
+        if name in _histograms:
+            values = _histograms[name].get(key)
+            return values[-1] if values else 0
+        if name in _gauges:
+            return _gauges[name].get(key, 0)
+        return _counters.get(name, {}).get(key, 0)
+
+
+def reset() -> None:
+    """Drop all metrics"""
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
+
+
+def render() -> str:
+    """All metrics in Prometheus text exposition format"""
+    gauges: Dict[str, Dict[_Labels, float]] = {}
+    for collector in _collectors:
+        for name, labels, value in collector():
+            gauges.setdefault(name, {})[_labels(labels)] = value
+
+    lines = []
+    with _lock:
+        for name, series in sorted(_counters.items()):
+            _header(lines, name, "counter")
+            for key, value in series.items():
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+        for name, series in _gauges.items():
+            gauges.setdefault(name, {}).update(series)
+        for name, series in sorted(gauges.items()):
+            _header(lines, name, "gauge")
+            for key, value in series.items():
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+        for name, series in sorted(_histograms.items()):
+            _header(lines, name, "histogram")
+            for key, values in series.items():
+                for bound, count in zip(DEFAULT_BUCKETS, values):
+                    lines.append(f"{name}_bucket{_format_labels(key + (('le', repr(bound)),))} {_format_value(count)}")
+                lines.append(f"{name}_bucket{_format_labels(key + (('le', '+Inf'),))} {_format_value(values[-1])}")
+                lines.append(f"{name}_sum{_format_labels(key)} {_format_value(values[-2])}")
+                lines.append(f"{name}_count{_format_labels(key)} {_format_value(values[-1])}")
+    return "\n".join(lines) + "\n"
+
+
+def _header(lines: List[str], name: str, metric_type: str) -> None:
+    if name in HELP:
+        lines.append(f"# HELP {name} {HELP[name]}")
+    lines.append(f"# TYPE {name} {metric_type}")
+
+
+def _format_labels(key: _Labels) -> str:
+    if not key:
+        return ""
+    escaped = (
+        f'{k}="' + v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for k, v in key
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _labels(labels: dict) -> _Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
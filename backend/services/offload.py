@@ -0,0 +1,66 @@
+"""
+Bounded thread pool for CPU-bound work
+
+RS256 signing, YAML parsing, base64 decoding and rendering of big templates
+would otherwise run on the event loop and stall every concurrent request.
+They run in a pool of CPU_WORKERS threads instead; time spent waiting for a
+thread and running is exposed in metrics and request timings.
+"""
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+import config
+from backend.services import metrics, request_context
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=max(config.CPU_WORKERS, 1), thread_name_prefix="cpu")
+    return _executor
+
+
+async def run(name: str, func: Callable, *args, **kwargs) -> Any:
+    """
+    Run func(*args, **kwargs) in the thread pool
+
+    Args:
+        name: Kind of work for metrics and Server-Timing (e.g. jwt, yaml, template)
+        func: Function to run
+
+    Returns:
+        Result of func
+    """
+    loop = asyncio.get_running_loop()
+    submitted = time.perf_counter()
+    started = None
+
+    def call():
+        nonlocal started
+        started = time.perf_counter()
+        return func(*args, **kwargs)
+
+    try:
+        return await loop.run_in_executor(_get_executor(), call)
+    finally:
+        finished = time.perf_counter()
+        metrics.inc("offload_tasks_total", kind=name)
+        if started is not None:
+            metrics.observe("offload_wait_seconds", started - submitted, kind=name)
+            metrics.observe("offload_run_seconds", finished - started, kind=name)
+        request_context.record_timing(name, finished - submitted)
+
+
+def shutdown() -> None:
+    """Stop the thread pool (on application shutdown)"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
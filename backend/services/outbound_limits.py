@@ -0,0 +1,227 @@
+"""
+Concurrency limits for outbound GitHub calls and admission control
+
+Every GitHub request takes a slot from a global limit (OUTBOUND_MAX_CONCURRENCY)
+and from the limit of the token it is made with (OUTBOUND_MAX_CONCURRENCY_PER_TOKEN),
+so a burst of page loads can't open hundreds of connections and run into a rate
+limit ban. Requests without a free slot wait in a bounded FIFO queue
+(OUTBOUND_QUEUE_SIZE) for at most OUTBOUND_MAX_WAIT seconds.
+
+When the queue is full or the wait runs out, the call fails with
+OutboundSaturatedError: 429 if the caller's own token is at its limit, 503 if
+the whole process is. While the queue is full, AdmissionMiddleware sheds new
+incoming requests with 503 and Retry-After instead of letting latency grow.
+"""
+import json
+import math
+import time
+import asyncio
+import hashlib
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+import config
+from backend.services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Requests to these paths are never shed (they don't call GitHub)
+ADMISSION_EXEMPT_PREFIXES = ("/health", "/metrics", "/static", "/webhooks")
+
+
+class OutboundSaturatedError(Exception):
+    """No slot for a GitHub call within the allowed wait"""
+
+    def __init__(self, scope: str, retry_after: int):
+        # "token" - лимит токена вызывающего, "global" - общий лимит процесса
+        self.scope = scope
+        self.retry_after = retry_after
+        self.status_code = 429 if scope == "token" else 503
+        if scope == "token":
+            message = f"Too many concurrent GitHub requests with this token, try again in {retry_after}s"
+        else:
+            message = f"Server is overloaded, try again in {retry_after}s"
+        super().__init__(message)
+
+
+# Slots in use: total and {token key: count}
+_in_flight = 0
+_in_flight_by_token: Dict[str, int] = {}
+
+# Calls waiting for a slot, in arrival order: [(token key, future)]
+_waiters: List[Tuple[str, asyncio.Future]] = []
+
+
+def token_key(authorization: Optional[str]) -> str:
+    """Key of the per-token limit for an Authorization header (a hash, never the token itself)"""
+    if not authorization:
+        return "anonymous"
+    return hashlib.sha256(authorization.encode("utf-8")).hexdigest()[:16]
+
+
+def retry_after() -> int:
+    """Seconds clients are asked to wait when a call is rejected"""
+    return max(1, math.ceil(config.OUTBOUND_MAX_WAIT))
+
+
+def is_saturated() -> bool:
+    """True if the wait queue is full, so new calls would be rejected"""
+    return bool(_waiters) and len(_waiters) >= config.OUTBOUND_QUEUE_SIZE
+
+
+def _blocked_by(key: str) -> Optional[str]:
+    """Which limit keeps a call with this token from running now, None if it can run"""
+    per_token = config.OUTBOUND_MAX_CONCURRENCY_PER_TOKEN
+    if per_token > 0 and _in_flight_by_token.get(key, 0) >= per_token:
+        return "token"
+    if config.OUTBOUND_MAX_CONCURRENCY > 0 and _in_flight >= config.OUTBOUND_MAX_CONCURRENCY:
+        return "global"
+    return None
+
+
+def _take(key: str) -> None:
+    global _in_flight
+    _in_flight += 1
+    _in_flight_by_token[key] = _in_flight_by_token.get(key, 0) + 1
+
+
+async def acquire(key: str) -> float:
+    """
+    Wait for a slot for a GitHub call
+
+    Args:
+        key: Token key (see token_key)
+
+    Returns:
+        Time waited in seconds
+
+    Raises:
+        OutboundSaturatedError: the queue is full or no slot was freed within OUTBOUND_MAX_WAIT
+    """
+    scope = _blocked_by(key)
+    if scope is None:
+        _take(key)
+        return 0.0
+
+    if len(_waiters) >= config.OUTBOUND_QUEUE_SIZE:
+        metrics.inc("outbound_rejected_total", scope=scope, reason="queue_full")
+        raise OutboundSaturatedError(scope, retry_after())
+
+    started = time.perf_counter()
+    future = asyncio.get_running_loop().create_future()
+    waiter = (key, future)
+    _waiters.append(waiter)
+    try:
+        await asyncio.wait_for(asyncio.shield(future), config.OUTBOUND_MAX_WAIT)
+    except asyncio.TimeoutError:
+        if not future.done():
+            _waiters.remove(waiter)
+            future.cancel()
+            scope = _blocked_by(key) or scope
+            metrics.inc("outbound_rejected_total", scope=scope, reason="timeout")
+            raise OutboundSaturatedError(scope, retry_after())
+    except asyncio.CancelledError:
+        if future.done() and not future.cancelled():
+            # Слот уже передан нам - возвращаем его следующему
+            release(key)
+        elif waiter in _waiters:
+            _waiters.remove(waiter)
+        raise
+    waited = time.perf_counter() - started
+    metrics.observe("outbound_wait_seconds", waited)
+    return waited
+
+
+def release(key: str) -> None:
+    """Free the slot taken by acquire and hand it to the first waiting call that can run"""
+    global _in_flight
+    _in_flight -= 1
+    count = _in_flight_by_token.get(key, 0) - 1
+    if count > 0:
+        _in_flight_by_token[key] = count
+    else:
+        _in_flight_by_token.pop(key, None)
+
+    # Очередь FIFO: вызов, ждущий общий слот, не обгоняют; ждущих слот своего токена пропускаем
+    for waiter in list(_waiters):
+        waiting_key, future = waiter
+        blocked = _blocked_by(waiting_key)
+        if blocked == "global":
+            break
+        if blocked is None:
+            _waiters.remove(waiter)
+            _take(waiting_key)
+            future.set_result(None)
+
+
+def clear() -> None:
+    """Forget all slots and waiting calls"""
+    global _in_flight
+    for _, future in _waiters:
+        future.cancel()
+    _waiters.clear()
+    _in_flight = 0
+    _in_flight_by_token.clear()
+
+
+def _collect_usage():
+    """Slots in use and waiting calls, computed on each /metrics scrape"""
+    return [
+        ("outbound_requests_in_flight", {}, _in_flight),
+        ("outbound_queue_length", {}, len(_waiters))
+    ]
+
+
+metrics.register_collector(_collect_usage)
+
+
+class LimitedTransport(httpx.AsyncBaseTransport):
+    """Transport taking a slot for every request until its response headers arrive"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        key = token_key(request.headers.get("Authorization"))
+        await acquire(key)
+        try:
+            return await self._transport.handle_async_request(request)
+        finally:
+            release(key)
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+class AdmissionMiddleware:
+    """Sheds incoming requests with 503 while the GitHub call queue is full"""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or not is_saturated()
+            or scope["path"].startswith(ADMISSION_EXEMPT_PREFIXES)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        metrics.inc("http_requests_shed_total")
+        logger.warning(f"Shedding {scope['method']} {scope['path']}: GitHub call queue is full")
+        error = OutboundSaturatedError("global", retry_after())
+        body = json.dumps({"detail": str(error)}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": error.status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("ascii")),
+                (b"retry-after", str(error.retry_after).encode("ascii"))
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -1,24 +1,74 @@
 """
 Service for checking user permissions and collaborator access
 """
-import httpx
+import time
+import asyncio
+import hashlib
 import logging
+from typing import Dict, List, Optional, Tuple
+
+import config
+from backend.services.github_client import get_client
+from backend.services.outbound_limits import OutboundSaturatedError
 
 logger = logging.getLogger(__name__)
 
+# Permission levels from lowest to highest
+PERMISSION_LEVELS = ["read", "triage", "write", "maintain", "admin"]
+
+# Minimum level required to dispatch workflows
+TRIGGER_LEVEL = "write"
+
+# How long permission levels are cached (seconds); lack of access is rechecked sooner
+PERMISSION_CACHE_TTL = 120
+NO_ACCESS_CACHE_TTL = 30
+
+# Maximum number of cached (user, repository) entries
+MAX_CACHED_LEVELS = 10000
+
+# Repositories resolved by one GraphQL query in get_permission_levels
+BULK_CHUNK_SIZE = 50
+
+GRAPHQL_URL = "https://api.github.com/graphql"
 
-async def check_repository_access(owner: str, repo: str, access_token: str) -> bool:
+# viewerPermission values of the GraphQL API
+_GRAPHQL_LEVELS = {
+    "READ": "read",
+    "TRIAGE": "triage",
+    "WRITE": "write",
+    "MAINTAIN": "maintain",
+    "ADMIN": "admin"
+}
+
+# Cached levels: {(user key, owner, repo): (level or None, expiry)}
+_levels: Dict[Tuple[str, str, str], Tuple[Optional[str], float]] = {}
+
+
+async def get_permission_level(owner: str, repo: str, access_token: str, user_id: Optional[int] = None) -> Optional[str]:
     """
-    Check if user has access to the repository
+    Get the user's permission level in the repository
+    
+    Levels are cached per (user, repository): for PERMISSION_CACHE_TTL if the
+    user has access and for NO_ACCESS_CACHE_TTL if not. Webhook events about
+    collaborators and teams drop the affected entries (see invalidate_repo).
     
     Args:
         owner: Repository owner
         repo: Repository name
         access_token: GitHub OAuth access token
+        user_id: GitHub user ID (from the session); the token is used as the key if missing
         
     Returns:
-        True if user has access, False otherwise
+        One of PERMISSION_LEVELS, or None if the user has no access
+    
+    Raises:
+        OutboundSaturatedError: no slot for the GitHub call (the level is unknown)
     """
+    key = (_user_key(user_id, access_token), owner.lower(), repo.lower())
+    found, level = _cached(key)
+    if found:
+        return level
+    
     url = f"https://api.github.com/repos/{owner}/{repo}"
     headers = {
         "Authorization": f"token {access_token}",
@@ -26,34 +76,303 @@ async def check_repository_access(owner: str, repo: str, access_token: str) -> b
     }
     
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers=headers)
-            
-            if response.status_code == 200:
-                logger.info(f"User HAS access to {owner}/{repo} (collaborator)")
-                return True
-            elif response.status_code == 401:
-                # Unauthorized - token invalid, expired, or insufficient permissions
-                logger.warning(f"Unauthorized access to {owner}/{repo}. Token may be invalid, expired, or lack required scopes.")
-                return False
-            elif response.status_code == 403:
-                # Forbidden - user doesn't have permission to access this repository
-                logger.warning(f"Forbidden: Cannot access {owner}/{repo}. User may not have repository access.")
-                return False
-            elif response.status_code == 404:
-                # Repository not found or no access
-                logger.warning(f"Repository {owner}/{repo} not found or no access")
-                return False
-            else:
-                logger.warning(f"Unexpected status code when checking repository access for {owner}/{repo}: {response.status_code}")
-                return False
-    except httpx.HTTPStatusError as e:
-        if e.response.status_code in (401, 403, 404):
-            logger.warning(f"HTTP {e.response.status_code} when checking repository access for {owner}/{repo}: {e.response.text}")
-            return False
-        logger.error(f"HTTP error checking repository access for {owner}/{repo}: {e.response.status_code} - {e.response.text}")
-        return False
+        client = get_client()
+        response = await client.get(url, headers=headers)
+    except OutboundSaturatedError:
+        # Перегрузка - не отсутствие прав: клиент получит 429/503 с Retry-After
+        raise
     except Exception as e:
+        # Ошибки сети не кэшируем
         logger.error(f"Error checking repository access for {owner}/{repo}: {str(e)}")
-        return False
+        return None
+    
+    if response.status_code == 200:
+        level = _level_from_permissions(response.json().get("permissions") or {})
+        logger.info(f"User has {level} permission in {owner}/{repo}")
+        _remember(key, level, PERMISSION_CACHE_TTL)
+        return level
+    elif response.status_code == 401:
+        # Unauthorized - token invalid, expired, or insufficient permissions
+        logger.warning(f"Unauthorized access to {owner}/{repo}. Token may be invalid, expired, or lack required scopes.")
+    elif response.status_code == 403:
+        # Forbidden - user doesn't have permission to access this repository
+        logger.warning(f"Forbidden: Cannot access {owner}/{repo}. User may not have repository access.")
+    elif response.status_code == 404:
+        # Repository not found or no access
+        logger.warning(f"Repository {owner}/{repo} not found or no access")
+    else:
+        logger.warning(f"Unexpected status code when checking repository access for {owner}/{repo}: {response.status_code}")
+        return None
+    
+    _remember(key, None, NO_ACCESS_CACHE_TTL)
+    return None
+
+
+async def check_repository_access(owner: str, repo: str, access_token: str, user_id: Optional[int] = None) -> bool:
+    """
+    Check if user may trigger workflows in the repository
+    
+    GitHub requires write permission (or higher) to dispatch workflows, so
+    read and triage access (e.g. any user in a public repository) is not enough.
+    
+    Args:
+        owner: Repository owner
+        repo: Repository name
+        access_token: GitHub OAuth access token
+        user_id: GitHub user ID (from the session), used as the cache key
+        
+    Returns:
+        True if user has write access or higher, False otherwise
+    """
+    level = await get_permission_level(owner, repo, access_token, user_id)
+    return can_trigger_with(level)
+
+
+async def has_read_access(owner: str, repo: str, access_token: str, user_id: Optional[int] = None) -> bool:
+    """
+    Check if user may see the repository (for read-only endpoints, e.g. job logs)
+    
+    Args:
+        owner: Repository owner
+        repo: Repository name
+        access_token: GitHub OAuth access token
+        user_id: GitHub user ID (from the session), used as the cache key
+        
+    Returns:
+        True if user has any permission level in the repository, False otherwise
+    """
+    level = await get_permission_level(owner, repo, access_token, user_id)
+    return level is not None
+
+
+def can_trigger_with(level: Optional[str]) -> bool:
+    """Whether the permission level allows triggering workflows"""
+    return level is not None and PERMISSION_LEVELS.index(level) >= PERMISSION_LEVELS.index(TRIGGER_LEVEL)
+
+
+async def get_permission_levels(
+    repositories: List[Tuple[str, str]],
+    access_token: str,
+    user_id: Optional[int] = None
+) -> Dict[Tuple[str, str], Optional[str]]:
+    """
+    Get the user's permission levels in many repositories at once
+    
+    Levels missing from the cache are resolved with GraphQL `viewerPermission`,
+    BULK_CHUNK_SIZE repositories per query, and cached the same way as by
+    get_permission_level.
+    
+    Args:
+        repositories: List of (owner, repo)
+        access_token: GitHub OAuth access token
+        user_id: GitHub user ID (from the session); the token is used as the key if missing
+        
+    Returns:
+        Dict {(owner, repo): one of PERMISSION_LEVELS or None if the user has no access}
+        Repositories that couldn't be checked are reported as None and not cached.
+    """
+    user_key = _user_key(user_id, access_token)
+    levels: Dict[Tuple[str, str], Optional[str]] = {}
+    missing: Dict[Tuple[str, str], Tuple[str, str]] = {}
+    for owner, repo in repositories:
+        found, level = _cached((user_key, owner.lower(), repo.lower()))
+        if found:
+            levels[(owner, repo)] = level
+        else:
+            # Регистр в имени не важен - один и тот же репозиторий запрашиваем один раз
+            missing.setdefault((owner.lower(), repo.lower()), (owner, repo))
+    
+    if missing:
+        names = list(missing.values())
+        chunks = [names[i:i + BULK_CHUNK_SIZE] for i in range(0, len(names), BULK_CHUNK_SIZE)]
+        results = await asyncio.gather(*[_query_levels(chunk, access_token) for chunk in chunks])
+        resolved = {}
+        for chunk_result in results:
+            resolved.update(chunk_result)
+        for (owner, repo), (level, cacheable) in resolved.items():
+            if cacheable:
+                _remember((user_key, owner.lower(), repo.lower()), level,
+                          PERMISSION_CACHE_TTL if level is not None else NO_ACCESS_CACHE_TTL)
+        for owner, repo in repositories:
+            if (owner, repo) not in levels:
+                canonical = missing[(owner.lower(), repo.lower())]
+                levels[(owner, repo)] = resolved.get(canonical, (None, False))[0]
+    
+    return levels
+
+
+async def _query_levels(repositories: List[Tuple[str, str]], access_token: str) -> Dict[Tuple[str, str], Tuple[Optional[str], bool]]:
+    """
+    Resolve viewerPermission of up to BULK_CHUNK_SIZE repositories with one GraphQL query
+    
+    Returns:
+        Dict {(owner, repo): (level or None, whether the result may be cached)}
+    """
+    # Имена передаем переменными, а не подставляем в текст запроса
+    params = []
+    fields = []
+    variables = {}
+    for i, (owner, repo) in enumerate(repositories):
+        params.append(f"$o{i}: String!, $n{i}: String!")
+        fields.append(f"r{i}: repository(owner: $o{i}, name: $n{i}) {{ viewerPermission }}")
+        variables[f"o{i}"] = owner
+        variables[f"n{i}"] = repo
+    query = f"query({', '.join(params)}) {{ {' '.join(fields)} }}"
+    
+    try:
+        client = get_client()
+        response = await client.post(
+            GRAPHQL_URL,
+            headers={"Authorization": f"bearer {access_token}"},
+            json={"query": query, "variables": variables}
+        )
+        response.raise_for_status()
+        body = response.json()
+    except OutboundSaturatedError:
+        raise
+    except Exception as e:
+        # Ошибки сети и авторизации не кэшируем
+        logger.error(f"Error checking permissions in {len(repositories)} repositories: {str(e)}")
+        return {name: (None, False) for name in repositories}
+    
+    data = body.get("data") or {}
+    # Ошибки по отдельным репозиториям: path = ["r3"], type = NOT_FOUND / FORBIDDEN / ...
+    error_types = {}
+    for error in body.get("errors") or []:
+        path = error.get("path") or []
+        if path:
+            error_types[path[0]] = error.get("type")
+    
+    levels = {}
+    for i, name in enumerate(repositories):
+        node = data.get(f"r{i}")
+        if node is not None:
+            level = _GRAPHQL_LEVELS.get(node.get("viewerPermission"))
+            levels[name] = (level, True)
+        elif error_types.get(f"r{i}") in ("NOT_FOUND", "FORBIDDEN"):
+            levels[name] = (None, True)
+        else:
+            logger.warning(f"Failed to check permissions in {name[0]}/{name[1]}: {body.get('errors')}")
+            levels[name] = (None, False)
+    logger.info(f"Resolved permissions in {len(repositories)} repositories with one GraphQL query")
+    return levels
+
+
+def invalidate_repo(owner: str, repo: str) -> int:
+    """Forget cached permission levels of all users in the repository; returns number dropped"""
+    owner, repo = owner.lower(), repo.lower()
+    keys = [key for key in _levels if key[1] == owner and key[2] == repo]
+    for key in keys:
+        del _levels[key]
+    return len(keys)
+
+
+def invalidate_user(user_id: int) -> int:
+    """Forget cached permission levels of the user in all repositories; returns number dropped"""
+    user_key = _user_key(user_id, None)
+    keys = [key for key in _levels if key[0] == user_key]
+    for key in keys:
+        del _levels[key]
+    return len(keys)
+
+
+def clear_cache() -> None:
+    """Forget all cached permission levels"""
+    _levels.clear()
+
+
+def _user_key(user_id: Optional[int], access_token: Optional[str]) -> str:
+    if user_id is not None:
+        return f"id:{user_id}"
+    return "token:" + hashlib.sha256((access_token or "").encode("utf-8")).hexdigest()[:16]
+
 
+def _cached(key: Tuple[str, str, str]) -> Tuple[bool, Optional[str]]:
+    """Returns (found, level) for a cache key"""
+    entry = _levels.get(key)
+    if entry is None:
+        return False, None
+    level, expires_at = entry
+    if time.monotonic() < expires_at:
+        return True, level
+    del _levels[key]
+    return False, None
+
+
+def _level_from_permissions(permissions: dict) -> str:
+    """Highest level from the `permissions` object of GET /repos/{owner}/{repo}"""
+    # push = write, pull = read
+    for flag, level in (("admin", "admin"), ("maintain", "maintain"), ("push", "write"), ("triage", "triage")):
+        if permissions.get(flag):
+            return level
+    return "read"
+
+
+def _remember(key: Tuple[str, str, str], level: Optional[str], ttl: float) -> None:
+    if len(_levels) >= MAX_CACHED_LEVELS:
+        now = time.monotonic()
+        for stale in [k for k, (_, expires_at) in _levels.items() if expires_at <= now]:
+            del _levels[stale]
+        if len(_levels) >= MAX_CACHED_LEVELS:
+            _levels.clear()
+    _levels[key] = (level, time.monotonic() + ttl)
+
+
+def not_collaborator_message(username: str, owner: str, repo: str) -> str:
+    """Error shown when a user may not trigger workflows in the repository"""
+    return f"User {username} is not a collaborator of {owner}/{repo}. Only collaborators can trigger workflows."
+
+
+def is_optimistic_dispatch() -> bool:
+    """
+    Whether the permission check is left to GitHub
+    
+    Only possible when dispatches are made with the user's own token: GitHub
+    rejects them for users without write access, so the separate check is skipped.
+    """
+    return config.CHECK_PERMISSIONS and config.OPTIMISTIC_DISPATCH and config.USE_USER_TOKEN_FOR_WORKFLOWS
+
+
+def map_dispatch_denial(result: dict, username: str, owner: str, repo: str) -> dict:
+    """Turn GitHub's 403/404 on an optimistic dispatch into the collaborator error"""
+    if result.get("success") is False and result.get("status_code") in (403, 404):
+        logger.info(f"GitHub rejected dispatch by {username} in {owner}/{repo} ({result['status_code']})")
+        return {**result, "status_code": 403, "message": not_collaborator_message(username, owner, repo)}
+    return result
+
+
+def apply_webhook_event(event: str, payload: dict) -> int:
+    """
+    Drop cached permission levels affected by a GitHub webhook event
+    
+    Args:
+        event: Event name (X-GitHub-Event header)
+        payload: Event payload
+        
+    Returns:
+        Number of cached entries dropped
+    """
+    repository = payload.get("repository") or {}
+    full_name = repository.get("full_name") or ""
+    
+    if event in ("member", "team_add", "repository") and "/" in full_name:
+        # Изменились коллабораторы или команды репозитория
+        owner, repo = full_name.split("/", 1)
+        dropped = invalidate_repo(owner, repo)
+    elif event == "team":
+        if "/" in full_name:
+            owner, repo = full_name.split("/", 1)
+            dropped = invalidate_repo(owner, repo)
+        else:
+            # Права команды изменились во всех ее репозиториях
+            dropped = len(_levels)
+            clear_cache()
+    elif event == "membership" and (payload.get("member") or {}).get("id") is not None:
+        dropped = invalidate_user(payload["member"]["id"])
+    elif event == "organization" and ((payload.get("membership") or {}).get("user") or {}).get("id") is not None:
+        dropped = invalidate_user(payload["membership"]["user"]["id"])
+    else:
+        return 0
+    
+    logger.info(f"Webhook {event}/{payload.get('action')}: dropped {dropped} cached permission levels")
+    return dropped
@@ -0,0 +1,67 @@
+"""
+Cache pre-warming after login
+
+Users coming from a badge or a trigger link land on the OAuth callback with
+the target repository in the saved redirect URL. While the browser follows
+the redirect, the data the target page needs (permission level, workflows,
+branches, workflow inputs, dispatch token) is loaded in the background, so
+the page or the dispatch finds it in the cache.
+"""
+import asyncio
+import logging
+from typing import Optional
+from urllib.parse import urlparse, parse_qs
+
+import config
+from backend.services.branches import get_branches
+from backend.services.permissions import get_permission_level, is_optimistic_dispatch
+from backend.services.workflow import prefetch_auth_token
+from backend.services.workflow_info import get_workflow_info
+from backend.services.workflows import get_workflows
+
+logger = logging.getLogger(__name__)
+
+# Strong references to running pre-warm tasks (asyncio keeps only weak ones)
+_tasks = set()
+
+
+def prewarm_for_redirect(redirect_url: str, access_token: str, user_id: Optional[int] = None) -> Optional[asyncio.Task]:
+    """
+    Start loading caches for the page the user is redirected to after login
+
+    Args:
+        redirect_url: Validated relative redirect URL (e.g. /workflow/trigger?owner=...&repo=...)
+        access_token: User's OAuth access token
+        user_id: GitHub user ID
+
+    Returns:
+        Background task, or None if the URL doesn't point to a repository
+    """
+    params = parse_qs(urlparse(redirect_url).query)
+    owner = (params.get("owner") or [""])[0]
+    repo = (params.get("repo") or [""])[0]
+    if not owner or not repo:
+        return None
+    workflow_id = (params.get("workflow_id") or [""])[0]
+
+    task = asyncio.create_task(_prewarm(owner, repo, workflow_id, access_token, user_id))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task
+
+
+async def _prewarm(owner: str, repo: str, workflow_id: str, access_token: str, user_id: Optional[int]) -> None:
+    jobs = [get_workflows(owner, repo), get_branches(owner, repo)]
+    if workflow_id:
+        jobs.append(get_workflow_info(owner, repo, workflow_id))
+    if config.CHECK_PERMISSIONS and not is_optimistic_dispatch():
+        jobs.append(get_permission_level(owner, repo, access_token, user_id))
+    if not config.USE_USER_TOKEN_FOR_WORKFLOWS:
+        # Токен GitHub App для запуска
+        jobs.append(prefetch_auth_token(None))
+
+    results = await asyncio.gather(*jobs, return_exceptions=True)
+    failed = [result for result in results if isinstance(result, Exception)]
+    for error in failed:
+        logger.warning(f"Pre-warming caches for {owner}/{repo} failed: {str(error)}")
+    logger.info(f"Pre-warmed caches for {owner}/{repo} after login ({len(jobs) - len(failed)}/{len(jobs)} loaded)")
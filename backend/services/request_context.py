@@ -0,0 +1,223 @@
+"""
+Per-request context and request logging
+
+RequestLoggingMiddleware (pure ASGI, no extra task per request and no
+buffering of streaming responses) measures every request, counts the GitHub
+calls made while handling it and writes one structured log line and metrics.
+Code handling the request reaches its context through current() and reports
+where the time went with timed() / record_timing(); the breakdown is sent
+to the client in the Server-Timing header.
+"""
+import json
+import time
+import random
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+import jinja2
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+import config
+from backend.services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Route label of requests that didn't match any route (keeps metric cardinality bounded)
+UNMATCHED_ROUTE = "unmatched"
+
+
+class RequestContext:
+    """What happened while handling one request"""
+
+    __slots__ = ("method", "path", "route", "upstream_calls", "upstream_seconds", "timings")
+
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.route = UNMATCHED_ROUTE
+        self.upstream_calls = 0
+        self.upstream_seconds = 0.0
+        # Time spent per kind of work: {name: [seconds, count]}
+        self.timings: Dict[str, List[float]] = {}
+
+
+_current: ContextVar[Optional[RequestContext]] = ContextVar("request_context", default=None)
+
+
+def current() -> Optional[RequestContext]:
+    """Context of the request being handled, None outside of requests"""
+    return _current.get()
+
+
+def record_upstream_call(duration: float, endpoint: str = "other") -> None:
+    """Count a GitHub API call (endpoint class, see github_client) made while handling the current request"""
+    context = _current.get()
+    if context is not None:
+        context.upstream_calls += 1
+        context.upstream_seconds += duration
+        _add_timing(context, f"gh_{endpoint}", duration)
+
+
+def record_timing(name: str, duration: float) -> None:
+    """Add time spent on some work (e.g. cache, yaml, template) to the current request"""
+    context = _current.get()
+    if context is not None:
+        _add_timing(context, name, duration)
+
+
+@contextmanager
+def timed(name: str):
+    """Measure a block of code into the current request's timings"""
+    if _current.get() is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(name, time.perf_counter() - started)
+
+
+def _add_timing(context: RequestContext, name: str, duration: float) -> None:
+    entry = context.timings.get(name)
+    if entry is None:
+        context.timings[name] = [duration, 1]
+    else:
+        entry[0] += duration
+        entry[1] += 1
+
+
+class _TimedTemplate(jinja2.Template):
+    def render(self, *args, **kwargs) -> str:
+        with timed("template"):
+            return super().render(*args, **kwargs)
+
+
+def instrument_templates(templates) -> None:
+    """Report template rendering of a Jinja2Templates instance in request timings"""
+    templates.env.template_class = _TimedTemplate
+
+
+def server_timing(context: RequestContext, total: float) -> str:
+    """Server-Timing header value: time per kind of work and the total (milliseconds)"""
+    parts = [
+        f'{name};dur={seconds * 1000:.1f};desc="{int(count)}x"'
+        for name, (seconds, count) in context.timings.items()
+    ]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def timing_breakdown(context: RequestContext, total: float) -> dict:
+    """Same breakdown as server_timing, for the debug JSON field"""
+    return {
+        "total_ms": round(total * 1000, 1),
+        "github_calls": context.upstream_calls,
+        "timings": {
+            name: {"ms": round(seconds * 1000, 1), "count": int(count)}
+            for name, (seconds, count) in context.timings.items()
+        }
+    }
+
+
+class RequestLoggingMiddleware:
+    """Logs and measures requests; log lines of busy routes are sampled (REQUEST_LOG_SAMPLING)"""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        context = RequestContext(scope["method"], scope["path"])
+        token = _current.set(context)
+        started = time.perf_counter()
+        status = 500
+        debug_start: Optional[Message] = None
+        debug_body: List[bytes] = []
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status, debug_start
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if config.SERVER_TIMING:
+                    headers = MutableHeaders(scope=message)
+                    headers.append("Server-Timing", server_timing(context, time.perf_counter() - started))
+                    if config.SERVER_TIMING_DEBUG and headers.get("content-type", "").startswith("application/json"):
+                        # Тело JSON-ответа дополняется полем _timing, поэтому придерживаем его
+                        debug_start = message
+                        return
+            elif message["type"] == "http.response.body" and debug_start is not None:
+                debug_body.append(message.get("body", b""))
+                if message.get("more_body", False):
+                    return
+                body = _with_timing_field(b"".join(debug_body), context, time.perf_counter() - started)
+                headers = MutableHeaders(scope=debug_start)
+                headers["content-length"] = str(len(body))
+                await send(debug_start)
+                await send({"type": "http.response.body", "body": body})
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            status = 500
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            # Шаблон маршрута известен только после роутинга
+            route = scope.get("route")
+            if route is not None and getattr(route, "path", None):
+                context.route = route.path
+            _current.reset(token)
+            _finish(context, status, duration)
+
+
+def _with_timing_field(body: bytes, context: RequestContext, total: float) -> bytes:
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return body
+    if not isinstance(data, dict):
+        return body
+    data["_timing"] = timing_breakdown(context, total)
+    return json.dumps(data).encode("utf-8")
+
+
+def _finish(context: RequestContext, status: int, duration: float) -> None:
+    metrics.inc("http_requests_total", method=context.method, route=context.route, status=status)
+    metrics.observe("http_request_duration_seconds", duration, method=context.method, route=context.route)
+    if context.upstream_calls:
+        metrics.inc("http_request_upstream_calls_total", context.upstream_calls, route=context.route)
+
+    if not _should_log(context.route, status, duration):
+        return
+    duration_ms = duration * 1000
+    log = logger.warning if status >= 500 else logger.info
+    log(
+        f"{context.method} {context.path} {status} {duration_ms:.1f}ms "
+        f"(github: {context.upstream_calls} calls, {context.upstream_seconds * 1000:.1f}ms)",
+        extra={
+            "http_method": context.method,
+            "http_route": context.route,
+            "http_path": context.path,
+            "http_status": status,
+            "duration_ms": round(duration_ms, 1),
+            "upstream_calls": context.upstream_calls,
+            "upstream_ms": round(context.upstream_seconds * 1000, 1)
+        }
+    )
+
+
+def _should_log(route: str, status: int, duration: float) -> bool:
+    # Ошибки и медленные запросы логируем всегда
+    if status >= 500 or duration * 1000 >= config.REQUEST_LOG_SLOW_MS:
+        return True
+    rate = config.REQUEST_LOG_SAMPLING.get(route, 1.0)
+    return rate >= 1.0 or random.random() < rate
@@ -0,0 +1,160 @@
+"""
+Live progress of workflow runs found for triggers
+
+One background follower per run polls the run and its jobs and pushes changes to
+all viewers, so the number of open result pages doesn't multiply GitHub requests.
+The polling interval grows with the age of the run: fresh runs change quickly,
+long builds are checked a few times a minute.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, Set, Tuple
+
+from backend.services import history
+from backend.services.workflow import get_auth_token, get_run_progress
+
+logger = logging.getLogger(__name__)
+
+# Polling interval bounds (seconds)
+MIN_POLL_INTERVAL = 3.0
+MAX_POLL_INTERVAL = 30.0
+
+# Polling interval as a fraction of run age (a 2-minute-old run is polled every 12s)
+POLL_AGE_FACTOR = 0.1
+
+# Stop following runs that haven't completed within this time (seconds)
+MAX_FOLLOW_DURATION = 6 * 3600
+
+# Events after which nothing more is published for a run
+TERMINAL_EVENTS = {"completed"}
+
+RunKey = Tuple[str, str, int]
+
+
+class FollowedRun:
+    """A workflow run watched by one or more viewers"""
+
+    def __init__(self, owner: str, repo: str, run_id: int, user_token: Optional[str] = None):
+        self.owner = owner
+        self.repo = repo
+        self.run_id = run_id
+        # Token of the user who triggered the run; None means the GitHub App
+        self.user_token = user_token
+        self.started_at = time.monotonic()
+        self.progress: Optional[dict] = None
+        self.subscribers: Set[asyncio.Queue] = set()
+
+    @property
+    def key(self) -> RunKey:
+        return (self.owner, self.repo, self.run_id)
+
+
+# Followed runs and their pollers: {(owner, repo, run_id): ...}
+_runs: Dict[RunKey, FollowedRun] = {}
+_followers: Dict[RunKey, asyncio.Task] = {}
+
+
+def follow(owner: str, repo: str, run_id: int, user_token: Optional[str] = None) -> Tuple[FollowedRun, asyncio.Queue]:
+    """
+    Subscribe to progress of a run, starting its follower if needed
+
+    Events are {"event": "progress" | "completed", "data": progress dict}. The last
+    known progress is delivered right away.
+
+    Args:
+        owner: Repository owner
+        repo: Repository name
+        run_id: Workflow run ID
+        user_token: User OAuth token to read the run with, None to use the GitHub App
+
+    Returns:
+        Followed run and the subscriber queue (pass both to unfollow)
+    """
+    key = (owner, repo, run_id)
+    run = _runs.get(key)
+    if run is None:
+        run = FollowedRun(owner, repo, run_id, user_token=user_token)
+        _runs[key] = run
+
+    queue = asyncio.Queue()
+    run.subscribers.add(queue)
+    if run.progress is not None:
+        queue.put_nowait({"event": "progress", "data": run.progress})
+    _ensure_follower(key)
+    return run, queue
+
+
+def unfollow(run: FollowedRun, queue: asyncio.Queue) -> None:
+    """Stop receiving run progress; the follower stops when nobody is watching"""
+    run.subscribers.discard(queue)
+
+
+def publish(run: FollowedRun, event: str) -> None:
+    """Push run progress to all subscribers"""
+    message = {"event": event, "data": run.progress}
+    for queue in list(run.subscribers):
+        queue.put_nowait(message)
+
+
+def poll_interval(progress: Optional[dict]) -> float:
+    """Polling interval for a run, growing with its age"""
+    created_at = (progress or {}).get("created_at")
+    if not created_at:
+        return MIN_POLL_INTERVAL
+    try:
+        created = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+    except ValueError:
+        return MIN_POLL_INTERVAL
+    age = (datetime.now(timezone.utc) - created).total_seconds()
+    return min(max(age * POLL_AGE_FACTOR, MIN_POLL_INTERVAL), MAX_POLL_INTERVAL)
+
+
+def _ensure_follower(key: RunKey) -> None:
+    """Start a follower for the run unless one is already running"""
+    loop = asyncio.get_running_loop()
+    task = _followers.get(key)
+    if task is not None and not task.done() and task.get_loop() is loop:
+        return
+    _followers[key] = loop.create_task(_follow(key))
+
+
+async def _follow(key: RunKey) -> None:
+    """Poll the run until it completes or nobody watches it anymore"""
+    run = _runs[key]
+    owner, repo, run_id = key
+    logger.debug(f"Run follower started for {owner}/{repo} run {run_id}")
+
+    try:
+        while run.subscribers:
+            interval = poll_interval(run.progress)
+            try:
+                auth_token = await get_auth_token(run.user_token)
+                progress = await get_run_progress(owner, repo, run_id, auth_token)
+            except Exception as e:
+                logger.warning(f"Failed to get progress of {owner}/{repo} run {run_id}: {str(e)}")
+                interval = MAX_POLL_INTERVAL
+            else:
+                if progress != run.progress:
+                    run.progress = progress
+                    try:
+                        history.record_run_status(owner, repo, run_id, progress.get("status"), progress.get("conclusion"))
+                    except Exception as e:
+                        logger.warning(f"Failed to save status of {owner}/{repo} run {run_id} to history: {str(e)}")
+                    if progress.get("status") == "completed":
+                        publish(run, "completed")
+                        break
+                    publish(run, "progress")
+
+            if time.monotonic() - run.started_at > MAX_FOLLOW_DURATION:
+                logger.warning(f"Stopped following {owner}/{repo} run {run_id} after {MAX_FOLLOW_DURATION}s")
+                break
+            await asyncio.sleep(interval)
+    finally:
+        if _followers.get(key) is asyncio.current_task():
+            del _followers[key]
+            # Next viewer starts a fresh follower with fresh data
+            if _runs.get(key) is run:
+                del _runs[key]
+        logger.debug(f"Run follower stopped for {owner}/{repo} run {run_id}")
@@ -0,0 +1,366 @@
+"""
+Server-side correlation of dispatched workflows with their runs
+
+One background watcher per (owner, repo, workflow_id) lists runs at an adaptive
+interval and resolves all pending triggers of that workflow from the same listing,
+so any number of waiting browsers costs a single GitHub poll. Updates are pushed
+to subscribers (Server-Sent Events or long-poll requests) through asyncio queues.
+
+Triggers that can't be told apart by GitHub (same workflow, ref and actor) are
+assigned runs one-to-one in creation order, so concurrent dispatches never share a run.
+"""
+import asyncio
+import logging
+import secrets
+import time
+from datetime import datetime
+from typing import Dict, Optional, Set, Tuple, Union
+
+from backend.services import history
+from backend.services.workflow import get_auth_token, get_app_slug, list_workflow_runs, select_candidate_runs
+
+logger = logging.getLogger(__name__)
+
+# How long to wait for a run to appear after dispatch (seconds)
+TRIGGER_TTL = 120
+
+# How long resolved triggers are kept for late subscribers (seconds)
+RESOLVED_RETENTION = 600
+
+# Adaptive polling interval (seconds): starts fast, backs off while nothing is found
+MIN_POLL_INTERVAL = 1.0
+MAX_POLL_INTERVAL = 10.0
+POLL_BACKOFF = 1.5
+
+# Events after which nothing more is published for a trigger
+TERMINAL_EVENTS = {"run", "timeout"}
+
+WatchKey = Tuple[str, str, str]
+CorrelationKey = Tuple[str, str, str, Optional[str], Optional[str]]
+
+
+class PendingTrigger:
+    """A dispatched workflow waiting to be matched with its run"""
+
+    def __init__(
+        self,
+        owner: str,
+        repo: str,
+        workflow_id: str,
+        ref: Optional[str],
+        trigger_time: datetime,
+        username: Optional[str] = None,
+        actor_login: Optional[str] = None,
+        user_token: Optional[str] = None,
+        correlation_id: Optional[str] = None
+    ):
+        self.trigger_id = secrets.token_urlsafe(16)
+        self.owner = owner
+        self.repo = repo
+        self.workflow_id = workflow_id
+        self.ref = ref
+        self.trigger_time = trigger_time
+        self.username = username
+        # Login the run is expected to be created by; None means the GitHub App
+        self.actor_login = actor_login
+        self.user_token = user_token
+        # Correlation ID injected into the dispatch inputs, matched exactly against run titles
+        self.correlation_id = correlation_id
+        self.registered_at = time.monotonic()
+        self.resolved_at: Optional[float] = None
+        self.state = "pending"  # pending | found | timeout
+        self.run: Optional[dict] = None
+        self.subscribers: Set[asyncio.Queue] = set()
+
+    @property
+    def key(self) -> WatchKey:
+        return (self.owner, self.repo, self.workflow_id)
+
+    @property
+    def correlation_key(self) -> CorrelationKey:
+        """Triggers with the same key produce indistinguishable runs (without correlation ID)"""
+        return (self.owner, self.repo, self.workflow_id, self.ref, self.actor_login)
+
+    def to_dict(self) -> dict:
+        """Trigger state in the /api/find-run response format"""
+        data = {
+            "trigger_id": self.trigger_id,
+            "state": self.state,
+            "found": self.run is not None
+        }
+        if self.run is not None:
+            run_id = self.run.get("id")
+            data.update({
+                "run_id": run_id,
+                "run_url": self.run.get("html_url") or f"https://github.com/{self.owner}/{self.repo}/actions/runs/{run_id}",
+                "status": self.run.get("status"),
+                "conclusion": self.run.get("conclusion")
+            })
+        return data
+
+
+# Registered triggers: {trigger_id: PendingTrigger}
+_triggers: Dict[str, PendingTrigger] = {}
+
+# Background watchers and their wake-up events: {(owner, repo, workflow_id): ...}
+_watchers: Dict[WatchKey, asyncio.Task] = {}
+_wakeups: Dict[WatchKey, asyncio.Event] = {}
+
+
+def register_trigger(
+    owner: str,
+    repo: str,
+    workflow_id: str,
+    ref: Optional[str],
+    trigger_time: Union[str, datetime],
+    username: Optional[str] = None,
+    user_token: Optional[str] = None,
+    correlation_id: Optional[str] = None,
+    inputs: Optional[dict] = None
+) -> PendingTrigger:
+    """
+    Register a successful dispatch and start looking for its run
+
+    Args:
+        owner: Repository owner
+        repo: Repository name
+        workflow_id: Workflow ID
+        ref: Branch the workflow was dispatched on
+        trigger_time: Dispatch time (datetime or ISO string)
+        username: Login of the executor user who triggered the workflow
+        user_token: User OAuth token if the workflow was dispatched as the user,
+                    None if it was dispatched as the GitHub App
+        correlation_id: Correlation ID returned by trigger_workflow, if any
+        inputs: Inputs the workflow was dispatched with (stored in the history)
+
+    Returns:
+        Registered trigger
+    """
+    if isinstance(trigger_time, str):
+        trigger_time = datetime.fromisoformat(trigger_time.replace('Z', '+00:00'))
+
+    _prune()
+    trigger = PendingTrigger(
+        owner, repo, workflow_id, ref, trigger_time,
+        username=username,
+        actor_login=username if user_token else None,
+        user_token=user_token,
+        correlation_id=correlation_id
+    )
+    _triggers[trigger.trigger_id] = trigger
+    logger.info(f"Tracking trigger {trigger.trigger_id} for {owner}/{repo}/{workflow_id} on {ref}")
+    try:
+        history.record_trigger(
+            trigger.trigger_id, owner, repo, workflow_id, ref, inputs, trigger_time,
+            username=username,
+            correlation_id=correlation_id
+        )
+    except Exception as e:
+        # История не должна мешать запуску
+        logger.warning(f"Failed to save trigger {trigger.trigger_id} to history: {str(e)}")
+    _ensure_watcher(trigger.key)
+    return trigger
+
+
+def get_trigger(trigger_id: str) -> Optional[PendingTrigger]:
+    """Get registered trigger by ID"""
+    return _triggers.get(trigger_id)
+
+
+def subscribe(trigger: PendingTrigger) -> asyncio.Queue:
+    """Subscribe to trigger updates; events are {"event": name, "data": dict}"""
+    queue = asyncio.Queue()
+    trigger.subscribers.add(queue)
+    return queue
+
+
+def unsubscribe(trigger: PendingTrigger, queue: asyncio.Queue) -> None:
+    """Stop receiving trigger updates"""
+    trigger.subscribers.discard(queue)
+
+
+async def wait_for_run(trigger: PendingTrigger, timeout: float) -> PendingTrigger:
+    """
+    Wait until the trigger is resolved (long-poll)
+
+    Args:
+        trigger: Registered trigger
+        timeout: Maximum time to wait in seconds
+
+    Returns:
+        The trigger (check its state)
+    """
+    if trigger.state != "pending" or timeout <= 0:
+        return trigger
+
+    queue = subscribe(trigger)
+    try:
+        await asyncio.wait_for(queue.get(), timeout=timeout)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        unsubscribe(trigger, queue)
+    return trigger
+
+
+def publish(trigger: PendingTrigger, event: str, data: dict = None) -> None:
+    """Push an event to all subscribers of the trigger"""
+    message = {"event": event, "data": data if data is not None else trigger.to_dict()}
+    for queue in list(trigger.subscribers):
+        queue.put_nowait(message)
+
+
+def _resolve(trigger: PendingTrigger, run: dict) -> None:
+    """Mark trigger as matched with a run and notify subscribers"""
+    trigger.run = run
+    trigger.state = "found"
+    trigger.resolved_at = time.monotonic()
+    logger.info(f"Trigger {trigger.trigger_id} matched run {run.get('id')}")
+    data = trigger.to_dict()
+    try:
+        history.record_run(trigger.trigger_id, data["run_id"], data["run_url"], data["status"], data["conclusion"])
+    except Exception as e:
+        logger.warning(f"Failed to save run of trigger {trigger.trigger_id} to history: {str(e)}")
+    publish(trigger, "run")
+
+
+def _expire(trigger: PendingTrigger) -> None:
+    """Give up waiting for the run and notify subscribers"""
+    trigger.state = "timeout"
+    trigger.resolved_at = time.monotonic()
+    logger.warning(f"Run for trigger {trigger.trigger_id} ({trigger.owner}/{trigger.repo}/{trigger.workflow_id}) not found within {TRIGGER_TTL}s")
+    publish(trigger, "timeout")
+
+
+def _prune() -> None:
+    """Forget triggers resolved long ago"""
+    now = time.monotonic()
+    stale = [
+        trigger_id for trigger_id, trigger in _triggers.items()
+        if trigger.resolved_at is not None and now - trigger.resolved_at > RESOLVED_RETENTION
+    ]
+    for trigger_id in stale:
+        del _triggers[trigger_id]
+
+
+def _ensure_watcher(key: WatchKey) -> None:
+    """Start a watcher for the workflow, or wake the running one up"""
+    loop = asyncio.get_running_loop()
+    task = _watchers.get(key)
+    if task is not None and not task.done() and task.get_loop() is loop:
+        _wakeups[key].set()
+        return
+
+    _wakeups[key] = asyncio.Event()
+    _watchers[key] = loop.create_task(_watch(key))
+
+
+async def _watch(key: WatchKey) -> None:
+    """Poll workflow runs until every pending trigger of the workflow is resolved"""
+    owner, repo, workflow_id = key
+    wakeup = _wakeups[key]
+    interval = MIN_POLL_INTERVAL
+    logger.debug(f"Run watcher started for {owner}/{repo}/{workflow_id}")
+
+    try:
+        while True:
+            # Runs take a moment to appear after dispatch, so wait before each poll
+            wakeup.clear()
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=interval)
+                # New trigger registered - poll soon
+                interval = MIN_POLL_INTERVAL
+            except asyncio.TimeoutError:
+                pass
+
+            # Разрешенные давно триггеры забываем и без новых запусков
+            _prune()
+            now = time.monotonic()
+            pending = []
+            for trigger in _triggers.values():
+                if trigger.key != key or trigger.state != "pending":
+                    continue
+                if now - trigger.registered_at > TRIGGER_TTL:
+                    _expire(trigger)
+                else:
+                    pending.append(trigger)
+
+            if not pending:
+                break
+
+            try:
+                resolved = await _poll_once(owner, repo, workflow_id, pending)
+            except Exception as e:
+                logger.warning(f"Failed to list runs for {owner}/{repo}/{workflow_id}: {str(e)}")
+                resolved = 0
+
+            if resolved:
+                interval = MIN_POLL_INTERVAL
+            else:
+                interval = min(interval * POLL_BACKOFF, MAX_POLL_INTERVAL)
+    finally:
+        if _watchers.get(key) is asyncio.current_task():
+            del _watchers[key]
+            _wakeups.pop(key, None)
+        logger.debug(f"Run watcher stopped for {owner}/{repo}/{workflow_id}")
+
+
+async def _poll_once(owner: str, repo: str, workflow_id: str, pending: list) -> int:
+    """
+    List runs once and match them against all pending triggers
+
+    Returns:
+        Number of triggers resolved
+    """
+    # Any token of a waiting user (or the App) can read the runs
+    auth_token = await get_auth_token(pending[0].user_token)
+    app_slug = None
+    if any(trigger.actor_login is None and not trigger.correlation_id for trigger in pending):
+        app_slug = await get_app_slug()
+
+    # Filter by branch and actor on GitHub's side only if all triggers share them
+    refs = {trigger.ref for trigger in pending}
+    ref_filter = refs.pop() if len(refs) == 1 else None
+    actors = {trigger.actor_login for trigger in pending}
+    actor_filter = actors.pop() if len(actors) == 1 else None
+    workflow_runs = await list_workflow_runs(
+        owner, repo, workflow_id, auth_token,
+        ref=ref_filter,
+        actor=actor_filter,
+        created_after=min(trigger.trigger_time for trigger in pending)
+    )
+
+    # Runs already assigned to other triggers can't be assigned again
+    claimed = {
+        trigger.run.get("id") for trigger in _triggers.values()
+        if trigger.key == (owner, repo, workflow_id) and trigger.run is not None
+    }
+
+    # Exact matches by correlation ID go first, so heuristics never take their runs
+    groups: Dict[CorrelationKey, list] = {}
+    exact = []
+    for trigger in pending:
+        if trigger.correlation_id:
+            exact.append(trigger)
+        else:
+            groups.setdefault(trigger.correlation_key, []).append(trigger)
+
+    resolved = 0
+    for group in [exact] + list(groups.values()):
+        # Earliest trigger gets the earliest run
+        for trigger in sorted(group, key=lambda t: (t.trigger_time, t.registered_at)):
+            candidates = select_candidate_runs(
+                workflow_runs,
+                trigger.trigger_time,
+                ref=trigger.ref,
+                expected_actor_login=trigger.actor_login,
+                app_slug=app_slug,
+                correlation_id=trigger.correlation_id
+            )
+            for _, run in sorted(candidates, key=lambda c: (c[0], c[1].get("id") or 0)):
+                if run.get("id") not in claimed:
+                    claimed.add(run.get("id"))
+                    _resolve(trigger, run)
+                    resolved += 1
+                    break
+    return resolved
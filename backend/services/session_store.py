@@ -0,0 +1,204 @@
+"""
+Server-side sessions
+
+With SESSION_BACKEND=memory or sqlite the session (user info, OAuth token,
+OAuth state) is kept on the server and the cookie carries only a short
+signed session ID, instead of the whole session signed into the cookie.
+request.session works the same way with either backend.
+"""
+import json
+import time
+import secrets
+import logging
+from collections import OrderedDict
+from typing import Optional
+
+import itsdangerous
+from itsdangerous.exc import BadSignature
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from backend.services import db
+from backend.services.token_crypto import encrypt_token, decrypt_token
+
+logger = logging.getLogger(__name__)
+
+DB_NAME = "sessions"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_expiry ON sessions (expires_at);
+"""
+
+
+class MemorySessionStore:
+    """Sessions in process memory; the least recently used are dropped above max_entries"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._sessions: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, session_id: str) -> Optional[dict]:
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        data, expires_at = entry
+        if time.time() >= expires_at:
+            del self._sessions[session_id]
+            return None
+        self._sessions.move_to_end(session_id)
+        return data
+
+    def set(self, session_id: str, data: dict, ttl: float) -> None:
+        self._sessions[session_id] = (data, time.time() + ttl)
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_entries:
+            self._sessions.popitem(last=False)
+
+    def delete(self, session_id: str) -> None:
+        self._sessions.pop(session_id, None)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+class SqliteSessionStore:
+    """
+    Sessions in SQLite (DATA_DIR), shared by workers and kept across restarts
+
+    Session data is encrypted, since it contains OAuth tokens.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+
+    def _db(self):
+        return db.connect(DB_NAME, schema=_SCHEMA)
+
+    def get(self, session_id: str) -> Optional[dict]:
+        row = self._db().execute(
+            "SELECT data FROM sessions WHERE id = ? AND expires_at > ?", (session_id, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        try:
+            return json.loads(decrypt_token(row["data"]))
+        except Exception:
+            # Ключ (SECRET_KEY) сменился - сессию не восстановить
+            logger.warning("Failed to decrypt stored session, starting a new one")
+            return None
+
+    def set(self, session_id: str, data: dict, ttl: float) -> None:
+        conn = self._db()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (id, data, expires_at) VALUES (?, ?, ?)",
+            (session_id, encrypt_token(json.dumps(data)), now + ttl)
+        )
+        if len(self) > self.max_entries:
+            # Сначала истекшие, затем те, что истекут раньше всех
+            conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+            conn.execute(
+                "DELETE FROM sessions WHERE id IN (SELECT id FROM sessions ORDER BY expires_at LIMIT "
+                "max(0, (SELECT COUNT(*) FROM sessions) - ?))",
+                (self.max_entries,)
+            )
+
+    def delete(self, session_id: str) -> None:
+        self._db().execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def __len__(self) -> int:
+        return self._db().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+def create_store(backend: str, max_entries: int):
+    """Session store for SESSION_BACKEND (memory or sqlite)"""
+    if backend == "memory":
+        return MemorySessionStore(max_entries)
+    if backend == "sqlite":
+        return SqliteSessionStore(max_entries)
+    raise ValueError(f"Unknown session backend: {backend}")
+
+
+class ServerSessionMiddleware:
+    """
+    Drop-in replacement of starlette's SessionMiddleware keeping sessions in a store
+
+    The session is saved only when it changed. The session ID is replaced
+    when the OAuth token changes (login), so an ID known before login is useless.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        secret_key: str,
+        store,
+        session_cookie: str = "session",
+        max_age: int = 14 * 24 * 60 * 60,
+        path: str = "/",
+        same_site: str = "lax",
+        https_only: bool = False
+    ) -> None:
+        self.app = app
+        self.signer = itsdangerous.TimestampSigner(str(secret_key))
+        self.store = store
+        self.session_cookie = session_cookie
+        self.max_age = max_age
+        self.path = path
+        self.security_flags = "httponly; samesite=" + same_site
+        if https_only:
+            self.security_flags += "; secure"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        connection = HTTPConnection(scope)
+        session_id = None
+        initial = {}
+        if self.session_cookie in connection.cookies:
+            try:
+                session_id = self.signer.unsign(
+                    connection.cookies[self.session_cookie].encode("utf-8"), max_age=self.max_age
+                ).decode("utf-8")
+            except BadSignature:
+                session_id = None
+            if session_id is not None:
+                initial = self.store.get(session_id) or {}
+        # Роуты меняют копию: изменения видны по сравнению с исходной сессией
+        scope["session"] = json.loads(json.dumps(initial))
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal session_id
+            if message["type"] == "http.response.start":
+                session = scope["session"]
+                if session and session != initial:
+                    new_id = session_id
+                    if new_id is None or session.get("access_token") != initial.get("access_token"):
+                        if new_id is not None:
+                            self.store.delete(new_id)
+                        new_id = secrets.token_urlsafe(16)
+                    self.store.set(new_id, session, self.max_age)
+                    if new_id != session_id:
+                        session_id = new_id
+                        self._set_cookie(message, self.signer.sign(new_id).decode("utf-8"), f"Max-Age={self.max_age}; ")
+                elif not session and session_id is not None:
+                    # Сессия очищена (logout) или устарела
+                    self.store.delete(session_id)
+                    self._set_cookie(message, "null", "expires=Thu, 01 Jan 1970 00:00:00 GMT; ")
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _set_cookie(self, message: Message, value: str, expiry: str) -> None:
+        headers = MutableHeaders(scope=message)
+        headers.append(
+            "Set-Cookie",
+            f"{self.session_cookie}={value}; path={self.path}; {expiry}{self.security_flags}"
+        )
@@ -0,0 +1,257 @@
+"""
+Team-based trigger rules
+
+Rules in TEAM_RULES_FILE restrict who may trigger matching workflows to
+members of the listed teams:
+
+    rules:
+      - repository: my-org/infra        # fnmatch pattern of owner/repo
+        workflow: deploy-*.yml          # optional, fnmatch pattern (default: any)
+        teams: [release-managers, my-org/sre]
+
+Team rosters are kept in memory: they are loaded in the background every
+TEAM_ROSTER_REFRESH_INTERVAL and updated from membership webhooks in between,
+so checking a trigger is a set lookup without calls to GitHub.
+"""
+import os
+import asyncio
+import logging
+from fnmatch import fnmatch
+from typing import Dict, List, Optional, Set, Tuple
+
+import yaml
+
+from backend.services.github_client import get_client
+from backend.services.workflow import get_auth_token
+
+logger = logging.getLogger(__name__)
+
+# Team members per page when loading rosters (GitHub maximum)
+ROSTER_PAGE_SIZE = 100
+
+# Loaded rules: [(repository pattern, workflow pattern, ["org/team", ...])]
+_rules: List[Tuple[str, str, List[str]]] = []
+
+# Roster snapshots: {"org/team": {member logins}}; teams not loaded yet are missing
+_rosters: Dict[str, Set[str]] = {}
+
+_refresh_task: Optional[asyncio.Task] = None
+
+
+def load_rules(path: str) -> int:
+    """
+    Load trigger rules from a YAML (or JSON) file
+
+    Returns:
+        Number of rules loaded
+
+    Raises:
+        ValueError: rules file is malformed
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = yaml.safe_load(f) or {}
+    set_rules((data.get("rules") or []) if isinstance(data, dict) else data)
+    logger.info(f"Loaded {len(_rules)} team trigger rules from {path}")
+    return len(_rules)
+
+
+def set_rules(rules: List[dict]) -> None:
+    """Replace trigger rules (list of dicts in the rules file format)"""
+    global _rules
+    parsed = []
+    for rule in rules:
+        if not isinstance(rule, dict) or not rule.get("repository") or not rule.get("teams"):
+            raise ValueError(f"Invalid team rule (repository and teams are required): {rule}")
+        repository = str(rule["repository"]).lower()
+        # Команда без организации - команда владельца репозитория
+        default_org = repository.split("/", 1)[0]
+        teams = [_team_key(team, default_org) for team in rule["teams"]]
+        parsed.append((repository, str(rule.get("workflow") or "*"), teams))
+    _rules = parsed
+    # Снимки команд, которых больше нет в правилах, не нужны
+    for team in set(_rosters) - set(referenced_teams()):
+        del _rosters[team]
+
+
+def referenced_teams() -> List[str]:
+    """Teams used by the rules ("org/team")"""
+    return sorted({team for _, _, teams in _rules for team in teams})
+
+
+def required_teams(owner: str, repo: str, workflow_id: str) -> Optional[List[str]]:
+    """
+    Teams allowed to trigger the workflow
+
+    The first rule matching the repository and workflow applies, so specific
+    rules go before general ones.
+
+    Returns:
+        List of "org/team", or None if no rule applies (anyone allowed by the permission check may trigger)
+    """
+    full_name = f"{owner}/{repo}".lower()
+    workflow_name = os.path.basename(str(workflow_id))
+    for repository, workflow, teams in _rules:
+        if fnmatch(full_name, repository) and (fnmatch(workflow_name, workflow) or fnmatch(str(workflow_id), workflow)):
+            return teams
+    return None
+
+
+def is_allowed(username: str, owner: str, repo: str, workflow_id: str) -> bool:
+    """Whether the user may trigger the workflow according to the rules"""
+    teams = required_teams(owner, repo, workflow_id)
+    if teams is None:
+        return True
+    login = (username or "").lower()
+    for team in teams:
+        roster = _rosters.get(team)
+        if roster is None:
+            # Состав команды еще не загружен - не пускаем
+            logger.warning(f"Roster of team {team} is not loaded yet")
+        elif login in roster:
+            return True
+    return False
+
+
+def denial_message(username: str, owner: str, repo: str, workflow_id: str) -> str:
+    """Error shown when the rules don't allow the user to trigger the workflow"""
+    teams = ", ".join(required_teams(owner, repo, workflow_id) or [])
+    return f"User {username} may not trigger {workflow_id} in {owner}/{repo}. Only members of {teams} can trigger it."
+
+
+async def refresh_rosters() -> int:
+    """
+    Load members of all teams used by the rules
+
+    A roster that fails to load keeps its previous snapshot.
+
+    Returns:
+        Number of rosters loaded
+    """
+    teams = referenced_teams()
+    if not teams:
+        return 0
+    auth_token = await get_auth_token(None)
+    results = await asyncio.gather(*[_fetch_members(team, auth_token) for team in teams], return_exceptions=True)
+    loaded = 0
+    for team, members in zip(teams, results):
+        if isinstance(members, Exception):
+            logger.warning(f"Failed to load members of team {team}: {str(members)}")
+            continue
+        _rosters[team] = members
+        loaded += 1
+    return loaded
+
+
+async def _fetch_members(team: str, auth_token: str) -> Set[str]:
+    org, slug = team.split("/", 1)
+    client = get_client()
+    members = set()
+    page = 1
+    while True:
+        # Включает участников дочерних команд
+        response = await client.get(
+            f"https://api.github.com/orgs/{org}/teams/{slug}/members",
+            headers={
+                "Authorization": f"token {auth_token}",
+                "Accept": "application/vnd.github.v3+json"
+            },
+            params={"per_page": ROSTER_PAGE_SIZE, "page": page}
+        )
+        if response.status_code == 404:
+            logger.warning(f"Team {team} not found or not visible to the GitHub App")
+            return set()
+        response.raise_for_status()
+        data = response.json()
+        members.update(member["login"].lower() for member in data)
+        if len(data) < ROSTER_PAGE_SIZE:
+            return members
+        page += 1
+
+
+async def start_refresh(interval: float) -> None:
+    """Start the background refresh of team rosters"""
+    global _refresh_task
+    _refresh_task = asyncio.create_task(_refresh_loop(interval))
+
+
+async def stop_refresh() -> None:
+    """Stop the background refresh"""
+    global _refresh_task
+    if _refresh_task is not None:
+        _refresh_task.cancel()
+        await asyncio.gather(_refresh_task, return_exceptions=True)
+        _refresh_task = None
+
+
+async def _refresh_loop(interval: float) -> None:
+    while True:
+        try:
+            loaded = await refresh_rosters()
+            logger.info(f"Refreshed {loaded} team rosters")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Team roster refresh failed: {str(e)}")
+        await asyncio.sleep(interval)
+
+
+def apply_webhook_event(event: str, payload: dict) -> int:
+    """
+    Update roster snapshots from a GitHub webhook event
+
+    Membership of nested teams is not propagated to parent teams by webhooks;
+    parent rosters catch up on the next refresh.
+
+    Args:
+        event: Event name (X-GitHub-Event header)
+        payload: Event payload
+
+    Returns:
+        Number of rosters changed
+    """
+    org = ((payload.get("organization") or {}).get("login") or "").lower()
+    action = payload.get("action")
+
+    if event == "membership":
+        team = _team_key((payload.get("team") or {}).get("slug") or "", org)
+        login = ((payload.get("member") or {}).get("login") or "").lower()
+        roster = _rosters.get(team)
+        if roster is None or not login:
+            return 0
+        if action == "added":
+            roster.add(login)
+        elif action == "removed":
+            roster.discard(login)
+        else:
+            return 0
+        changed = 1
+    elif event == "team" and action == "deleted":
+        team = _team_key((payload.get("team") or {}).get("slug") or "", org)
+        if team not in _rosters:
+            return 0
+        _rosters[team] = set()
+        changed = 1
+    elif event == "organization" and action == "member_removed":
+        login = (((payload.get("membership") or {}).get("user") or {}).get("login") or "").lower()
+        changed = 0
+        for team, roster in _rosters.items():
+            if team.startswith(f"{org}/") and login in roster:
+                roster.discard(login)
+                changed += 1
+    else:
+        return 0
+
+    logger.info(f"Webhook {event}/{action}: updated {changed} team rosters")
+    return changed
+
+
+def clear() -> None:
+    """Forget rules and roster snapshots"""
+    global _rules
+    _rules = []
+    _rosters.clear()
+
+
+def _team_key(team: str, default_org: str) -> str:
+    team = str(team).strip().lower()
+    return team if "/" in team else f"{default_org}/{team}"
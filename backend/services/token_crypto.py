@@ -0,0 +1,25 @@
+"""
+Encryption of OAuth tokens stored on disk
+"""
+import os
+import base64
+import hashlib
+
+from cryptography.fernet import Fernet
+
+
+def _fernet() -> Fernet:
+    """Fernet cipher with a key derived from SECRET_KEY"""
+    secret_key = os.getenv("SECRET_KEY", "change-this-secret-key-in-production")
+    key = base64.urlsafe_b64encode(hashlib.sha256(secret_key.encode("utf-8")).digest())
+    return Fernet(key)
+
+
+def encrypt_token(token: str) -> str:
+    """Encrypt token for storage"""
+    return _fernet().encrypt(token.encode("utf-8")).decode("ascii")
+
+
+def decrypt_token(encrypted: str) -> str:
+    """Decrypt token encrypted with encrypt_token"""
+    return _fernet().decrypt(encrypted.encode("ascii")).decode("utf-8")
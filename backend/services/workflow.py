@@ -2,14 +2,31 @@
 Service for triggering GitHub Actions workflows
 """
 import os
+import re
+import uuid
 import asyncio
 import httpx
 import logging
 from datetime import datetime, timezone, timedelta
-from backend.services.github_app import get_installation_token, load_private_key, generate_jwt
+from typing import List, Optional, Tuple
+from backend.services.github_app import get_installation_token, load_private_key, get_app_jwt
+from backend.services.github_client import get_client
+from backend.services.cache import get as cache_get, set as cache_set
+from backend.services import dispatch_pacer
+from backend.services.outbound_limits import OutboundSaturatedError
 
 logger = logging.getLogger(__name__)
 
+# GitHub App slug rarely changes, cache it for a day
+APP_SLUG_CACHE_KEY = "github_app:slug"
+APP_SLUG_CACHE_TTL = 86400
+
+# Run listings are revalidated with ETag (304 responses don't count against the rate limit)
+RUNS_ETAG_CACHE_TTL = 600
+
+# Margin for clock skew between this server and GitHub when filtering runs by creation time
+RUNS_CREATED_SKEW = 60
+
 
 async def trigger_workflow(
     owner: str,
@@ -17,7 +34,10 @@ async def trigger_workflow(
     workflow_id: str,
     inputs: dict = None,
     ref: str = "main",
-    user_token: str = None
+    user_token: str = None,
+    correlation_input: str = None,
+    priority: int = dispatch_pacer.INTERACTIVE,
+    max_wait: Optional[float] = None
 ) -> dict:
     """
     Trigger a GitHub Actions workflow using GitHub App or user OAuth token
@@ -30,26 +50,30 @@ async def trigger_workflow(
         ref: Branch or tag to run workflow on (default: "main")
         user_token: Optional user OAuth token. If provided, workflow will be triggered as this user.
                    If None, uses GitHub App authentication.
+        correlation_input: Optional name of the input to put a unique run correlation ID into.
+                           Only used if the workflow declares this input.
+        priority: Dispatch priority for pacing (dispatch_pacer.INTERACTIVE or BULK)
+        max_wait: Maximum time to wait for a dispatch slot in seconds, None to wait as long as needed
         
     Returns:
-        Response dictionary with status and message
+        Response dictionary with status and message. Contains correlation_id
+        if the run can be found by it (the ID is surfaced in the workflow run-name).
+        If the dispatch is throttled, status_code is 429 and retry_after (seconds)
+        and queue_position are set; 503 if all GitHub call slots are busy.
     """
-    # Use user token if provided, otherwise use GitHub App
+    inputs = dict(inputs or {})
+    # Токен и схема workflow (для correlation ID) независимы - получаем параллельно
+    if correlation_input:
+        auth_token, correlation_id = await asyncio.gather(
+            get_auth_token(user_token),
+            _inject_correlation_id(owner, repo, workflow_id, inputs, correlation_input)
+        )
+    else:
+        # Use user token if provided, otherwise use GitHub App
+        auth_token, correlation_id = await get_auth_token(user_token), None
     if user_token:
-        auth_token = user_token
         logger.info(f"Triggering workflow {owner}/{repo}/{workflow_id} as authenticated user")
     else:
-        # Get GitHub App credentials
-        app_id = os.getenv("GITHUB_APP_ID")
-        installation_id = os.getenv("GITHUB_APP_INSTALLATION_ID")
-        private_key_path = os.getenv("GITHUB_APP_PRIVATE_KEY_PATH")
-        
-        if not all([app_id, installation_id]):
-            raise ValueError("GITHUB_APP_ID and GITHUB_APP_INSTALLATION_ID must be set")
-        
-        # Load private key and get installation token
-        private_key = load_private_key(private_key_path)
-        auth_token = await get_installation_token(app_id, installation_id, private_key)
         logger.info(f"Triggering workflow {owner}/{repo}/{workflow_id} as GitHub App")
     
     # Trigger workflow
@@ -61,214 +85,597 @@ async def trigger_workflow(
     
     payload = {
         "ref": ref,
-        "inputs": inputs or {}
+        "inputs": inputs
     }
     
-    try:
-        async with httpx.AsyncClient() as client:
+    client = get_client()
+    rate_limit_retried = False
+    while True:
+        try:
+            await dispatch_pacer.acquire(user_token, owner, repo, priority=priority, max_wait=max_wait)
+        except dispatch_pacer.DispatchThrottledError as e:
+            logger.warning(f"Dispatch of {owner}/{repo}/{workflow_id} throttled: {str(e)}")
+            return _throttled_result(str(e), e.retry_after, e.queue_position)
+
+        try:
             # Запоминаем время перед запуском
             trigger_time = datetime.now(timezone.utc)
             
             response = await client.post(url, headers=headers, json=payload)
             response.raise_for_status()
-            
-            # GitHub API не возвращает run_id в ответе на POST /dispatches
-            # Возвращаем trigger_time, фронтенд будет опрашивать API для поиска run
-            return {
-                "success": True,
-                "status_code": response.status_code,
-                "message": "Workflow triggered successfully",
-                "trigger_time": trigger_time.isoformat(),
-                "workflow_url": f"https://github.com/{owner}/{repo}/actions/workflows/{workflow_id}"
-            }
-    except httpx.HTTPStatusError as e:
-        error_message = "Unknown error"
-        user_friendly_message = None
-        
-        try:
-            error_data = e.response.json()
-            error_message = error_data.get("message", str(e))
-            
-            # GitHub API returns "Must have admin rights to Repository", 
-            # but actually Write permission is sufficient
-            if "admin" in error_message.lower() and "right" in error_message.lower():
-                user_friendly_message = (
-                    f"Insufficient permissions to trigger workflow.\n\n"
-                    f"GitHub API requires Write permission (or higher) in the repository to trigger workflows via API.\n"
-                    f"Note: The error message mentions 'admin rights', but Write permission is sufficient.\n\n"
-                    f"What to do:\n"
-                    f"1. Ensure you have Write (or higher) permission in repository {owner}/{repo}\n"
-                    f"2. If repository is in an organization, check organization settings:\n"
-                    f"   - Organization Settings → Policies → Actions → enable Actions\n"
-                    f"   - Organization Settings → Policies → Actions → Workflow permissions → Read and write\n"
-                    f"3. Check permissions: Repo → Settings → Collaborators & teams\n\n"
-                    f"Alternative: Set USE_USER_TOKEN_FOR_WORKFLOWS=false to use GitHub App account instead"
+            break
+        except OutboundSaturatedError as e:
+            # Запрос до GitHub не дошел - слот темпа не расходуем
+            dispatch_pacer.refund(user_token, owner, repo)
+            logger.warning(f"Dispatch of {owner}/{repo}/{workflow_id} rejected: {str(e)}")
+            result = _throttled_result(str(e), e.retry_after)
+            result["status_code"] = e.status_code
+            return result
+        except httpx.HTTPStatusError as e:
+            retry_after = _rate_limit_retry_after(e.response)
+            if retry_after is None:
+                return _dispatch_error(e, owner, repo)
+            # Вторичный лимит GitHub: приостанавливаем все запуски с этим токеном/в этот репозиторий
+            dispatch_pacer.defer(user_token, owner, repo, retry_after)
+            if rate_limit_retried:
+                return _throttled_result(
+                    f"GitHub rate limit for workflow dispatches reached, try again in {int(retry_after) + 1}s",
+                    retry_after
                 )
-        except:
-            error_message = str(e)
+            # Повторяем один раз - acquire дождется окончания паузы или вернет 429, если ждать дольше max_wait
+            rate_limit_retried = True
+    
+    # GitHub API не возвращает run_id в ответе на POST /dispatches
+    # Возвращаем trigger_time, фронтенд будет опрашивать API для поиска run
+    result = {
+        "success": True,
+        "status_code": response.status_code,
+        "message": "Workflow triggered successfully",
+        "trigger_time": trigger_time.isoformat(),
+        "workflow_url": f"https://github.com/{owner}/{repo}/actions/workflows/{workflow_id}"
+    }
+    if correlation_id:
+        result["correlation_id"] = correlation_id
+    return result
+
+
+def _throttled_result(message: str, retry_after: float, queue_position: Optional[int] = None) -> dict:
+    result = {
+        "success": False,
+        "status_code": 429,
+        "message": message,
+        "retry_after": int(retry_after) + 1
+    }
+    if queue_position is not None:
+        result["queue_position"] = queue_position
+    return result
+
+
+def _rate_limit_retry_after(response: httpx.Response) -> Optional[float]:
+    """
+    Seconds to wait if GitHub rejected the request because of a rate limit, else None
+    
+    Primary limits come with x-ratelimit-remaining: 0, secondary ones with
+    Retry-After or just a "secondary rate limit" message (then waiting a minute is advised).
+    """
+    if response.status_code not in (403, 429):
+        return None
+    headers = response.headers
+    retry_after = headers.get("retry-after")
+    if isinstance(retry_after, str) and retry_after.isdigit():
+        return float(retry_after)
+    reset = headers.get("x-ratelimit-reset")
+    if headers.get("x-ratelimit-remaining") == "0" and isinstance(reset, str) and reset.isdigit():
+        return max(float(reset) - datetime.now(timezone.utc).timestamp(), 1.0)
+    try:
+        message = str(response.json().get("message", ""))
+    except Exception:
+        message = ""
+    if response.status_code == 429 or "secondary rate limit" in message.lower():
+        return 60.0
+    return None
+
+
+def _dispatch_error(e: httpx.HTTPStatusError, owner: str, repo: str) -> dict:
+    """Error result of a failed POST /dispatches"""
+    error_message = "Unknown error"
+    user_friendly_message = None
+    
+    try:
+        error_data = e.response.json()
+        error_message = error_data.get("message", str(e))
         
-        logger.error(f"Failed to trigger workflow: {error_message} (status: {e.response.status_code})")
+        # GitHub API returns "Must have admin rights to Repository", 
+        # but actually Write permission is sufficient
+        if "admin" in error_message.lower() and "right" in error_message.lower():
+            user_friendly_message = (
+                f"Insufficient permissions to trigger workflow.\n\n"
+                f"GitHub API requires Write permission (or higher) in the repository to trigger workflows via API.\n"
+                f"Note: The error message mentions 'admin rights', but Write permission is sufficient.\n\n"
+                f"What to do:\n"
+                f"1. Ensure you have Write (or higher) permission in repository {owner}/{repo}\n"
+                f"2. If repository is in an organization, check organization settings:\n"
+                f"   - Organization Settings → Policies → Actions → enable Actions\n"
+                f"   - Organization Settings → Policies → Actions → Workflow permissions → Read and write\n"
+                f"3. Check permissions: Repo → Settings → Collaborators & teams\n\n"
+                f"Alternative: Set USE_USER_TOKEN_FOR_WORKFLOWS=false to use GitHub App account instead"
+            )
+    except:
+        error_message = str(e)
+    
+    logger.error(f"Failed to trigger workflow: {error_message} (status: {e.response.status_code})")
+    
+    # Используем понятное сообщение, если доступно, иначе оригинальное
+    final_message = user_friendly_message if user_friendly_message else f"Failed to trigger workflow: {error_message}"
+    
+    return {
+        "success": False,
+        "status_code": e.response.status_code,
+        "message": final_message
+    }
+
+
+async def _inject_correlation_id(
+    owner: str,
+    repo: str,
+    workflow_id: str,
+    inputs: dict,
+    correlation_input: str
+) -> Optional[str]:
+    """
+    Put a unique correlation ID into inputs if the workflow declares the correlation input
+    
+    Args:
+        owner: Repository owner
+        repo: Repository name
+        workflow_id: Workflow ID
+        inputs: Dispatch inputs (modified in place)
+        correlation_input: Name of the correlation input
         
-        # Используем понятное сообщение, если доступно, иначе оригинальное
-        final_message = user_friendly_message if user_friendly_message else f"Failed to trigger workflow: {error_message}"
+    Returns:
+        Correlation ID if the run can be matched by it (the ID is surfaced
+        in the run title via run-name), None otherwise
+    """
+    from backend.services.workflow_info import get_workflow_info
+    
+    try:
+        workflow_info = await get_workflow_info(owner, repo, workflow_id)
+    except Exception as e:
+        logger.warning(f"Failed to get workflow info for run correlation: {str(e)}")
+        return None
+    
+    if correlation_input not in workflow_info.get("inputs", {}):
+        return None
+    
+    # Значение, переданное вызывающей стороной, имеет приоритет
+    if not inputs.get(correlation_input):
+        inputs[correlation_input] = uuid.uuid4().hex
+    correlation_id = str(inputs[correlation_input])
+    
+    # GitHub не возвращает inputs в списке runs, ID виден только в заголовке run (run-name)
+    run_name = workflow_info.get("run_name") or ""
+    if not re.search(rf"\binputs\.{re.escape(correlation_input)}\b", run_name):
+        logger.debug(f"Workflow {workflow_id} does not surface '{correlation_input}' in run-name, falling back to time-based run search")
+        return None
+    return correlation_id
+
+
+async def get_auth_token(user_token: str = None) -> str:
+    """
+    Get token for GitHub API calls: user OAuth token if provided, otherwise GitHub App installation token
+    
+    Args:
+        user_token: Optional user OAuth token
         
-        return {
-            "success": False,
-            "status_code": e.response.status_code,
-            "message": final_message
+    Returns:
+        Token to use in Authorization header
+    """
+    if user_token:
+        return user_token
+    
+    # Get GitHub App credentials
+    app_id = os.getenv("GITHUB_APP_ID")
+    installation_id = os.getenv("GITHUB_APP_INSTALLATION_ID")
+    private_key_path = os.getenv("GITHUB_APP_PRIVATE_KEY_PATH")
+    
+    if not all([app_id, installation_id]):
+        raise ValueError("GITHUB_APP_ID and GITHUB_APP_INSTALLATION_ID must be set")
+    
+    # Load private key and get installation token
+    private_key = load_private_key(private_key_path)
+    return await get_installation_token(app_id, installation_id, private_key)
+
+
+async def prefetch_auth_token(user_token: str = None) -> None:
+    """
+    Get the dispatch token ahead of time (e.g. while permissions are checked)
+    
+    Installation tokens are cached, so the following trigger_workflow doesn't
+    wait for the mint. Errors are ignored here: trigger_workflow reports them.
+    """
+    try:
+        await get_auth_token(user_token)
+    except Exception as e:
+        logger.debug(f"Failed to prefetch auth token: {str(e)}")
+
+
+async def get_app_slug() -> Optional[str]:
+    """
+    Get GitHub App slug (used to recognize runs triggered by the App)
+    
+    Returns:
+        App slug (e.g., "github-action-executor"), or None if it can't be determined
+    """
+    app_slug = cache_get(APP_SLUG_CACHE_KEY)
+    if app_slug is not None:
+        return app_slug
+    
+    app_id = os.getenv("GITHUB_APP_ID")
+    private_key_path = os.getenv("GITHUB_APP_PRIVATE_KEY_PATH")
+    if not (app_id and private_key_path):
+        return None
+    
+    try:
+        private_key = load_private_key(private_key_path)
+        app_headers = {
+            "Authorization": f"Bearer {await get_app_jwt(app_id, private_key)}",
+            "Accept": "application/vnd.github.v3+json"
         }
+        client = get_client()
+        app_response = await client.get("https://api.github.com/app", headers=app_headers)
+        if app_response.status_code == 200:
+            app_slug = app_response.json().get("slug")
+            if app_slug:
+                cache_set(APP_SLUG_CACHE_KEY, app_slug, APP_SLUG_CACHE_TTL)
+            return app_slug
+    except Exception:
+        pass  # Если не удалось получить app info, будем искать по времени
+    return None
 
 
-async def find_workflow_run(
+async def list_workflow_runs(
     owner: str,
     repo: str,
     workflow_id: str,
-    trigger_time: datetime,
+    auth_token: str,
     ref: str = None,
-    user_token: str = None,
-    expected_actor_login: str = None
-) -> dict:
+    actor: str = None,
+    created_after: datetime = None
+) -> list:
     """
-    Find workflow run by trigger time and actor (GitHub App or User)
+    List the most recent workflow_dispatch runs of a workflow
+    
+    Filters are applied on GitHub's side so that a poll transfers only a handful
+    of runs, and the listing is revalidated with ETag (304 if nothing changed).
     
     Args:
         owner: Repository owner
         repo: Repository name
         workflow_id: Workflow ID
-        trigger_time: When workflow was triggered (datetime object)
+        auth_token: Token for Authorization header
         ref: Optional branch name to filter by
-        user_token: Optional user OAuth token. If provided, searches for runs triggered by this user.
-        expected_actor_login: Optional expected actor login (username). Used when searching for user-triggered runs.
+        actor: Optional login of the user who triggered the runs
+        created_after: Optional time; only runs created after it (minus clock skew margin) are listed
         
     Returns:
-        Run data if found, None otherwise
+        List of workflow runs as returned by GitHub API
     """
-    # Use user token if provided, otherwise use GitHub App
-    if user_token:
-        auth_token = user_token
-        logger.info(f"Searching for workflow run {owner}/{repo}/{workflow_id} triggered by user")
-    else:
-        # Get GitHub App credentials
-        app_id = os.getenv("GITHUB_APP_ID")
-        installation_id = os.getenv("GITHUB_APP_INSTALLATION_ID")
-        private_key_path = os.getenv("GITHUB_APP_PRIVATE_KEY_PATH")
-        
-        if not all([app_id, installation_id]):
-            raise ValueError("GITHUB_APP_ID and GITHUB_APP_INSTALLATION_ID must be set")
-        
-        # Load private key and get installation token
-        private_key = load_private_key(private_key_path)
-        auth_token = await get_installation_token(app_id, installation_id, private_key)
-        logger.info(f"Searching for workflow run {owner}/{repo}/{workflow_id} triggered by GitHub App")
-    
     headers = {
         "Authorization": f"token {auth_token}",
         "Accept": "application/vnd.github.v3+json"
     }
     
-    async with httpx.AsyncClient() as client:
-        # Get app info to identify actor (only if using GitHub App)
-        app_slug = None
-        if not user_token:
-            app_id = os.getenv("GITHUB_APP_ID")
-            private_key_path = os.getenv("GITHUB_APP_PRIVATE_KEY_PATH")
-            if app_id and private_key_path:
-                private_key = load_private_key(private_key_path)
-                app_url = f"https://api.github.com/app"
-                app_headers = {
-                    "Authorization": f"Bearer {generate_jwt(app_id, private_key)}",
-                    "Accept": "application/vnd.github.v3+json"
-                }
-                
-                try:
-                    app_response = await client.get(app_url, headers=app_headers)
-                    if app_response.status_code == 200:
-                        app_data = app_response.json()
-                        app_slug = app_data.get("slug")  # e.g., "github-action-executor"
-                except Exception:
-                    pass  # Если не удалось получить app info, будем искать по времени
+    runs_url = f"https://api.github.com/repos/{owner}/{repo}/actions/workflows/{workflow_id}/runs"
+    params = {
+        "per_page": 20,
+        "event": "workflow_dispatch",
+    }
+    if ref:
+        params["branch"] = ref
+    if actor:
+        params["actor"] = actor
+    if created_after:
+        created_since = created_after.astimezone(timezone.utc) - timedelta(seconds=RUNS_CREATED_SKEW)
+        params["created"] = f">={created_since.strftime('%Y-%m-%dT%H:%M:%SZ')}"
+    
+    # Повторный запрос с тем же ETag возвращает 304 без тела
+    cache_key = f"workflow_runs:{owner}:{repo}:{workflow_id}:" + "&".join(f"{k}={v}" for k, v in sorted(params.items()))
+    cached = cache_get(cache_key)
+    if cached is not None:
+        headers["If-None-Match"] = cached[0]
+    
+    client = get_client()
+    runs_response = await client.get(runs_url, headers=headers, params=params)
+    if runs_response.status_code == 304 and cached is not None:
+        logger.debug(f"Runs of {owner}/{repo}/{workflow_id} not modified")
+        return cached[1]
+    runs_response.raise_for_status()
+    
+    runs_data = runs_response.json()
+    workflow_runs = runs_data.get("workflow_runs", [])
+    
+    etag = runs_response.headers.get("ETag")
+    if isinstance(etag, str) and etag:
+        cache_set(cache_key, (etag, workflow_runs), RUNS_ETAG_CACHE_TTL)
+    return workflow_runs
+
+
+async def get_workflow_run(owner: str, repo: str, run_id: int, auth_token: str) -> dict:
+    """
+    Get a workflow run, revalidated with ETag (304 if nothing changed)
+    
+    Args:
+        owner: Repository owner
+        repo: Repository name
+        run_id: Workflow run ID
+        auth_token: Token for Authorization header
         
-        # Get workflow runs
-        runs_url = f"https://api.github.com/repos/{owner}/{repo}/actions/workflows/{workflow_id}/runs"
-        params = {
-            "per_page": 20,
-        }
-        if ref:
-            params["branch"] = ref
+    Returns:
+        Workflow run as returned by GitHub API
+    """
+    headers = {
+        "Authorization": f"token {auth_token}",
+        "Accept": "application/vnd.github.v3+json"
+    }
+    cache_key = f"workflow_run:{owner}:{repo}:{run_id}"
+    cached = cache_get(cache_key)
+    if cached is not None:
+        headers["If-None-Match"] = cached[0]
+    
+    client = get_client()
+    response = await client.get(f"https://api.github.com/repos/{owner}/{repo}/actions/runs/{run_id}", headers=headers)
+    if response.status_code == 304 and cached is not None:
+        return cached[1]
+    response.raise_for_status()
+    
+    run = response.json()
+    etag = response.headers.get("ETag")
+    if isinstance(etag, str) and etag:
+        cache_set(cache_key, (etag, run), RUNS_ETAG_CACHE_TTL)
+    return run
+
+
+async def get_run_jobs(owner: str, repo: str, run_id: int, auth_token: str) -> List[dict]:
+    """
+    Get jobs of a workflow run (first 100), revalidated with ETag (304 if nothing changed)
+    
+    Args:
+        owner: Repository owner
+        repo: Repository name
+        run_id: Workflow run ID
+        auth_token: Token for Authorization header
         
-        runs_response = await client.get(runs_url, headers=headers, params=params)
-        runs_response.raise_for_status()
+    Returns:
+        Jobs as returned by GitHub API
+    """
+    headers = {
+        "Authorization": f"token {auth_token}",
+        "Accept": "application/vnd.github.v3+json"
+    }
+    cache_key = f"workflow_run_jobs:{owner}:{repo}:{run_id}"
+    cached = cache_get(cache_key)
+    if cached is not None:
+        headers["If-None-Match"] = cached[0]
+    
+    client = get_client()
+    response = await client.get(
+        f"https://api.github.com/repos/{owner}/{repo}/actions/runs/{run_id}/jobs",
+        headers=headers,
+        params={"per_page": 100}
+    )
+    if response.status_code == 304 and cached is not None:
+        return cached[1]
+    response.raise_for_status()
+    
+    jobs = response.json().get("jobs", [])
+    etag = response.headers.get("ETag")
+    if isinstance(etag, str) and etag:
+        cache_set(cache_key, (etag, jobs), RUNS_ETAG_CACHE_TTL)
+    return jobs
+
+
+async def get_run_progress(owner: str, repo: str, run_id: int, auth_token: str) -> dict:
+    """
+    Get current status of a workflow run and its jobs
+    
+    Both requests are revalidated with ETag, so polling an unchanged run
+    doesn't count against the rate limit.
+    
+    Args:
+        owner: Repository owner
+        repo: Repository name
+        run_id: Workflow run ID
+        auth_token: Token for Authorization header
         
-        runs_data = runs_response.json()
-        workflow_runs = runs_data.get("workflow_runs", [])
+    Returns:
+        Dictionary with run status, conclusion and per-job progress
+    """
+    run, run_jobs = await asyncio.gather(
+        get_workflow_run(owner, repo, run_id, auth_token),
+        get_run_jobs(owner, repo, run_id, auth_token)
+    )
+    
+    jobs = []
+    for job in run_jobs:
+        steps = job.get("steps") or []
+        jobs.append({
+            "id": job.get("id"),
+            "name": job.get("name"),
+            "status": job.get("status"),
+            "conclusion": job.get("conclusion"),
+            "html_url": job.get("html_url"),
+            "steps_total": len(steps),
+            "steps_completed": sum(1 for step in steps if step.get("status") == "completed")
+        })
+    
+    return {
+        "run_id": run.get("id", run_id),
+        "run_url": run.get("html_url") or f"https://github.com/{owner}/{repo}/actions/runs/{run_id}",
+        "status": run.get("status"),
+        "conclusion": run.get("conclusion"),
+        "created_at": run.get("created_at"),
+        "jobs": jobs
+    }
+
+
+def select_candidate_runs(
+    workflow_runs: list,
+    trigger_time: datetime,
+    ref: str = None,
+    expected_actor_login: str = None,
+    app_slug: str = None,
+    correlation_id: str = None
+) -> List[Tuple[datetime, dict]]:
+    """
+    Select runs that may belong to a dispatch made at trigger_time
+    
+    Args:
+        workflow_runs: Runs as returned by GitHub API
+        trigger_time: When workflow was triggered
+        ref: Optional branch name to filter by
+        expected_actor_login: Login of the user who triggered the workflow.
+                              If None, runs triggered by the GitHub App are searched.
+        app_slug: Optional GitHub App slug to recognize App-triggered runs
+        correlation_id: Optional correlation ID injected at dispatch. If given, only
+                        runs with this ID in the title match, time and actor are ignored.
         
-        # Фильтруем runs по времени и другим критериям
-        # Ищем самый свежий run, созданный после trigger_time
-        candidate_runs = []
+    Returns:
+        List of (created_at, run) tuples, freshest first
+    """
+    # Фильтруем runs по времени и другим критериям
+    candidate_runs = []
+    
+    # Определяем временное окно для поиска (от trigger_time до 30 секунд после)
+    time_window_start = trigger_time - timedelta(seconds=5)  # Небольшой запас назад
+    time_window_end = trigger_time + timedelta(seconds=30)   # Окно в будущее
+    
+    for run in workflow_runs:
+        actor = run.get("actor", {})
+        actor_login = actor.get("login", "")
+        actor_type = actor.get("type", "")
+        created_at_str = run.get("created_at")
+        run_ref = run.get("head_branch")
         
-        # Определяем временное окно для поиска (от trigger_time до 30 секунд после)
-        time_window_start = trigger_time - timedelta(seconds=5)  # Небольшой запас назад
-        time_window_end = trigger_time + timedelta(seconds=30)   # Окно в будущее
+        # Проверяем ветку если указана
+        if ref and run_ref != ref:
+            continue
         
-        for run in workflow_runs:
-            actor = run.get("actor", {})
-            actor_login = actor.get("login", "")
-            actor_type = actor.get("type", "")
-            created_at_str = run.get("created_at")
-            run_ref = run.get("head_branch")
-            
-            # Проверяем ветку если указана
-            if ref and run_ref != ref:
-                continue
-            
-            if created_at_str:
+        # Точное совпадение по correlation ID в заголовке run
+        if correlation_id:
+            if correlation_id in (run.get("display_title") or "") and created_at_str:
                 try:
                     created_at = datetime.fromisoformat(created_at_str.replace('Z', '+00:00'))
+                except ValueError:
+                    continue
+                logger.debug(f"Found run by correlation ID: id={run.get('id')}, correlation_id={correlation_id}")
+                candidate_runs.append((created_at, run))
+            continue
+        
+        if created_at_str:
+            try:
+                created_at = datetime.fromisoformat(created_at_str.replace('Z', '+00:00'))
+                
+                # Проверяем, что run создан в нашем временном окне
+                if time_window_start <= created_at <= time_window_end:
+                    is_match = False
                     
-                    # Проверяем, что run создан в нашем временном окне
-                    if time_window_start <= created_at <= time_window_end:
-                        is_match = False
+                    if expected_actor_login:
+                        # Ищем run от имени пользователя
+                        if actor_login == expected_actor_login and actor_type == "User":
+                            is_match = True
+                            logger.debug(f"Found candidate user run: id={run.get('id')}, created_at={created_at_str}, actor={actor_login}")
+                    else:
+                        # Ищем run от имени GitHub App
+                        if app_slug:
+                            # Проверяем по slug
+                            if (actor_login == app_slug or 
+                                actor_login == f"{app_slug}[bot]"):
+                                is_match = True
                         
-                        if user_token and expected_actor_login:
-                            # Ищем run от имени пользователя
-                            if actor_login == expected_actor_login and actor_type == "User":
+                        # Также проверяем по типу Bot
+                        # GitHub Apps всегда имеют type="Bot"
+                        if actor_type == "Bot":
+                            # Если app_slug не совпал, но это бот и время совпадает,
+                            # считаем что это наш запуск (вероятность другого бота низкая)
+                            if not app_slug or is_match:
                                 is_match = True
-                                logger.debug(f"Found candidate user run: id={run.get('id')}, created_at={created_at_str}, actor={actor_login}")
-                        else:
-                            # Ищем run от имени GitHub App
-                            if app_slug:
-                                # Проверяем по slug
-                                if (actor_login == app_slug or 
-                                    actor_login == f"{app_slug}[bot]"):
-                                    is_match = True
-                            
-                            # Также проверяем по типу Bot
-                            # GitHub Apps всегда имеют type="Bot"
-                            if actor_type == "Bot":
-                                # Если app_slug не совпал, но это бот и время совпадает,
-                                # считаем что это наш запуск (вероятность другого бота низкая)
-                                if not app_slug or is_match:
-                                    is_match = True
-                            
-                            if is_match:
-                                logger.debug(f"Found candidate app run: id={run.get('id')}, created_at={created_at_str}, actor={actor_login}")
                         
                         if is_match:
-                            candidate_runs.append((created_at, run))
-                except (ValueError, AttributeError) as e:
-                    logger.debug(f"Error parsing created_at for run: {e}")
-                    pass
-        
-        # Если нашли подходящие runs, возвращаем самый свежий (самый поздний по времени)
-        if candidate_runs:
-            # Сортируем по времени создания (самый свежий первым)
-            candidate_runs.sort(key=lambda x: x[0], reverse=True)
-            _, best_run = candidate_runs[0]
-            run_id = best_run.get("id")
-            run_url = best_run.get("html_url")
-            logger.info(f"Found workflow run: id={run_id}, url={run_url}")
-            return best_run
-        
-        logger.warning(f"Workflow run not found for {owner}/{repo}/{workflow_id} triggered at {trigger_time}")
-        return None
+                            logger.debug(f"Found candidate app run: id={run.get('id')}, created_at={created_at_str}, actor={actor_login}")
+                    
+                    if is_match:
+                        candidate_runs.append((created_at, run))
+            except (ValueError, AttributeError) as e:
+                logger.debug(f"Error parsing created_at for run: {e}")
+                pass
+    
+    # Сортируем по времени создания (самый свежий первым)
+    candidate_runs.sort(key=lambda x: x[0], reverse=True)
+    return candidate_runs
+
 
+async def find_workflow_run(
+    owner: str,
+    repo: str,
+    workflow_id: str,
+    trigger_time: datetime,
+    ref: str = None,
+    user_token: str = None,
+    expected_actor_login: str = None,
+    correlation_id: str = None
+) -> dict:
+    """
+    Find workflow run by trigger time and actor (GitHub App or User)
+    
+    Args:
+        owner: Repository owner
+        repo: Repository name
+        workflow_id: Workflow ID
+        trigger_time: When workflow was triggered (datetime object)
+        ref: Optional branch name to filter by
+        user_token: Optional user OAuth token. If provided, searches for runs triggered by this user.
+        expected_actor_login: Optional expected actor login (username). Used when searching for user-triggered runs.
+        correlation_id: Optional correlation ID returned by trigger_workflow. If given,
+                        the run is matched by it exactly.
+        
+    Returns:
+        Run data if found, None otherwise
+    """
+    # Use user token if provided, otherwise use GitHub App
+    auth_token = await get_auth_token(user_token)
+    if user_token:
+        logger.info(f"Searching for workflow run {owner}/{repo}/{workflow_id} triggered by user")
+    else:
+        logger.info(f"Searching for workflow run {owner}/{repo}/{workflow_id} triggered by GitHub App")
+    
+    # Get app info to identify actor (only if using GitHub App)
+    app_slug = None
+    if not user_token and not correlation_id:
+        app_slug = await get_app_slug()
+    
+    workflow_runs = await list_workflow_runs(
+        owner, repo, workflow_id, auth_token,
+        ref=ref,
+        actor=expected_actor_login if user_token else None,
+        created_after=trigger_time
+    )
+    
+    candidate_runs = select_candidate_runs(
+        workflow_runs,
+        trigger_time,
+        ref=ref,
+        expected_actor_login=expected_actor_login if user_token else None,
+        app_slug=app_slug,
+        correlation_id=correlation_id
+    )
+    
+    # Если нашли подходящие runs, возвращаем самый свежий (самый поздний по времени)
+    if candidate_runs:
+        _, best_run = candidate_runs[0]
+        run_id = best_run.get("id")
+        run_url = best_run.get("html_url")
+        logger.info(f"Found workflow run: id={run_id}, url={run_url}")
+        return best_run
+    
+    logger.warning(f"Workflow run not found for {owner}/{repo}/{workflow_id} triggered at {trigger_time}")
+    return None
@@ -4,8 +4,10 @@ Service for getting repository workflows from GitHub API
 import os
 import logging
 import httpx
+from typing import Optional
 from backend.services.github_app import get_installation_token, load_private_key
 from backend.services.cache import get as cache_get, set as cache_set
+from backend.services.github_client import get_client
 
 logger = logging.getLogger(__name__)
 
@@ -13,6 +15,20 @@ logger = logging.getLogger(__name__)
 CACHE_TTL = 300
 
 
+def get_cached_workflows(owner: str, repo: str) -> Optional[list]:
+    """
+    Get workflows from cache without calling GitHub API
+    
+    Args:
+        owner: Repository owner
+        repo: Repository name
+        
+    Returns:
+        Cached list of workflows, or None if not cached
+    """
+    return cache_get(f"workflows:{owner}:{repo}")
+
+
 async def get_workflows(owner: str, repo: str) -> list:
     """
     Get list of workflows from repository
@@ -55,39 +71,39 @@ async def get_workflows(owner: str, repo: str) -> list:
     }
     
     try:
-        async with httpx.AsyncClient() as client:
-            # Get workflows
-            workflows_url = f"https://api.github.com/repos/{owner}/{repo}/actions/workflows"
-            response = await client.get(
-                workflows_url,
-                headers=headers,
-                params={"per_page": 100}  # GitHub default is 30, max is 100
-            )
-            response.raise_for_status()
-            
-            workflows_data = response.json()
-            workflows_list = []
-            
-            for workflow in workflows_data.get("workflows", []):
-                # Extract workflow file name from path
-                path = workflow.get("path", "")
-                workflow_id = path.split("/")[-1] if "/" in path else path
-                
-                workflows_list.append({
-                    "id": workflow_id,
-                    "name": workflow.get("name", workflow_id),
-                    "path": path,
-                    "state": workflow.get("state", "active")
-                })
-            
-            # Sort by name
-            workflows_list.sort(key=lambda x: x["name"].lower())
-            
-            # Cache the result
-            cache_set(cache_key, workflows_list, CACHE_TTL)
-            logger.info(f"Fetched {len(workflows_list)} workflows from API for {owner}/{repo}")
-            return workflows_list
+        client = get_client()
+        # Get workflows
+        workflows_url = f"https://api.github.com/repos/{owner}/{repo}/actions/workflows"
+        response = await client.get(
+            workflows_url,
+            headers=headers,
+            params={"per_page": 100}  # GitHub default is 30, max is 100
+        )
+        response.raise_for_status()
+        
+        workflows_data = response.json()
+        workflows_list = []
+        
+        for workflow in workflows_data.get("workflows", []):
+            # Extract workflow file name from path
+            path = workflow.get("path", "")
+            workflow_id = path.split("/")[-1] if "/" in path else path
             
+            workflows_list.append({
+                "id": workflow_id,
+                "name": workflow.get("name", workflow_id),
+                "path": path,
+                "state": workflow.get("state", "active")
+            })
+        
+        # Sort by name
+        workflows_list.sort(key=lambda x: x["name"].lower())
+        
+        # Cache the result
+        cache_set(cache_key, workflows_list, CACHE_TTL)
+        logger.info(f"Fetched {len(workflows_list)} workflows from API for {owner}/{repo}")
+        return workflows_list
+        
     except httpx.HTTPStatusError as e:
         logger.error(f"Failed to get workflows: {e.response.status_code} - {e.response.text}")
         raise
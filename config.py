@@ -2,7 +2,8 @@
 Configuration file for GitHub Action Executor
 """
 import os
-from typing import List
+import logging
+from typing import Dict, List
 
 # Автоматическое открытие ссылки на запуск workflow
 # По умолчанию: True (включено)
@@ -43,3 +44,207 @@ CHECK_PERMISSIONS = os.getenv("CHECK_PERMISSIONS", "true").lower() == "true"
 # Если False, workflow выполняются от имени GitHub App
 USE_USER_TOKEN_FOR_WORKFLOWS = os.getenv("USE_USER_TOKEN_FOR_WORKFLOWS", "true").lower() == "true"
 
+
+# Бюджет времени (в миллисекундах) на загрузку workflows при рендеринге главной страницы
+# Если данных нет в кэше и GitHub не ответил за это время, страница отдается сразу,
+# а загрузка продолжается в фоне и прогревает кэш (форма дозагрузит данные через /api/bootstrap)
+# 0 - не ждать GitHub вообще, использовать только кэш
+# По умолчанию: 300 мс
+INDEX_RENDER_BUDGET_MS = int(os.getenv("INDEX_RENDER_BUDGET_MS", "300"))
+
+
+# Имя input'а workflow_dispatch для точной корреляции запуска с run
+# Если workflow объявляет этот input, в него подставляется уникальный ID запуска.
+# Если ID выводится в run-name (например, run-name: "CI [${{ inputs.executor_run_id }}]"),
+# run находится по точному совпадению в заголовке, а не по времени и автору
+# Пусто - выключено (используется поиск по времени и автору)
+RUN_CORRELATION_INPUT = os.getenv("RUN_CORRELATION_INPUT", "")
+
+
+# Сколько workflows одновременно запускает /api/trigger/batch
+# По умолчанию: 5
+BATCH_TRIGGER_CONCURRENCY = int(os.getenv("BATCH_TRIGGER_CONCURRENCY", "5"))
+
+
+# Директория для локальных данных (SQLite базы очереди запусков и т.п.)
+# По умолчанию: data (относительно рабочей директории)
+DATA_DIR = os.getenv("DATA_DIR", "data")
+
+
+# Асинхронный запуск: /api/trigger сразу отвечает 202 с ID задачи, а запуск выполняют фоновые workers
+# Очередь хранится в SQLite (DATA_DIR) и переживает перезапуск приложения
+# По умолчанию: False (запрос ждет, пока workflow будет запущен)
+ASYNC_DISPATCH = os.getenv("ASYNC_DISPATCH", "false").lower() == "true"
+
+# Количество фоновых workers очереди запусков
+DISPATCH_WORKERS = int(os.getenv("DISPATCH_WORKERS", "4"))
+
+# Сколько раз пытаться запустить workflow при временных ошибках GitHub (5xx, 429, сеть)
+DISPATCH_MAX_ATTEMPTS = int(os.getenv("DISPATCH_MAX_ATTEMPTS", "5"))
+
+
+# Окно подавления повторных запусков (секунды)
+# Одинаковые запуски (пользователь, репозиторий, workflow, ветка, inputs) в течение окна
+# не запускают workflow повторно, а возвращают результат первого запуска
+# (двойной клик, предпросмотр ссылок ботами, prefetch браузера)
+# 0 - выключено
+# По умолчанию: 10
+DUPLICATE_DISPATCH_WINDOW = int(os.getenv("DUPLICATE_DISPATCH_WINDOW", "10"))
+
+
+# Темп запусков workflow (защита от secondary rate limits GitHub на создание контента)
+# Запуски ждут свободный слот вместо ошибок 403; одиночные запуски идут раньше массовых (batch)
+# Запусков в минуту на один токен (пользователь или GitHub App)
+DISPATCH_RATE_PER_TOKEN = int(os.getenv("DISPATCH_RATE_PER_TOKEN", "60"))
+
+# Запусков в минуту в один репозиторий
+DISPATCH_RATE_PER_REPO = int(os.getenv("DISPATCH_RATE_PER_REPO", "30"))
+
+# Сколько запусков можно сделать подряд без ожидания
+DISPATCH_BURST = int(os.getenv("DISPATCH_BURST", "10"))
+
+# Сколько секунд одиночный запуск может ждать слот; дольше - ответ 429 с Retry-After и позицией в очереди
+DISPATCH_MAX_WAIT = int(os.getenv("DISPATCH_MAX_WAIT", "10"))
+
+
+# История запусков (хранится локально в DATA_DIR, доступна через /api/history)
+# По умолчанию: False (история не записывается, статусы run в фоне не проверяются)
+HISTORY_ENABLED = os.getenv("HISTORY_ENABLED", "false").lower() == "true"
+
+# Как часто проверять статус незавершенных run'ов в истории (секунды), 0 - не проверять
+# По умолчанию: 60
+HISTORY_SYNC_INTERVAL = int(os.getenv("HISTORY_SYNC_INTERVAL", "60"))
+
+# Сколько дней хранить историю запусков
+# По умолчанию: 90
+HISTORY_RETENTION_DAYS = int(os.getenv("HISTORY_RETENTION_DAYS", "90"))
+
+
+# Файл правил "только участники команды X могут запускать workflow Y" (YAML или JSON)
+# Пример:
+#   rules:
+#     - repository: my-org/infra       # шаблон owner/repo (fnmatch)
+#       workflow: deploy-*.yml         # шаблон имени workflow, по умолчанию любой
+#       teams: [release-managers]      # команды (slug или org/slug)
+# Применяется первое подходящее правило; правила действуют в дополнение к CHECK_PERMISSIONS
+# Пусто - правила не используются
+TEAM_RULES_FILE = os.getenv("TEAM_RULES_FILE", "")
+
+# Как часто перезагружать составы команд из правил (секунды)
+# Между перезагрузками составы обновляются webhook'ами membership
+# По умолчанию: 600
+TEAM_ROSTER_REFRESH_INTERVAL = int(os.getenv("TEAM_ROSTER_REFRESH_INTERVAL", "600"))
+
+
+# Проверять inputs и ветку запуска по кэшированной схеме workflow до обращения к GitHub
+# Ошибки (неизвестный input, неверное значение choice, несуществующая ветка) возвращаются сразу с кодом 422
+# По умолчанию: true
+VALIDATE_DISPATCH = os.getenv("VALIDATE_DISPATCH", "true").lower() == "true"
+
+
+# Оптимистичный запуск: не проверять права отдельным запросом, а сразу запускать workflow
+# Работает только вместе с USE_USER_TOKEN_FOR_WORKFLOWS=true и CHECK_PERMISSIONS=true:
+# запуск идет от имени пользователя, и GitHub сам отклоняет его (403/404) без прав на запись -
+# такой ответ показывается как обычная ошибка "не коллаборатор"
+# По умолчанию: false
+OPTIMISTIC_DISPATCH = os.getenv("OPTIMISTIC_DISPATCH", "false").lower() == "true"
+
+
+# Секрет webhook GitHub (POST /webhooks/github), подпись X-Hub-Signature-256 проверяется
+# События об изменении коллабораторов и команд сбрасывают кэш прав пользователей
+# Если не задан - прием webhook выключен
+GITHUB_WEBHOOK_SECRET = os.getenv("GITHUB_WEBHOOK_SECRET", "")
+
+
+# Где хранить сессии пользователей:
+#   cookie - вся сессия (пользователь, OAuth токен) подписывается и хранится в cookie
+#   memory - сессии в памяти процесса, в cookie только короткий подписанный ID (сбрасываются при перезапуске)
+#   sqlite - сессии в SQLite (DATA_DIR, токены зашифрованы), общие для нескольких workers и переживают перезапуск
+# По умолчанию: cookie
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "cookie").lower()
+
+# Максимальное количество сессий на сервере (memory/sqlite); самые старые удаляются
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+
+
+# Загружать в кэш данные целевой страницы (права, workflows, ветки) сразу после входа через GitHub,
+# пока браузер идет по редиректу (для ссылок с owner/repo, например из badge)
+# По умолчанию: True
+PREWARM_AFTER_LOGIN = os.getenv("PREWARM_AFTER_LOGIN", "true").lower() == "true"
+
+
+def _parse_log_sampling(value: str) -> Dict[str, float]:
+    """Parse "route=rate" pairs, skipping malformed ones with a warning instead of failing at startup"""
+    rates = {}
+    for item in value.split(","):
+        route, _, rate = item.partition("=")
+        route, rate = route.strip(), rate.strip()
+        if not route and not rate:
+            continue
+        try:
+            fraction = float(rate)
+        except ValueError:
+            fraction = None
+        if not route or fraction is None or not 0 <= fraction <= 1:
+            logging.getLogger(__name__).warning(f"Ignoring invalid REQUEST_LOG_SAMPLING entry: {item.strip()!r}")
+            continue
+        rates[route] = fraction
+    return rates
+
+
+# Доля запросов, попадающих в лог, по шаблонам маршрутов: "маршрут=доля" через запятую
+# Метрики собираются по всем запросам; ошибки (5xx) и медленные запросы логируются всегда
+# Некорректные элементы (не число, доля вне 0..1) пропускаются с предупреждением в логе
+# Пример: REQUEST_LOG_SAMPLING=/health=0,/api/find-run=0.1
+# По умолчанию: /health и /metrics - 1%, /api/find-run - 10%, остальные - все
+REQUEST_LOG_SAMPLING = _parse_log_sampling(
+    os.getenv("REQUEST_LOG_SAMPLING", "/health=0.01,/api/find-run=0.1,/metrics=0.01")
+)
+
+# Запросы дольше этого времени (миллисекунды) логируются всегда
+REQUEST_LOG_SLOW_MS = int(os.getenv("REQUEST_LOG_SLOW_MS", "1000"))
+
+
+# Метрики в формате Prometheus на /metrics (запросы, вызовы GitHub, кэш, лимиты GitHub)
+# По умолчанию: True
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+
+# Заголовок Server-Timing в ответах: время на вызовы GitHub (по классам endpoint'ов),
+# кэш, разбор YAML, подпись JWT, рендеринг шаблонов
+# По умолчанию: True
+SERVER_TIMING = os.getenv("SERVER_TIMING", "true").lower() == "true"
+
+# Отладка: добавлять ту же разбивку полем "_timing" в JSON-ответы (только для отладки)
+# По умолчанию: False
+SERVER_TIMING_DEBUG = os.getenv("SERVER_TIMING_DEBUG", "false").lower() == "true"
+
+
+# Количество потоков для CPU-нагруженной работы (подпись JWT, разбор YAML, рендеринг страниц),
+# чтобы она не блокировала event loop
+# По умолчанию: 4
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", "4"))
+
+# Блокировка event loop дольше этого времени (миллисекунды) логируется и считается в метриках
+# 0 - не отслеживать
+# По умолчанию: 100
+LOOP_LAG_THRESHOLD_MS = int(os.getenv("LOOP_LAG_THRESHOLD_MS", "100"))
+
+# Как часто проверять задержку event loop (секунды)
+LOOP_MONITOR_INTERVAL = float(os.getenv("LOOP_MONITOR_INTERVAL", "0.5"))
+
+
+# Ограничение одновременных запросов к GitHub API (защита от всплесков и бана по rate limit)
+# Запросы сверх лимита ждут в очереди; если очередь заполнена или ожидание дольше OUTBOUND_MAX_WAIT,
+# клиент получает 429 (занят лимит его токена) или 503 (перегружен весь сервис) с Retry-After
+# Всего запросов к GitHub одновременно, 0 - без ограничения
+OUTBOUND_MAX_CONCURRENCY = int(os.getenv("OUTBOUND_MAX_CONCURRENCY", "50"))
+
+# Запросов одновременно с одним токеном (пользователь, GitHub App), 0 - без ограничения
+OUTBOUND_MAX_CONCURRENCY_PER_TOKEN = int(os.getenv("OUTBOUND_MAX_CONCURRENCY_PER_TOKEN", "10"))
+
+# Сколько запросов может ждать в очереди; пока очередь заполнена, новые запросы к сервису получают 503
+OUTBOUND_QUEUE_SIZE = int(os.getenv("OUTBOUND_QUEUE_SIZE", "200"))
+
+# Сколько секунд запрос может ждать в очереди
+OUTBOUND_MAX_WAIT = float(os.getenv("OUTBOUND_MAX_WAIT", "10"))
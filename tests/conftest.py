@@ -48,3 +48,34 @@ def mock_github_response():
         return response
     return _create_response
 
+
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path):
+    """Keep local SQLite databases (dispatch queue, history) in a temporary directory"""
+    from backend.services import db
+    db.close_all()
+    with patch("config.DATA_DIR", str(tmp_path)):
+        yield tmp_path
+        db.close_all()
+
+
+def _reset_services():
+    from backend.services import (
+        dispatch_pacer, github_app, github_oauth, idempotency, outbound_limits, permissions, team_rules
+    )
+    idempotency.clear()
+    dispatch_pacer.reset()
+    permissions.clear_cache()
+    team_rules.clear()
+    github_oauth.clear_identity_cache()
+    github_app.clear_jwt_cache()
+    outbound_limits.clear()
+
+
+@pytest.fixture(autouse=True)
+def reset_service_state():
+    """Every test starts without in-process state (caches, buckets, slots) left by another test"""
+    _reset_services()
+    yield
+    _reset_services()
@@ -116,3 +116,224 @@ def test_urlencode_filter():
     assert filter_func(None) == ""
     assert filter_func("") == ""
 
+
+
+def test_root_endpoint_renders_within_budget(client):
+    """Test root page doesn't wait for slow GitHub responses longer than the render budget"""
+    import asyncio
+    import time
+    from unittest.mock import patch
+    
+    async def slow_get_workflows(owner, repo):
+        await asyncio.sleep(5)
+        return [{"id": "ci.yml", "name": "CI", "path": ".github/workflows/ci.yml", "state": "active"}]
+    
+    with patch("backend.services.workflows.get_cached_workflows", return_value=None), \
+         patch("backend.services.workflows.get_workflows", side_effect=slow_get_workflows), \
+         patch("app.config.INDEX_RENDER_BUDGET_MS", 50):
+        started = time.monotonic()
+        response = client.get("/?owner=testowner&repo=testrepo")
+        elapsed = time.monotonic() - started
+    
+    assert response.status_code == 200
+    assert elapsed < 2
+
+
+def test_root_endpoint_uses_cached_workflows(client):
+    """Test root page renders cached workflows without calling GitHub"""
+    from unittest.mock import patch, AsyncMock
+    
+    cached = [{"id": "ci.yml", "name": "Cached CI", "path": ".github/workflows/ci.yml", "state": "active"}]
+    with patch("backend.services.workflows.get_cached_workflows", return_value=cached), \
+         patch("backend.services.workflows.get_workflows", new_callable=AsyncMock) as mock_get:
+        response = client.get("/?owner=testowner&repo=testrepo&workflow_id=ci.yml")
+    
+    assert response.status_code == 200
+    mock_get.assert_not_called()
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_server_side_session_keeps_only_signed_id_in_cookie(backend):
+    """Test that server-side sessions store data on the server, rotate the ID on login and are cleared on logout"""
+    from fastapi import FastAPI, Request
+    from backend.services import session_store
+    
+    store = session_store.create_store(backend, max_entries=2)
+    session_app = FastAPI()
+    session_app.add_middleware(session_store.ServerSessionMiddleware, secret_key="test", store=store)
+    
+    @session_app.get("/set")
+    async def set_value(request: Request, key: str, value: str):
+        request.session[key] = value
+        return dict(request.session)
+    
+    @session_app.get("/get")
+    async def get_value(request: Request):
+        return dict(request.session)
+    
+    @session_app.get("/logout")
+    async def logout(request: Request):
+        request.session.clear()
+        return {}
+    
+    test_client = TestClient(session_app)
+    test_client.get("/set", params={"key": "oauth_state", "value": "s" * 500})
+    state_cookie = test_client.cookies["session"]
+    assert len(state_cookie) < 100
+    assert "s" * 20 not in state_cookie
+    assert test_client.get("/get").json() == {"oauth_state": "s" * 500}
+    
+    # Login replaces the session ID
+    response = test_client.get("/set", params={"key": "access_token", "value": "token"})
+    assert test_client.cookies["session"] != state_cookie
+    assert test_client.get("/get").json() == {"oauth_state": "s" * 500, "access_token": "token"}
+    # Unchanged session is not saved again and the cookie is not reissued
+    assert "set-cookie" not in test_client.get("/get").headers
+    assert len(store) == 1
+    
+    # Tampered cookie gives an empty session
+    test_client.cookies["session"] = test_client.cookies["session"][:-2] + "xx"
+    assert test_client.get("/get").json() == {}
+    
+    test_client.cookies["session"] = response.cookies["session"]
+    test_client.get("/logout")
+    assert len(store) == 0
+    assert test_client.get("/get").json() == {}
+
+
+def test_request_logging_middleware_records_route_and_upstream_calls(caplog):
+    """Test that requests are measured by route template, GitHub calls are counted and busy routes are sampled"""
+    import logging
+    from unittest.mock import patch
+    from fastapi import FastAPI
+    from backend.services import metrics, request_context
+    
+    metrics.reset()
+    logged_app = FastAPI()
+    logged_app.add_middleware(request_context.RequestLoggingMiddleware)
+    
+    @logged_app.get("/repos/{name}")
+    async def repo(name: str):
+        request_context.record_upstream_call(0.05)
+        request_context.record_upstream_call(0.05)
+        return {"name": name}
+    
+    @logged_app.get("/quiet")
+    async def quiet():
+        return {}
+    
+    test_client = TestClient(logged_app)
+    with caplog.at_level(logging.INFO, logger="backend.services.request_context"), \
+         patch("config.REQUEST_LOG_SAMPLING", {"/quiet": 0}):
+        assert test_client.get("/repos/a").status_code == 200
+        assert test_client.get("/repos/b").status_code == 200
+        assert test_client.get("/quiet").status_code == 200
+        assert test_client.get("/nowhere").status_code == 404
+    
+    records = [r for r in caplog.records if r.name == "backend.services.request_context"]
+    assert [r.http_route for r in records] == ["/repos/{name}", "/repos/{name}", "unmatched"]
+    assert records[0].upstream_calls == 2
+    assert records[0].http_path == "/repos/a"
+    
+    assert metrics.get("http_requests_total", method="GET", route="/repos/{name}", status=200) == 2
+    assert metrics.get("http_request_duration_seconds", method="GET", route="/quiet") == 1
+    assert metrics.get("http_request_upstream_calls_total", route="/repos/{name}") == 4
+    # Calls outside of requests are not attributed to any request
+    request_context.record_upstream_call(0.05)
+    assert request_context.current() is None
+
+
+def test_request_log_sampling_skips_invalid_entries(caplog):
+    """Test that a typo in REQUEST_LOG_SAMPLING is logged and skipped instead of failing at startup"""
+    import logging
+    import config
+    
+    with caplog.at_level(logging.WARNING, logger="config"):
+        rates = config._parse_log_sampling("/health=0, /api/find-run=1o%,=0.5,/metrics=2,/api/x=0.25,")
+    
+    assert rates == {"/health": 0.0, "/api/x": 0.25}
+    assert len([r for r in caplog.records if "REQUEST_LOG_SAMPLING" in r.getMessage()]) == 3
+
+
+def test_metrics_endpoint(client):
+    """Test that /metrics exposes request metrics in Prometheus text format"""
+    from unittest.mock import patch
+    from backend.services import cache
+    
+    cache.set("workflows:o:r", [], ttl=60)
+    client.get("/health")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'http_requests_total{method="GET",route="/health",status="200"}' in response.text
+    assert 'cache_entries{namespace="workflows"}' in response.text
+    cache.clear("workflows:o:r")
+    
+    with patch("config.METRICS_ENABLED", False):
+        assert client.get("/metrics").status_code == 404
+
+
+def test_server_timing_header_breaks_down_request_time(client):
+    """Test that responses carry Server-Timing with GitHub calls and local work, and the debug JSON field behind a flag"""
+    from unittest.mock import patch
+    from fastapi import FastAPI
+    from fastapi.responses import PlainTextResponse
+    from backend.services import request_context
+    
+    timed_app = FastAPI()
+    timed_app.add_middleware(request_context.RequestLoggingMiddleware)
+    
+    @timed_app.get("/work")
+    async def work():
+        request_context.record_upstream_call(0.02, "branches")
+        request_context.record_upstream_call(0.03, "branches")
+        with request_context.timed("yaml"):
+            pass
+        return {"ok": True}
+    
+    @timed_app.get("/text")
+    async def text():
+        return PlainTextResponse("plain")
+    
+    test_client = TestClient(timed_app)
+    response = test_client.get("/work")
+    header = response.headers["server-timing"]
+    assert 'gh_branches;dur=50.0;desc="2x"' in header
+    assert "yaml;dur=" in header
+    assert "total;dur=" in header
+    assert "_timing" not in response.json()
+    
+    with patch("config.SERVER_TIMING_DEBUG", True):
+        data = test_client.get("/work").json()
+        assert data["ok"] is True
+        assert data["_timing"]["github_calls"] == 2
+        assert data["_timing"]["timings"]["gh_branches"]["count"] == 2
+        assert test_client.get("/text").text == "plain"
+    
+    with patch("config.SERVER_TIMING", False):
+        assert "server-timing" not in test_client.get("/work").headers
+    
+    # Template rendering of the main page is reported
+    assert "template;dur=" in client.get("/").headers["server-timing"]
+
+
+def test_requests_are_shed_while_github_call_queue_is_full(client):
+    """Test that requests get 503 with Retry-After while the GitHub call queue is full, and saturated calls map to 429/503"""
+    from unittest.mock import Mock, patch, AsyncMock
+    from backend.services import outbound_limits
+    from backend.services.outbound_limits import OutboundSaturatedError
+    
+    with patch("config.OUTBOUND_QUEUE_SIZE", 1), patch("config.OUTBOUND_MAX_WAIT", 7):
+        outbound_limits._waiters.append(("a", Mock()))
+        response = client.get("/api/branches?owner=o&repo=r")
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "7"
+        # Проверки состояния и метрики не отбрасываются
+        assert client.get("/health").status_code == 200
+        outbound_limits.clear()
+    
+    with patch("backend.routes.api.get_branches", new_callable=AsyncMock) as mock_branches:
+        mock_branches.side_effect = OutboundSaturatedError("token", 3)
+        response = client.get("/api/branches?owner=o&repo=r")
+        assert response.status_code == 429
+        assert response.headers["retry-after"] == "3"
@@ -2,6 +2,7 @@
 Tests for service modules
 """
 import pytest
+import httpx
 from unittest.mock import Mock, patch, AsyncMock
 import jwt
 import time
@@ -108,3 +109,1001 @@ def test_config_values_are_valid():
             if pattern == "^main$":
                 assert compiled.match("main"), f"Pattern {pattern} should match 'main'"
 
+
+
+@pytest.mark.asyncio
+async def test_installation_token_shared_between_concurrent_callers():
+    """Test concurrent callers share one installation token request and the result is cached"""
+    import asyncio
+    from backend.services import github_app
+    from backend.services.cache import clear
+    
+    clear("installation_token:1:2")
+    mock_response = Mock()
+    mock_response.status_code = 201
+    mock_response.json.return_value = {"token": "ghs_test", "expires_at": "2099-01-01T00:00:00Z"}
+    
+    with patch("backend.services.github_app.generate_jwt", return_value="jwt"):
+        with patch("httpx.AsyncClient.post", new_callable=AsyncMock) as mock_post:
+            mock_post.return_value = mock_response
+            
+            tokens = await asyncio.gather(*[
+                github_app.get_installation_token("1", "2", "key") for _ in range(5)
+            ])
+            assert tokens == ["ghs_test"] * 5
+            assert mock_post.call_count == 1
+            
+            # Subsequent calls are served from cache
+            assert await github_app.get_installation_token("1", "2", "key") == "ghs_test"
+            assert mock_post.call_count == 1
+    
+    clear("installation_token:1:2")
+
+
+@pytest.mark.asyncio
+async def test_run_tracker_resolves_waiting_triggers_with_one_poll():
+    """Test that all pending triggers of a workflow are resolved from a single run listing"""
+    import asyncio
+    from datetime import datetime, timezone
+    from backend.services import run_tracker
+    
+    trigger_time = datetime.now(timezone.utc)
+    created_at = trigger_time.strftime("%Y-%m-%dT%H:%M:%SZ")
+    runs = [
+        {"id": 2, "html_url": "https://github.com/o/r/actions/runs/2", "status": "queued",
+         "created_at": created_at, "head_branch": "stable-1", "actor": {"login": "bob", "type": "User"}},
+        {"id": 1, "html_url": "https://github.com/o/r/actions/runs/1", "status": "queued",
+         "created_at": created_at, "head_branch": "main", "actor": {"login": "alice", "type": "User"}},
+    ]
+    
+    with patch.object(run_tracker, "MIN_POLL_INTERVAL", 0.01), \
+         patch("backend.services.run_tracker.get_auth_token", new_callable=AsyncMock) as mock_token, \
+         patch("backend.services.run_tracker.list_workflow_runs", new_callable=AsyncMock) as mock_list:
+        mock_token.return_value = "token"
+        mock_list.return_value = runs
+        
+        alice = run_tracker.register_trigger("o", "r", "ci.yml", "main", trigger_time, username="alice", user_token="t1")
+        bob = run_tracker.register_trigger("o", "r", "ci.yml", "stable-1", trigger_time.isoformat(), username="bob", user_token="t2")
+        # Trigger resolved long ago is forgotten by the watcher, not only on the next register
+        stale = run_tracker.PendingTrigger("o", "r", "ci.yml", "main", trigger_time)
+        stale.state = "timeout"
+        stale.resolved_at = time.monotonic() - run_tracker.RESOLVED_RETENTION - 1
+        run_tracker._triggers[stale.trigger_id] = stale
+        
+        await asyncio.wait_for(asyncio.gather(
+            run_tracker.wait_for_run(alice, 1),
+            run_tracker.wait_for_run(bob, 1)
+        ), timeout=2)
+        
+        assert alice.to_dict()["run_id"] == 1
+        assert bob.to_dict()["run_id"] == 2
+        assert mock_list.call_count == 1
+        # Triggers on different refs - runs are listed without branch filter
+        assert mock_list.call_args.kwargs["ref"] is None
+        assert stale.trigger_id not in run_tracker._triggers
+
+
+@pytest.mark.asyncio
+async def test_run_tracker_publishes_to_subscribers():
+    """Test that subscribers receive the run event"""
+    import asyncio
+    from datetime import datetime, timezone
+    from backend.services import run_tracker
+    
+    trigger_time = datetime.now(timezone.utc)
+    run = {"id": 7, "html_url": "https://github.com/o/r/actions/runs/7", "status": "queued",
+           "created_at": trigger_time.strftime("%Y-%m-%dT%H:%M:%SZ"), "head_branch": "main",
+           "actor": {"login": "app[bot]", "type": "Bot"}}
+    
+    with patch.object(run_tracker, "MIN_POLL_INTERVAL", 0.01), \
+         patch("backend.services.run_tracker.get_auth_token", new_callable=AsyncMock) as mock_token, \
+         patch("backend.services.run_tracker.get_app_slug", new_callable=AsyncMock) as mock_slug, \
+         patch("backend.services.run_tracker.list_workflow_runs", new_callable=AsyncMock) as mock_list:
+        mock_token.return_value = "token"
+        mock_slug.return_value = "app"
+        mock_list.return_value = [run]
+        
+        trigger = run_tracker.register_trigger("o", "r", "app.yml", "main", trigger_time, username="carol")
+        queue = run_tracker.subscribe(trigger)
+        message = await asyncio.wait_for(queue.get(), timeout=2)
+        
+        assert message["event"] == "run"
+        assert message["data"]["run_url"] == "https://github.com/o/r/actions/runs/7"
+        assert trigger.state == "found"
+
+
+@pytest.mark.asyncio
+async def test_trigger_workflow_injects_correlation_id():
+    """Test that the correlation ID is injected only into workflows declaring the input"""
+    from backend.services import workflow
+    
+    workflow_info = {
+        "found": True,
+        "inputs": {"executor_run_id": {"type": "string"}},
+        "run_name": "CI [${{ inputs.executor_run_id }}]"
+    }
+    
+    mock_response = Mock()
+    mock_response.status_code = 204
+    mock_response.raise_for_status = Mock()
+    
+    with patch("backend.services.workflow_info.get_workflow_info", new_callable=AsyncMock) as mock_info, \
+         patch("httpx.AsyncClient.post", new_callable=AsyncMock) as mock_post:
+        mock_info.return_value = workflow_info
+        mock_post.return_value = mock_response
+        
+        result = await workflow.trigger_workflow(
+            "o", "r", "ci.yml", inputs={"tests": "all"}, ref="main",
+            user_token="token", correlation_input="executor_run_id"
+        )
+        
+        sent_inputs = mock_post.call_args.kwargs["json"]["inputs"]
+        assert result["correlation_id"] == sent_inputs["executor_run_id"]
+        assert sent_inputs["tests"] == "all"
+        
+        # Input declared but not shown in run-name - injected, but runs can't be matched by it
+        mock_info.return_value = {**workflow_info, "run_name": None}
+        result = await workflow.trigger_workflow(
+            "o", "r", "ci.yml", ref="main", user_token="token", correlation_input="executor_run_id"
+        )
+        assert "correlation_id" not in result
+        assert "executor_run_id" in mock_post.call_args.kwargs["json"]["inputs"]
+        
+        # Input not declared - inputs are sent as is
+        mock_info.return_value = {"found": True, "inputs": {}, "run_name": None}
+        await workflow.trigger_workflow(
+            "o", "r", "ci.yml", ref="main", user_token="token", correlation_input="executor_run_id"
+        )
+        assert mock_post.call_args.kwargs["json"]["inputs"] == {}
+
+
+def test_select_candidate_runs_by_correlation_id():
+    """Test that runs are matched by correlation ID exactly, ignoring time and actor heuristics"""
+    from datetime import datetime, timezone
+    from backend.services.workflow import select_candidate_runs
+    
+    trigger_time = datetime.now(timezone.utc)
+    created_at = trigger_time.strftime("%Y-%m-%dT%H:%M:%SZ")
+    runs = [
+        {"id": 2, "display_title": "CI [bbb]", "created_at": created_at, "head_branch": "main",
+         "actor": {"login": "alice", "type": "User"}},
+        {"id": 1, "display_title": "CI [aaa]", "created_at": created_at, "head_branch": "main",
+         "actor": {"login": "alice", "type": "User"}},
+    ]
+    
+    candidates = select_candidate_runs(runs, trigger_time, ref="main", expected_actor_login="alice", correlation_id="aaa")
+    assert [run["id"] for _, run in candidates] == [1]
+    
+    # Without correlation ID both runs look the same
+    candidates = select_candidate_runs(runs, trigger_time, ref="main", expected_actor_login="alice")
+    assert len(candidates) == 2
+
+
+@pytest.mark.asyncio
+async def test_list_workflow_runs_filters_and_revalidates():
+    """Test that runs are filtered on GitHub's side and re-polls are revalidated with ETag"""
+    from datetime import datetime, timezone
+    from backend.services import cache
+    from backend.services.workflow import list_workflow_runs
+    
+    cache.clear()
+    runs = [{"id": 1, "created_at": "2024-01-01T10:00:05Z"}]
+    
+    first = Mock()
+    first.status_code = 200
+    first.headers = {"ETag": 'W/"abc"'}
+    first.json.return_value = {"workflow_runs": runs}
+    first.raise_for_status = Mock()
+    
+    not_modified = Mock()
+    not_modified.status_code = 304
+    not_modified.headers = {}
+    
+    trigger_time = datetime(2024, 1, 1, 10, 0, 0, tzinfo=timezone.utc)
+    with patch("httpx.AsyncClient.get", new_callable=AsyncMock) as mock_get:
+        mock_get.side_effect = [first, not_modified]
+        
+        assert await list_workflow_runs("o", "r", "ci.yml", "token", ref="main", actor="alice", created_after=trigger_time) == runs
+        params = mock_get.call_args.kwargs["params"]
+        assert params["event"] == "workflow_dispatch"
+        assert params["actor"] == "alice"
+        assert params["branch"] == "main"
+        assert params["created"] == ">=2024-01-01T09:59:00Z"
+        assert "If-None-Match" not in mock_get.call_args.kwargs["headers"]
+        
+        assert await list_workflow_runs("o", "r", "ci.yml", "token", ref="main", actor="alice", created_after=trigger_time) == runs
+        assert mock_get.call_args.kwargs["headers"]["If-None-Match"] == 'W/"abc"'
+    
+    cache.clear()
+
+
+@pytest.mark.asyncio
+async def test_run_progress_is_revalidated_with_etags():
+    """Test that re-polling run progress sends If-None-Match for the run and its jobs and reuses 304 answers"""
+    from backend.services import cache
+    from backend.services.workflow import get_run_progress
+    
+    cache.clear()
+    
+    def response(url, headers, params=None):
+        mock = Mock()
+        mock.raise_for_status = Mock()
+        if "If-None-Match" in headers:
+            mock.status_code = 304
+            mock.headers = {}
+            return mock
+        mock.status_code = 200
+        if url.endswith("/jobs"):
+            mock.headers = {"ETag": '"jobs"'}
+            mock.json.return_value = {"jobs": [{"id": 1, "name": "test", "status": "in_progress",
+                                                "steps": [{"status": "completed"}, {"status": "queued"}]}]}
+        else:
+            mock.headers = {"ETag": '"run"'}
+            mock.json.return_value = {"id": 7, "status": "in_progress", "conclusion": None}
+        return mock
+    
+    with patch("httpx.AsyncClient.get", new_callable=AsyncMock) as mock_get:
+        mock_get.side_effect = response
+        first = await get_run_progress("o", "r", 7, "token")
+        second = await get_run_progress("o", "r", 7, "token")
+    
+    assert first == second
+    assert first["jobs"][0]["steps_completed"] == 1
+    etags = sorted(call.kwargs["headers"].get("If-None-Match") for call in mock_get.call_args_list[2:])
+    assert etags == ['"jobs"', '"run"']
+    
+    cache.clear()
+
+
+@pytest.mark.asyncio
+async def test_run_tracker_assigns_runs_one_to_one():
+    """Test that concurrent dispatches by the same user on the same ref get different runs"""
+    import asyncio
+    from datetime import datetime, timezone, timedelta
+    from backend.services import run_tracker
+    
+    first_time = datetime.now(timezone.utc).replace(microsecond=0)
+    second_time = first_time + timedelta(seconds=2)
+    runs = [
+        {"id": 11, "status": "queued", "created_at": (second_time + timedelta(seconds=1)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+         "head_branch": "main", "actor": {"login": "alice", "type": "User"}},
+        {"id": 10, "status": "queued", "created_at": (first_time + timedelta(seconds=1)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+         "head_branch": "main", "actor": {"login": "alice", "type": "User"}},
+    ]
+    
+    with patch.object(run_tracker, "MIN_POLL_INTERVAL", 0.01), \
+         patch("backend.services.run_tracker.get_auth_token", new_callable=AsyncMock) as mock_token, \
+         patch("backend.services.run_tracker.list_workflow_runs", new_callable=AsyncMock) as mock_list:
+        mock_token.return_value = "token"
+        mock_list.return_value = runs
+        
+        second = run_tracker.register_trigger("o", "r", "one-to-one.yml", "main", second_time, username="alice", user_token="t")
+        first = run_tracker.register_trigger("o", "r", "one-to-one.yml", "main", first_time, username="alice", user_token="t")
+        
+        await asyncio.wait_for(asyncio.gather(
+            run_tracker.wait_for_run(first, 1),
+            run_tracker.wait_for_run(second, 1)
+        ), timeout=2)
+        
+        assert first.to_dict()["run_id"] == 10
+        assert second.to_dict()["run_id"] == 11
+        assert mock_list.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_run_follower_shares_one_poller_between_viewers():
+    """Test that all viewers of a run get its progress from a single poller"""
+    import asyncio
+    from backend.services import run_follower
+    
+    in_progress = {"run_id": 7, "status": "in_progress", "conclusion": None, "created_at": None, "jobs": []}
+    completed = {**in_progress, "status": "completed", "conclusion": "success"}
+    
+    with patch.object(run_follower, "MIN_POLL_INTERVAL", 0.01), \
+         patch("backend.services.run_follower.get_auth_token", new_callable=AsyncMock) as mock_token, \
+         patch("backend.services.run_follower.get_run_progress", new_callable=AsyncMock) as mock_progress:
+        mock_token.return_value = "token"
+        mock_progress.side_effect = [in_progress, completed]
+        
+        first, first_queue = run_follower.follow("o", "r", 7)
+        second, second_queue = run_follower.follow("o", "r", 7)
+        assert first is second
+        
+        for queue in (first_queue, second_queue):
+            events = [await asyncio.wait_for(queue.get(), timeout=1) for _ in range(2)]
+            assert [event["event"] for event in events] == ["progress", "completed"]
+            assert events[1]["data"]["conclusion"] == "success"
+        
+        assert mock_progress.call_count == 2
+        await asyncio.sleep(0)
+        assert ("o", "r", 7) not in run_follower._followers
+
+
+@pytest.mark.asyncio
+async def test_log_tail_shares_one_reader_between_viewers(tmp_path):
+    """Test that job log is read once in chunks and every viewer gets only new output"""
+    import asyncio
+    from backend.services import log_tail
+    
+    # A source without fetch() can't be created
+    with pytest.raises(TypeError):
+        type("IncompleteSource", (log_tail.LogSource,), {})()
+    
+    log_file = tmp_path / "job.log"
+    log_file.write_text("step 1 ✓\nstep 2 ✓\n", encoding="utf-8")
+    source = log_tail.ReplayLogSource(str(log_file), chunk_size=5)
+    fetch = AsyncMock(side_effect=source.fetch)
+    source.fetch = fetch
+    
+    with patch.object(log_tail, "MIN_POLL_INTERVAL", 0.001), \
+         patch("backend.services.log_tail.create_source", return_value=source):
+        first, first_queue = log_tail.follow("o", "r", 5)
+        second, second_queue = log_tail.follow("o", "r", 5)
+        assert first is second
+        
+        for queue in (first_queue, second_queue):
+            text = ""
+            while True:
+                message = await asyncio.wait_for(queue.get(), timeout=1)
+                if message["event"] == "end":
+                    break
+                text += message["data"]["text"]
+            # Multi-byte characters split between chunks are decoded correctly
+            assert text == "step 1 ✓\nstep 2 ✓\n"
+    
+    offsets = [call.args[0] for call in fetch.call_args_list]
+    assert offsets == sorted(offsets)
+    assert len(offsets) == len(set(offsets))
+
+
+@pytest.mark.asyncio
+async def test_github_log_source_reads_log_once_job_is_completed():
+    """Test that the logs endpoint is not polled while the job runs and the log is downloaded once"""
+    from backend.services import log_tail
+    
+    def response(status_code, data=None, headers=None, content=b""):
+        mock = Mock()
+        mock.status_code = status_code
+        mock.json.return_value = data or {}
+        mock.headers = headers or {}
+        mock.content = content
+        return mock
+    
+    source = log_tail.GitHubLogSource("o", "r", 5)
+    with patch("backend.services.log_tail.get_auth_token", new_callable=AsyncMock, return_value="token"), \
+         patch("httpx.AsyncClient.get", new_callable=AsyncMock) as mock_get:
+        mock_get.side_effect = [
+            response(200, {"status": "in_progress"}),
+            response(200, {"status": "completed"}),
+            response(302, headers={"Location": "https://logs.example/5"}),
+            response(206, headers={"Content-Range": "bytes 0-9/10"}, content=b"all passed"),
+        ]
+        
+        # Running job - only its status is checked
+        assert await source.fetch(0) == (b"", False)
+        assert mock_get.call_count == 1
+        
+        assert await source.fetch(0) == (b"all passed", True)
+        assert mock_get.call_args.kwargs["headers"] == {"Range": "bytes=0-"}
+        
+        # The whole log is read - no more calls
+        assert await source.fetch(10) == (b"", True)
+        assert mock_get.call_count == 4
+
+
+@pytest.mark.asyncio
+async def test_dispatch_queue_retries_and_survives_restart(data_dir):
+    """Test queued dispatch is retried on transient errors, recovered after restart and its token wiped"""
+    from backend.services import dispatch_queue
+    
+    results = [
+        {"success": False, "status_code": 502, "message": "Bad Gateway"},
+        {"success": True, "status_code": 204, "message": "Workflow triggered successfully",
+         "trigger_time": "2024-01-01T10:00:00+00:00"},
+    ]
+    
+    with patch("config.CHECK_PERMISSIONS", True), \
+         patch.object(dispatch_queue, "RETRY_BASE_DELAY", 0), \
+         patch("backend.services.dispatcher.check_repository_access", new_callable=AsyncMock) as mock_access, \
+         patch("backend.services.dispatcher.prefetch_auth_token", new_callable=AsyncMock), \
+         patch("backend.services.dispatcher.trigger_workflow", new_callable=AsyncMock) as mock_trigger, \
+         patch("backend.services.dispatcher.run_tracker.register_trigger") as mock_register:
+        mock_access.return_value = True
+        mock_trigger.side_effect = results
+        mock_register.return_value.trigger_id = "trigger-1"
+        
+        job_id = await dispatch_queue.enqueue("o", "r", "ci.yml", "main", {"tests": "all"}, "alice", "secret-token", 7)
+        row = dispatch_queue._db().execute("SELECT token, user_id FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        assert "secret-token" not in row["token"]
+        assert row["user_id"] == 7
+        
+        # Transient error - job goes back to the queue
+        assert await dispatch_queue.process_next() is True
+        job = await dispatch_queue.get_job(job_id)
+        assert job["status"] == "queued"
+        assert job["attempts"] == 1
+        assert job["error"] == "Bad Gateway"
+        # Permissions are checked as the user who queued the dispatch
+        assert mock_access.call_args.args == ("o", "r", "secret-token", 7)
+        
+        # Process crashes while the job is running
+        dispatch_queue._claim_next()
+        assert (await dispatch_queue.get_job(job_id))["status"] == "running"
+        with patch("backend.services.dispatch_queue._worker", new_callable=AsyncMock):
+            await dispatch_queue.start_workers(1)
+            await dispatch_queue.stop_workers()
+        assert (await dispatch_queue.get_job(job_id))["status"] == "queued"
+        
+        assert await dispatch_queue.process_next() is True
+        job = await dispatch_queue.get_job(job_id)
+        assert job["status"] == "succeeded"
+        assert job["result"]["trigger_id"] == "trigger-1"
+        assert mock_trigger.call_args.kwargs["inputs"] == {"tests": "all"}
+        row = dispatch_queue._db().execute("SELECT token FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        assert row["token"] is None
+        
+        assert await dispatch_queue.process_next() is False
+
+
+@pytest.mark.asyncio
+async def test_idempotency_concurrent_duplicates_wait_for_first_dispatch():
+    """Test that concurrent identical dispatches result in one dispatch, and failed ones are not remembered"""
+    import asyncio
+    from backend.services import idempotency
+    
+    calls = 0
+    
+    async def dispatch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"success": True, "trigger_id": f"t{calls}"}
+    
+    with patch("config.DUPLICATE_DISPATCH_WINDOW", 10):
+        results = await asyncio.gather(*[
+            idempotency.run_once("alice", "o", "r", "ci.yml", "main", {"a": "1"}, dispatch) for _ in range(3)
+        ])
+        assert calls == 1
+        assert [replayed for _, replayed in results] == [False, True, True]
+        assert {result["trigger_id"] for result, _ in results} == {"t1"}
+        
+        async def failing_dispatch():
+            nonlocal calls
+            calls += 1
+            return {"success": False, "status_code": 502, "message": "Bad Gateway"}
+        
+        await idempotency.run_once("alice", "o", "r", "ci.yml", "stable-1", {}, failing_dispatch)
+        await idempotency.run_once("alice", "o", "r", "ci.yml", "stable-1", {}, failing_dispatch)
+        assert calls == 3
+
+
+@pytest.mark.asyncio
+async def test_idempotency_duplicate_takes_over_when_first_dispatch_is_cancelled():
+    """Test that duplicates waiting for a cancelled dispatch run it themselves instead of failing"""
+    import asyncio
+    from backend.services import idempotency
+    
+    started = asyncio.Event()
+    calls = 0
+    
+    async def hanging_dispatch():
+        started.set()
+        await asyncio.sleep(10)
+    
+    async def dispatch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"success": True, "trigger_id": f"t{calls}"}
+    
+    with patch("config.DUPLICATE_DISPATCH_WINDOW", 10):
+        first = asyncio.create_task(
+            idempotency.run_once("alice", "o", "r", "ci.yml", "main", {}, hanging_dispatch)
+        )
+        await started.wait()
+        duplicates = [
+            asyncio.create_task(idempotency.run_once("alice", "o", "r", "ci.yml", "main", {}, dispatch))
+            for _ in range(2)
+        ]
+        await asyncio.sleep(0)
+        
+        # The client of the first request disconnects
+        first.cancel()
+        results = await asyncio.gather(*duplicates)
+        
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        # One duplicate took over, the other waited for it
+        assert calls == 1
+        assert [replayed for _, replayed in results] == [False, True]
+        assert {result["trigger_id"] for result, _ in results} == {"t1"}
+
+
+@pytest.mark.asyncio
+async def test_dispatch_pacer_prioritizes_interactive_and_reports_position():
+    """Test that interactive dispatches go before bulk ones and throttled callers get position and ETA"""
+    import asyncio
+    from backend.services import dispatch_pacer
+    
+    # 20 dispatches per second, no burst
+    with patch("config.DISPATCH_RATE_PER_TOKEN", 1200), \
+         patch("config.DISPATCH_RATE_PER_REPO", 1200), \
+         patch("config.DISPATCH_BURST", 1):
+        await dispatch_pacer.acquire("token", "o", "r")
+        
+        order = []
+        
+        async def dispatch(name, priority):
+            await dispatch_pacer.acquire("token", "o", "r", priority=priority)
+            order.append(name)
+        
+        bulk = asyncio.create_task(dispatch("bulk", dispatch_pacer.BULK))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(dispatch("interactive", dispatch_pacer.INTERACTIVE))
+        await asyncio.sleep(0)
+        
+        # Third in line: behind the interactive and the bulk dispatch
+        with pytest.raises(dispatch_pacer.DispatchThrottledError) as exc_info:
+            await dispatch_pacer.acquire("token", "o", "r", priority=dispatch_pacer.BULK, max_wait=0)
+        assert exc_info.value.queue_position == 3
+        assert exc_info.value.retry_after > 0
+        
+        await asyncio.gather(bulk, interactive)
+        assert order == ["interactive", "bulk"]
+        
+        # GitHub rate limit blocks the repository for every token
+        await asyncio.sleep(0.1)
+        dispatch_pacer.defer("token", "o", "r", 30)
+        with pytest.raises(dispatch_pacer.DispatchThrottledError) as exc_info:
+            await dispatch_pacer.acquire("other-token", "o", "r", max_wait=1)
+        assert exc_info.value.retry_after > 25
+        assert await dispatch_pacer.acquire("other-token", "o", "other-repo", max_wait=1) < 0.1
+
+
+@pytest.mark.asyncio
+async def test_trigger_workflow_returns_retry_after_on_secondary_rate_limit():
+    """Test that GitHub secondary rate limits pause dispatches instead of failing them with 403"""
+    import httpx
+    from backend.services import workflow
+    
+    limited = Mock()
+    limited.status_code = 403
+    limited.headers = httpx.Headers({"retry-after": "30"})
+    limited.json.return_value = {"message": "You have exceeded a secondary rate limit"}
+    error = httpx.HTTPStatusError("Forbidden", request=Mock(), response=limited)
+    
+    limited_response = Mock()
+    limited_response.raise_for_status = Mock(side_effect=error)
+    
+    with patch("backend.services.workflow.get_auth_token", new_callable=AsyncMock) as mock_auth, \
+         patch("httpx.AsyncClient.post", new_callable=AsyncMock) as mock_post:
+        mock_auth.return_value = "token"
+        mock_post.return_value = limited_response
+        
+        result = await workflow.trigger_workflow("o", "r", "ci.yml", ref="main", user_token="token", max_wait=5)
+    
+    # The pause is longer than the caller is ready to wait - no second request
+    assert mock_post.call_count == 1
+    assert result["success"] is False
+    assert result["status_code"] == 429
+    assert result["retry_after"] >= 29
+    assert result["queue_position"] == 1
+    
+    # A dispatch rejected before reaching GitHub gives its pacing slot back
+    from backend.services import dispatch_pacer
+    from backend.services.outbound_limits import OutboundSaturatedError
+    with patch("config.DISPATCH_BURST", 1), \
+         patch("backend.services.workflow.get_auth_token", new_callable=AsyncMock) as mock_auth, \
+         patch("httpx.AsyncClient.post", new_callable=AsyncMock) as mock_post:
+        mock_auth.return_value = "token"
+        mock_post.side_effect = OutboundSaturatedError("global", 10)
+        
+        result = await workflow.trigger_workflow("o", "saturated", "ci.yml", ref="main", user_token="fresh-token", max_wait=0)
+        assert result["status_code"] == 503
+        assert dispatch_pacer.estimate_wait("o", "saturated") == 0
+
+
+@pytest.mark.asyncio
+@patch("config.HISTORY_ENABLED", True)
+async def test_history_records_triggers_and_pages_by_cursor():
+    """Test that triggers are stored with their run and outcome and paged newest first"""
+    from datetime import datetime, timedelta, timezone
+    from backend.services import history, run_tracker
+    
+    start = datetime(2024, 1, 1, 10, 0, tzinfo=timezone.utc)
+    with patch("backend.services.run_tracker._ensure_watcher"):
+        triggers = [
+            run_tracker.register_trigger(
+                "o", "r", "ci.yml", "main", start + timedelta(minutes=i),
+                username="alice", inputs={"tests": str(i)}
+            )
+            for i in range(5)
+        ]
+        run_tracker.register_trigger("o", "r", "ci.yml", "main", start, username="bob")
+    
+    run_tracker._resolve(triggers[4], {"id": 42, "html_url": "https://github.com/o/r/actions/runs/42", "status": "queued"})
+    history.record_run_status("o", "r", 42, "completed", "success")
+    
+    items, cursor = history.query("alice", limit=2)
+    assert [item["inputs"]["tests"] for item in items] == ["4", "3"]
+    assert items[0]["run_id"] == 42
+    assert items[0]["conclusion"] == "success"
+    assert items[1]["run_id"] is None
+    
+    seen = [item["trigger_id"] for item in items]
+    while cursor:
+        items, cursor = history.query("alice", limit=2, cursor=cursor)
+        seen += [item["trigger_id"] for item in items]
+    assert seen == [trigger.trigger_id for trigger in reversed(triggers)]
+    
+    assert history.query("alice", repo="other")[0] == []
+    with pytest.raises(history.InvalidCursorError):
+        history.query("alice", cursor="not-a-cursor")
+    
+    # Unfinished runs are fetched by ID, however many newer runs the workflow has
+    history.record_run_status("o", "r", 42, "in_progress", None)
+    with patch("backend.services.history.get_auth_token", new_callable=AsyncMock), \
+         patch("backend.services.history.get_workflow_run", new_callable=AsyncMock) as mock_run:
+        mock_run.return_value = {"id": 42, "status": "completed", "conclusion": "failure"}
+        with patch.object(history, "SYNC_WINDOW", 10 ** 10):
+            assert await history.sync_unfinished() == 1
+        mock_run.assert_called_once()
+        assert mock_run.call_args[0][:3] == ("o", "r", 42)
+    assert history.query("alice", limit=1)[0][0]["conclusion"] == "failure"
+
+
+@pytest.mark.asyncio
+async def test_validate_dispatch_against_cached_schema_and_branches():
+    """Test that dispatches are checked and coerced locally using cached workflow info and branches"""
+    from backend.services import dispatch_validation
+    from backend.services.cache import set as cache_set
+    
+    cache_set("workflow_info:o:validated:ci.yml", {
+        "found": True,
+        "has_workflow_dispatch": True,
+        "inputs": {
+            "debug": {"type": "boolean", "required": False, "default": False},
+            "suite": {"type": "choice", "required": True, "default": None, "options": ["unit", "e2e"]},
+            "retries": {"type": "number", "required": False, "default": None},
+            "label": {"type": "string", "required": False, "default": None}
+        }
+    }, 60)
+    cache_set("branches:o:validated", ["main", "stable-1"], 60)
+    
+    with patch("httpx.AsyncClient.get", new_callable=AsyncMock) as mock_get:
+        inputs = await dispatch_validation.validate_dispatch(
+            "o", "validated", "ci.yml", "stable-1", {"debug": "Yes", "suite": "e2e", "retries": " 3 ", "label": 7}
+        )
+        assert inputs == {"debug": "true", "suite": "e2e", "retries": "3", "label": "7"}
+        mock_get.assert_not_called()
+    
+    with pytest.raises(dispatch_validation.DispatchValidationError) as exc_info:
+        await dispatch_validation.validate_dispatch(
+            "o", "validated", "ci.yml", "main", {"debug": "maybe", "retries": "many", "extra": "1"}
+        )
+    assert exc_info.value.errors == [
+        "input 'debug' must be a boolean, got 'maybe'",
+        "input 'retries' must be a number, got 'many'",
+        "unexpected input 'extra'",
+        "missing required input 'suite'"
+    ]
+    
+    # Ref missing from the cached branch list is checked once and remembered
+    missing = Mock()
+    missing.status_code = 422
+    with patch("backend.services.branches._get_app_headers", new_callable=AsyncMock) as mock_headers, \
+         patch("httpx.AsyncClient.get", new_callable=AsyncMock) as mock_get:
+        mock_headers.return_value = {}
+        mock_get.return_value = missing
+        for _ in range(2):
+            with pytest.raises(dispatch_validation.DispatchValidationError) as exc_info:
+                await dispatch_validation.validate_dispatch("o", "validated", "ci.yml", "no-such-branch", {"suite": "unit"})
+            assert exc_info.value.errors == ["ref 'no-such-branch' not found in o/validated"]
+        assert mock_get.call_count == 1
+    
+    # The correlation input is filled in by trigger_workflow after validation
+    cache_set("workflow_info:o:validated:correlated.yml", {
+        "found": True,
+        "has_workflow_dispatch": True,
+        "inputs": {"run_id_tag": {"type": "string", "required": True, "default": None}}
+    }, 60)
+    with patch("config.RUN_CORRELATION_INPUT", "run_id_tag"):
+        assert await dispatch_validation.validate_dispatch("o", "validated", "correlated.yml", "main", {}) == {}
+        inputs = await dispatch_validation.validate_dispatch(
+            "o", "validated", "correlated.yml", "main", {"run_id_tag": "abc"}
+        )
+        assert inputs == {"run_id_tag": "abc"}
+
+
+@pytest.mark.asyncio
+async def test_permission_levels_are_cached_per_user_and_repo():
+    """Test that permission levels are resolved, cached (also lack of access) and dropped on webhook events"""
+    from backend.services import permissions
+    
+    def response(status_code, data=None):
+        mock = Mock()
+        mock.status_code = status_code
+        mock.json.return_value = data or {}
+        return mock
+    
+    with patch("httpx.AsyncClient.get", new_callable=AsyncMock) as mock_get:
+        mock_get.side_effect = [
+            response(200, {"permissions": {"admin": False, "maintain": False, "push": False, "triage": True, "pull": True}}),
+            response(404),
+            response(200, {"permissions": {"push": True, "pull": True}}),
+        ]
+        
+        # Triage is not enough to trigger workflows
+        assert await permissions.get_permission_level("o", "r", "token", user_id=1) == "triage"
+        assert await permissions.check_repository_access("o", "r", "token", user_id=1) is False
+        assert await permissions.has_read_access("o", "r", "token", user_id=1) is True
+        assert await permissions.has_read_access("o", "private", "token", user_id=1) is False
+        assert await permissions.check_repository_access("o", "private", "token", user_id=1) is False
+        assert await permissions.check_repository_access("o", "private", "token", user_id=1) is False
+        assert mock_get.call_count == 2
+        
+        # Collaborator permissions changed in o/r
+        assert permissions.apply_webhook_event("member", {"action": "edited", "repository": {"full_name": "O/R"}}) == 1
+        assert await permissions.check_repository_access("o", "r", "token", user_id=1) is True
+        assert mock_get.call_count == 3
+        
+        assert permissions.apply_webhook_event("membership", {"action": "removed", "member": {"id": 1}}) == 2
+        assert permissions.apply_webhook_event("push", {"repository": {"full_name": "o/r"}}) == 0
+
+
+@pytest.mark.asyncio
+async def test_permission_levels_are_resolved_in_bulk_with_graphql():
+    """Test that bulk permission checks use chunked GraphQL queries and share the per-user cache"""
+    from backend.services import permissions
+    
+    def graphql_response(request_json):
+        variables = request_json["variables"]
+        data, errors = {}, []
+        for i in range(len(variables) // 2):
+            name = variables[f"n{i}"]
+            if name == "missing":
+                data[f"r{i}"] = None
+                errors.append({"type": "NOT_FOUND", "path": [f"r{i}"]})
+            else:
+                data[f"r{i}"] = {"viewerPermission": "WRITE" if name.startswith("w") else "READ"}
+        mock = Mock()
+        mock.status_code = 200
+        mock.raise_for_status = Mock()
+        mock.json.return_value = {"data": data, "errors": errors}
+        return mock
+    
+    repositories = [("o", f"w{i}") for i in range(3)] + [("o", "r0"), ("o", "missing")]
+    with patch.object(permissions, "BULK_CHUNK_SIZE", 2), \
+         patch("httpx.AsyncClient.post", new_callable=AsyncMock) as mock_post, \
+         patch("httpx.AsyncClient.get", new_callable=AsyncMock) as mock_get:
+        mock_post.side_effect = lambda url, **kwargs: graphql_response(kwargs["json"])
+        
+        levels = await permissions.get_permission_levels(repositories, "token", user_id=1)
+        assert levels == {("o", "w0"): "write", ("o", "w1"): "write", ("o", "w2"): "write",
+                          ("o", "r0"): "read", ("o", "missing"): None}
+        assert mock_post.call_count == 3
+        # Repository names are passed as variables, not in the query text
+        assert "w0" not in mock_post.call_args_list[0].kwargs["json"]["query"]
+        
+        # Single checks and repeated bulk checks are answered from the cache
+        assert await permissions.check_repository_access("O", "W1", "token", user_id=1) is True
+        assert await permissions.check_repository_access("o", "missing", "token", user_id=1) is False
+        assert await permissions.get_permission_levels(repositories[:2], "token", user_id=1) == {
+            ("o", "w0"): "write", ("o", "w1"): "write"
+        }
+        assert mock_post.call_count == 3
+        mock_get.assert_not_called()
+    
+    # Failed queries are not cached
+    with patch("httpx.AsyncClient.post", new_callable=AsyncMock, side_effect=Exception("down")):
+        assert await permissions.get_permission_levels([("o", "other")], "token", user_id=1) == {("o", "other"): None}
+    assert ("id:1", "o", "other") not in permissions._levels
+
+
+@pytest.mark.asyncio
+async def test_team_rules_use_roster_snapshots_updated_by_webhooks():
+    """Test that team rules are checked against loaded rosters and membership webhooks update them"""
+    from backend.services import team_rules
+    
+    team_rules.set_rules([
+        {"repository": "org/infra", "workflow": "deploy-*.yml", "teams": ["release", "other-org/sre"]},
+        {"repository": "org/*", "workflow": "deploy-*.yml", "teams": ["admins"]},
+    ])
+    assert team_rules.referenced_teams() == ["org/admins", "org/release", "other-org/sre"]
+    
+    def members_response(logins):
+        mock = Mock()
+        mock.status_code = 200
+        mock.raise_for_status = Mock()
+        mock.json.return_value = [{"login": login} for login in logins]
+        return mock
+    
+    rosters = {"org/admins": ["Boss"], "org/release": ["Alice"], "other-org/sre": []}
+    with patch("backend.services.team_rules.get_auth_token", new_callable=AsyncMock, return_value="app-token"), \
+         patch("httpx.AsyncClient.get", new_callable=AsyncMock) as mock_get:
+        mock_get.side_effect = lambda url, **kwargs: members_response(
+            rosters["/".join(url.split("/")[4:7:2])]
+        )
+        # Rosters are not loaded yet: protected workflows are denied
+        assert team_rules.is_allowed("alice", "org", "infra", "deploy-prod.yml") is False
+        assert await team_rules.refresh_rosters() == 3
+    
+    assert team_rules.is_allowed("alice", "org", "infra", "deploy-prod.yml") is True
+    assert team_rules.is_allowed("ALICE", "Org", "Infra", ".github/workflows/deploy-prod.yml") is True
+    # The first matching rule applies
+    assert team_rules.is_allowed("boss", "org", "infra", "deploy-prod.yml") is False
+    assert team_rules.is_allowed("boss", "org", "web", "deploy-prod.yml") is True
+    # Workflows without rules are not restricted
+    assert team_rules.is_allowed("bob", "org", "infra", "ci.yml") is True
+    assert "org/release" in team_rules.denial_message("bob", "org", "infra", "deploy-prod.yml")
+    
+    organization = {"login": "org"}
+    assert team_rules.apply_webhook_event("membership", {
+        "action": "added", "scope": "team", "member": {"login": "Bob"}, "team": {"slug": "release"}, "organization": organization
+    }) == 1
+    assert team_rules.is_allowed("bob", "org", "infra", "deploy-prod.yml") is True
+    assert team_rules.apply_webhook_event("organization", {
+        "action": "member_removed", "membership": {"user": {"login": "alice"}}, "organization": organization
+    }) == 1
+    assert team_rules.is_allowed("alice", "org", "infra", "deploy-prod.yml") is False
+    # Teams not used by the rules are not tracked
+    assert team_rules.apply_webhook_event("membership", {
+        "action": "added", "member": {"login": "eve"}, "team": {"slug": "random"}, "organization": organization
+    }) == 0
+    
+    with pytest.raises(ValueError):
+        team_rules.set_rules([{"repository": "org/infra"}])
+
+
+@pytest.mark.asyncio
+async def test_user_info_is_cached_by_token():
+    """Test that user info is fetched once per token and dropped on logout"""
+    from backend.services import github_oauth
+    
+    response = Mock()
+    response.status_code = 200
+    response.json.return_value = {"login": "alice", "id": 1}
+    with patch("httpx.AsyncClient.get", new_callable=AsyncMock, return_value=response) as mock_get:
+        assert (await github_oauth.get_user_info("token-a"))["login"] == "alice"
+        assert (await github_oauth.get_user_info("token-a"))["login"] == "alice"
+        assert mock_get.call_count == 1
+        
+        github_oauth.forget_token("token-a")
+        await github_oauth.get_user_info("token-a")
+        await github_oauth.get_user_info("token-b")
+        assert mock_get.call_count == 3
+
+
+@pytest.mark.asyncio
+async def test_prewarm_for_redirect_loads_target_repository_caches():
+    """Test that caches of the repository from the redirect URL are loaded in the background"""
+    from backend.services import prewarm
+    
+    assert prewarm.prewarm_for_redirect("/", "token") is None
+    
+    with patch("config.CHECK_PERMISSIONS", True), \
+         patch("config.OPTIMISTIC_DISPATCH", False), \
+         patch("config.USE_USER_TOKEN_FOR_WORKFLOWS", True), \
+         patch("backend.services.prewarm.get_workflows", new_callable=AsyncMock) as mock_workflows, \
+         patch("backend.services.prewarm.get_branches", new_callable=AsyncMock, side_effect=Exception("down")) as mock_branches, \
+         patch("backend.services.prewarm.get_workflow_info", new_callable=AsyncMock) as mock_info, \
+         patch("backend.services.prewarm.get_permission_level", new_callable=AsyncMock) as mock_permission, \
+         patch("backend.services.prewarm.prefetch_auth_token", new_callable=AsyncMock) as mock_token:
+        task = prewarm.prewarm_for_redirect("/workflow/trigger?owner=o&repo=r&workflow_id=ci.yml&ref=main", "token", 7)
+        await task
+        
+        mock_workflows.assert_awaited_once_with("o", "r")
+        mock_branches.assert_awaited_once_with("o", "r")
+        mock_info.assert_awaited_once_with("o", "r", "ci.yml")
+        mock_permission.assert_awaited_once_with("o", "r", "token", 7)
+        # Workflows are dispatched with the user's token: nothing to mint
+        mock_token.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_github_calls_and_cache_are_counted_in_metrics():
+    """Test that GitHub responses are counted by endpoint class with rate limits per token type, and cache lookups by namespace"""
+    from backend.services import metrics, cache, github_client
+    
+    metrics.reset()
+    request = httpx.Request(
+        "POST", "https://api.github.com/repos/o/r/actions/workflows/ci.yml/dispatches",
+        headers={"Authorization": "token ghs_secret"}
+    )
+    request.extensions["started_at"] = 0
+    response = httpx.Response(
+        204, request=request,
+        headers={"x-ratelimit-remaining": "4321", "x-ratelimit-resource": "core"}
+    )
+    await github_client._on_response(response)
+    
+    assert metrics.get("github_requests_total", endpoint="workflow_dispatch", method="POST", status=204) == 1
+    assert metrics.get("github_request_duration_seconds", endpoint="workflow_dispatch") == 1
+    assert metrics.get("github_rate_limit_remaining", token_type="installation", resource="core") == 4321
+    assert github_client.endpoint_class(httpx.URL("https://api.github.com/repos/o/r/actions/workflows/ci.yml/runs")) == "workflow_runs"
+    assert github_client.endpoint_class(httpx.URL("https://api.github.com/repos/o/r/branches")) == "branches"
+    assert github_client.token_type("Bearer a.b.c") == "app_jwt"
+    
+    cache.set("branches:o:r", ["main"], ttl=60)
+    cache.get("branches:o:r")
+    cache.get("branches:o:other")
+    cache.clear("branches:o:r")
+    assert metrics.get("cache_requests_total", namespace="branches", result="hit") == 1
+    assert metrics.get("cache_requests_total", namespace="branches", result="miss") == 1
+    assert metrics.get("cache_evictions_total", namespace="branches", reason="cleared") == 1
+    
+    text = metrics.render()
+    assert "# TYPE github_requests_total counter" in text
+    assert 'github_request_duration_seconds_bucket{endpoint="workflow_dispatch",le="+Inf"} 1' in text
+    # Tokens never end up in metrics
+    assert "ghs_secret" not in text
+
+
+@pytest.mark.asyncio
+async def test_cpu_bound_work_is_offloaded_and_app_jwt_reused():
+    """Test that the app JWT is signed in the thread pool once and reused, and a blocked event loop is detected"""
+    import asyncio
+    import time
+    from backend.services import metrics, github_app, loop_monitor
+    
+    metrics.reset()
+    with patch("backend.services.github_app.generate_jwt", return_value="jwt") as mock_sign:
+        assert await github_app.get_app_jwt("1", "key") == "jwt"
+        assert await github_app.get_app_jwt("1", "key") == "jwt"
+        assert mock_sign.call_count == 1
+    assert metrics.get("offload_tasks_total", kind="jwt") == 1
+    assert metrics.get("offload_run_seconds", kind="jwt") == 1
+    
+    await loop_monitor.start(0.01, 50)
+    try:
+        await asyncio.sleep(0.02)
+        # Блокирующий вызов прямо в event loop
+        time.sleep(0.1)
+        await asyncio.sleep(0.05)
+    finally:
+        await loop_monitor.stop()
+    assert metrics.get("event_loop_blocked_total") >= 1
+
+
+@pytest.mark.asyncio
+async def test_outbound_calls_are_limited_globally_and_per_token():
+    """Test that GitHub calls over the limits wait in a bounded queue and are rejected with 429/503 when it is full"""
+    import asyncio
+    from backend.services import outbound_limits
+    from backend.services.outbound_limits import OutboundSaturatedError
+    
+    with patch("config.OUTBOUND_MAX_CONCURRENCY", 3), \
+         patch("config.OUTBOUND_MAX_CONCURRENCY_PER_TOKEN", 2), \
+         patch("config.OUTBOUND_QUEUE_SIZE", 1), \
+         patch("config.OUTBOUND_MAX_WAIT", 5):
+        await outbound_limits.acquire("a")
+        await outbound_limits.acquire("a")
+        
+        # Лимит токена занят: третий вызов ждет, четвертый не помещается в очередь - 429
+        waiting = asyncio.create_task(outbound_limits.acquire("a"))
+        await asyncio.sleep(0)
+        assert outbound_limits.is_saturated()
+        with pytest.raises(OutboundSaturatedError) as exc_info:
+            await outbound_limits.acquire("a")
+        assert exc_info.value.status_code == 429
+        assert exc_info.value.retry_after == 5
+        
+        # Другой токен идет мимо очереди, пока есть общий слот; дальше - общий лимит (503)
+        await outbound_limits.acquire("b")
+        with pytest.raises(OutboundSaturatedError) as exc_info:
+            await outbound_limits.acquire("c")
+        assert exc_info.value.status_code == 503
+        
+        # Освободившийся слот токена передается ждущему вызову
+        outbound_limits.release("b")
+        assert not waiting.done()
+        outbound_limits.release("a")
+        await asyncio.wait_for(waiting, 1)
+        assert not outbound_limits.is_saturated()
+    
+    with patch("config.OUTBOUND_MAX_CONCURRENCY", 1), patch("config.OUTBOUND_MAX_WAIT", 0.01):
+        outbound_limits.clear()
+        await outbound_limits.acquire("a")
+        with pytest.raises(OutboundSaturatedError):
+            await outbound_limits.acquire("b")
+        assert outbound_limits._waiters == []